@@ -1,40 +1,190 @@
 import json
 import logging
 import os
-import threading
-from typing import Any
+import shutil
+import time
+from typing import Any, Dict, List, Optional
 
+import pandas as pd
 from fastapi import HTTPException
+from autogluon.core.callbacks import AbstractCallback
 from autogluon.tabular import TabularPredictor
 
-from AutoML.automl import AutoMLStrategy
-from sessions.utils import get_session_path, load_session_metadata, save_session_metadata
+from AutoML.automl import AutoMLStrategy, INFER_TIME_COLUMN, retrain_hyperparameters, select_within_inference_budget
+from AutoML.predictor_cache import predictor_cache, _dir_size_bytes
+from sessions.utils import get_session_path, update_session_metadata
+from training.cancellation import stop_requested
+from training.events import AutoGluonLogHandler, emit_event
+
+# Размер батча по умолчанию для замера времени прогноза одной строки (как infer_limit_batch_size в AutoGluon)
+INFER_LIMIT_BATCH_SIZE = 10000
+# Папка облегчённой копии предиктора для прогноза (optimize_for_deployment)
+SERVING_DIR_NAME = 'autogluon_serving'
+# Сколько лучших конфигураций моделей обучается при retrain_from_session, если retrain_top_k не задан
+RETRAIN_TOP_K = 3
+# Класс модели AutoGluon -> ключ hyperparameters в fit (для повторного обучения лучших конфигураций)
+AG_MODEL_KEYS = {
+    'LGBModel': 'GBM',
+    'CatBoostModel': 'CAT',
+    'XGBoostModel': 'XGB',
+    'RFModel': 'RF',
+    'XTModel': 'XT',
+    'KNNModel': 'KNN',
+    'LinearModel': 'LR',
+    'TabularNeuralNetTorchModel': 'NN_TORCH',
+    'NNFastAiTabularModel': 'FASTAI',
+}
+
+
+class StopRequestedCallback(AbstractCallback):
+    """Останавливает fit перед следующей моделью, если отмену запросили с сохранением обученных моделей."""
+
+    def _before_model_fit(self, trainer, model, time_limit=None, stack_name="core", level=1):
+        if stop_requested():
+            logging.info(f"[StopRequestedCallback] Обучение остановлено по запросу перед моделью {model.name}")
+            return True, True
+        return False, False
 
-# Глобальный семафор для ограничения числа одновременных обучений AutoGluon
-autogluon_train_semaphore = threading.Semaphore(12)
 
 class AutoGluonStrategy(AutoMLStrategy):
     name = 'autogluon'
 
-    def train(self, df_train: Any, training_params: Any, session_id: str):
+    @staticmethod
+    def serving_model_path(session_id: str) -> str:
+        """Папка модели для прогноза: облегчённая копия, если она сохранена, иначе полный предиктор."""
+        session_path = get_session_path(session_id)
+        serving_path = os.path.join(session_path, SERVING_DIR_NAME)
+        if os.path.exists(os.path.join(serving_path, 'predictor.pkl')):
+            return serving_path
+        return os.path.join(session_path, 'autogluon')
+
+    @staticmethod
+    def _measure_inference_speed(predictor: Any, leaderboard: Any, sample: Any) -> Any:
+        """Замеряет время прогноза одной строки каждой моделью лидерборда на батче sample (включая базовые модели стека)."""
+        per_row_ms = []
+        for model in leaderboard["model"]:
+            try:
+                predictor.predict(sample.head(1), model=model)  # прогрев: загрузка модели с диска
+                started = time.perf_counter()
+                predictor.predict(sample, model=model)
+                per_row_ms.append((time.perf_counter() - started) * 1000 / len(sample))
+            except Exception as e:
+                logging.warning(f"[AutoGluonStrategy] Не удалось замерить скорость прогноза модели {model}: {e}")
+                per_row_ms.append(None)
+        leaderboard[INFER_TIME_COLUMN] = per_row_ms
+        leaderboard["infer_rows_per_second"] = [round(1000 / ms) if ms else None for ms in per_row_ms]
+        return leaderboard
+
+    @staticmethod
+    def _export_for_deployment(predictor: Any, serving_path: str) -> Dict[str, Any]:
+        """
+        Облегчённая копия предиктора для прогноза: в копии лучшая модель переобучается на всех данных (refit_full)
+        без бэггинга по фолдам, остаются только она и её зависимости (delete_models),
+        вспомогательные файлы обучения удаляются (save_space). Полный предиктор не меняется:
+        refit выполняется на копии, поэтому в нём не появляются модели _FULL и не меняется model_best.
+        """
+        source_model = predictor.model_best
+        full_models = predictor.model_names()
+        shutil.rmtree(serving_path, ignore_errors=True)
+        serving = predictor.clone(path=serving_path, return_clone=True)
+        refit_map = serving.refit_full(model=source_model, set_best_to_refit_full=False)
+        serving_model = refit_map.get(source_model, source_model)
+        serving.set_model_best(serving_model, save_trainer=True)
+        serving.delete_models(models_to_keep=serving_model, dry_run=False)
+        serving.save_space()
+        serving.save()
+        if predictor.model_best != source_model or predictor.model_names() != full_models:
+            raise RuntimeError("Подготовка облегчённой модели изменила полный предиктор")
+        full_size = _dir_size_bytes(predictor.path)
+        serving_size = _dir_size_bytes(serving_path)
+        logging.info(
+            f"[AutoGluonStrategy] Облегчённая модель {serving_model} сохранена: {serving_path} "
+            f"({full_size / 1024 / 1024:.1f} MB -> {serving_size / 1024 / 1024:.1f} MB)"
+        )
+        return {
+            "path": serving_path,
+            "model": serving_model,
+            "source_model": source_model,
+            "models": serving.model_names(),
+            "size_mb": round(serving_size / 1024 / 1024, 1),
+            "full_size_mb": round(full_size / 1024 / 1024, 1),
+        }
+
+    @staticmethod
+    def _collect_model_configs(predictor: Any, leaderboard: Any) -> List[Dict[str, Any]]:
+        """
+        Конфигурации базовых моделей (первый уровень стека) в порядке лидерборда: тип модели, ключ AutoGluon
+        и заданные гиперпараметры. Сохраняются в model_metadata.json для retrain_from_session.
+        """
+        if 'stack_level' in leaderboard.columns:
+            leaderboard = leaderboard[leaderboard['stack_level'] == 1]
+        configs = []
+        for model_name in leaderboard['model']:
+            try:
+                info = predictor._trainer.load_model(model_name).get_info(include_feature_metadata=False)
+            except Exception as e:
+                logging.warning(f"[AutoGluonStrategy] Не удалось прочитать конфигурацию модели {model_name}: {e}")
+                continue
+            bagged_info = info.get('bagged_info')
+            model_type = bagged_info['child_model_type'] if bagged_info else info['model_type']
+            ag_key = AG_MODEL_KEYS.get(model_type)
+            if ag_key is None:
+                # Ансамбли и типы моделей, которые не задаются через hyperparameters
+                continue
+            hyperparameters = bagged_info['child_hyperparameters_user'] if bagged_info else info['hyperparameters_user']
+            configs.append({
+                'model': model_name,
+                'model_type': model_type,
+                'ag_key': ag_key,
+                'hyperparameters': json.loads(json.dumps(hyperparameters, default=str)),
+            })
+        return configs
+
+    @classmethod
+    def _retrain_hyperparameters(cls, source_session_id: str, top_k: int) -> Dict[str, List[Dict[str, Any]]]:
+        """hyperparameters с top_k лучшими конфигурациями моделей сессии source_session_id."""
+        source_path = os.path.join(get_session_path(source_session_id), 'autogluon')
+        with open(os.path.join(source_path, 'model_metadata.json'), encoding='utf-8') as f:
+            source_metadata = json.load(f)
+        model_configs = source_metadata.get('model_configs')
+        if model_configs is None:
+            # Сессии, обученные до появления model_configs: конфигурации читаются из сохранённого предиктора
+            predictor = TabularPredictor.load(source_path)
+            model_configs = cls._collect_model_configs(predictor, predictor.leaderboard(display=False))
+        hyperparams = retrain_hyperparameters(model_configs, source_metadata.get('WeightedEnsemble_L2_weights'), top_k)
+        if not hyperparams:
+            raise ValueError(f"В сессии {source_session_id} нет конфигураций моделей для повторного обучения")
+        return hyperparams
+
+    def train(self, df_train: Any, training_params: Any, session_id: str, resources: Optional[Dict[str, Any]] = None):
         """
         Обучение табличной модели AutoGluon TabularPredictor.
         df_train: pd.DataFrame
         training_params: TrainingParameters (должен содержать label, problem_type, eval_metric, presets, time_limit, models_to_train)
         session_id: str
+        resources: бюджет ресурсов процесса обучения (num_cpus, num_gpus, memory_limit), передаётся в predictor.fit
         """
         session_path = get_session_path(session_id)
         model_path = os.path.join(session_path, 'autogluon')
-        os.makedirs(model_path, exist_ok=True)
         label = getattr(training_params, 'target_column', None)
         problem_type = getattr(training_params, 'problem_type', None)
         eval_metric = getattr(training_params, 'evaluation_metric', None)
         presets = getattr(training_params, 'autogluon_preset', 'medium_quality')
         time_limit = getattr(training_params, 'training_time_limit', None)
         models_to_train = getattr(training_params, 'models_to_train', None)
+        infer_limit_ms = getattr(training_params, 'inference_time_limit_ms', None)
+        infer_batch_size = getattr(training_params, 'inference_batch_size', None) or INFER_LIMIT_BATCH_SIZE
+        retrain_from_session = getattr(training_params, 'retrain_from_session', None)
+        fit_kwargs: Dict[str, Any] = {}
 
         # Готовим hyperparameters
-        if (
+        if retrain_from_session:
+            # Быстрое повторное обучение: только лучшие конфигурации прошлой сессии, без перебора и стекинга
+            top_k = getattr(training_params, 'retrain_top_k', None) or RETRAIN_TOP_K
+            hyperparams = self._retrain_hyperparameters(retrain_from_session, top_k)
+            fit_kwargs['num_stack_levels'] = 0
+            logging.info(f"[AutoGluonStrategy] Повторное обучение по конфигурациям сессии {retrain_from_session}: {hyperparams}")
+        elif (
             not models_to_train or
             (isinstance(models_to_train, list) and (len(models_to_train) == 0 or '*' in models_to_train or 'all' in models_to_train)) or
             (isinstance(models_to_train, str) and models_to_train.strip() in ('*', 'all'))
@@ -43,7 +193,15 @@ class AutoGluonStrategy(AutoMLStrategy):
         else:
             hyperparams = {m: {} for m in models_to_train}
 
-        autogluon_train_semaphore.acquire()
+        # Старая модель в этой папке будет перезаписана — убираем её из кэша вместе со старой облегчённой копией.
+        # Папка удаляется целиком: её файлы могут быть жёсткими ссылками сессий из кэша результатов обучения,
+        # и запись AutoGluon поверх них испортила бы модели тех сессий
+        serving_path = os.path.join(session_path, SERVING_DIR_NAME)
+        predictor_cache.invalidate(model_path)
+        predictor_cache.invalidate(serving_path)
+        shutil.rmtree(serving_path, ignore_errors=True)
+        shutil.rmtree(model_path, ignore_errors=True)
+        os.makedirs(model_path, exist_ok=True)
         try:
             logging.info(f"[AutoGluonStrategy] Старт обучения TabularPredictor для session_id={session_id}")
             predictor = TabularPredictor(
@@ -52,12 +210,43 @@ class AutoGluonStrategy(AutoMLStrategy):
                 eval_metric=eval_metric if eval_metric != 'auto' else None,
                 path=model_path
             )
-            predictor.fit(
-                train_data=df_train,
+            # События о старте/завершении каждой модели — из лога AutoGluon (SSE /training_status_stream)
+            log_handler = AutoGluonLogHandler(session_id, time_limit)
+            ag_logger = logging.getLogger("autogluon")
+            ag_logger.addHandler(log_handler)
+            emit_event(
+                session_id,
+                "fit_started",
+                strategy=self.name,
+                time_limit=time_limit,
+                rows=len(df_train),
+                retrain_from_session=retrain_from_session,
+            )
+            try:
+                predictor.fit(
+                    train_data=df_train,
+                    time_limit=time_limit,
+                    presets=presets,
+                    hyperparameters=hyperparams,
+                    dynamic_stacking=False,
+                    callbacks=[StopRequestedCallback()],
+                    # Бюджет времени прогноза: AutoGluon отбрасывает и упрощает модели, не укладывающиеся в него
+                    infer_limit=infer_limit_ms / 1000 if infer_limit_ms else None,
+                    infer_limit_batch_size=infer_batch_size if infer_limit_ms else None,
+                    **fit_kwargs,
+                    **(resources or {})
+                )
+            finally:
+                ag_logger.removeHandler(log_handler)
+            emit_event(
+                session_id,
+                "fit_finished",
+                strategy=self.name,
+                models_finished=log_handler.models_finished,
+                elapsed_seconds=round(time.monotonic() - log_handler.started, 1),
                 time_limit=time_limit,
-                presets=presets,
-                hyperparameters=hyperparams,
-                dynamic_stacking=False
+                best_model=predictor.model_best,
+                stopped_early=stop_requested(),
             )
             # Сохраняем leaderboard
             leaderboard = predictor.leaderboard(display=False)
@@ -66,6 +255,26 @@ class AutoGluonStrategy(AutoMLStrategy):
             metric_cols = [col for col in leaderboard.columns if col.startswith('score')]
             if metric_cols:
                 leaderboard = leaderboard.dropna(subset=metric_cols, how='all')
+            if infer_limit_ms:
+                # Замер прогноза каждой модели недешёв — только когда задан бюджет времени прогноза
+                sample = df_train.drop(columns=[label]).head(infer_batch_size)
+                leaderboard = self._measure_inference_speed(predictor, leaderboard, sample)
+                if leaderboard[INFER_TIME_COLUMN].isna().all():
+                    # Без замеров выбор по бюджету невозможен: остаётся лучшая модель AutoGluon
+                    logging.warning(
+                        f"[AutoGluonStrategy] Скорость прогноза не замерена ни для одной модели, "
+                        f"лучшей остаётся {predictor.model_best}"
+                    )
+                else:
+                    best_row = select_within_inference_budget(leaderboard, infer_limit_ms)
+                    if best_row["model"] != predictor.model_best:
+                        infer_ms = best_row[INFER_TIME_COLUMN]
+                        infer_ms_text = f"{infer_ms:.3f}" if pd.notna(infer_ms) else "нет замера"
+                        logging.info(
+                            f"[AutoGluonStrategy] Лучшая модель в бюджете {infer_limit_ms} мс/строку: {best_row['model']} "
+                            f"({infer_ms_text} мс/строку) вместо {predictor.model_best}"
+                        )
+                        predictor.set_model_best(best_row["model"], save_trainer=True)
             leaderboard.to_csv(leaderboard_path, index=False)
             logging.info(f"[train_model] Лидерборд сохранён: {leaderboard_path}")
 
@@ -87,21 +296,25 @@ class AutoGluonStrategy(AutoMLStrategy):
                 except Exception as e:
                     logging.warning(f"[train_model] Не удалось получить веса WeightedEnsemble_L2: {e}")
 
+            # Конфигурации моделей для быстрого повторного обучения на новых данных (retrain_from_session)
+            model_metadata["model_configs"] = self._collect_model_configs(predictor, leaderboard)
+
+            # Артефакт для прогноза: облегчённая копия или полный предиктор
+            model_metadata["serving_artifact"] = {"path": model_path, "model": predictor.model_best}
+            if getattr(training_params, 'optimize_for_deployment', False):
+                try:
+                    model_metadata["serving_artifact"] = self._export_for_deployment(predictor, serving_path)
+                except Exception as e:
+                    shutil.rmtree(serving_path, ignore_errors=True)
+                    logging.warning(f"[AutoGluonStrategy] Не удалось подготовить облегчённую модель, прогноз будет на полной: {e}")
+
             with open(os.path.join(model_path, "model_metadata.json"), "w", encoding="utf-8") as f:
                 json.dump(model_metadata, f, indent=2)
 
             logging.info(f"[train_model] Метаданные модели сохранены.")
             # Сохраняем fit_summary
             fit_summary = predictor.fit_summary()
-            # Сохраняем feature importance
-            try:
-                fi = predictor.feature_importance(df_train)
-                if 'feature' not in fi.columns:
-                    fi.insert(0, 'feature', fi.index)
-                fi_path = os.path.join(model_path, 'feature_importance.csv')
-                fi.to_csv(fi_path, index=False)
-            except Exception as e:
-                logging.warning(f"[AutoGluonStrategy] Не удалось сохранить feature importance: {e}")
+            # Feature importance считается отдельным заданием очереди после обучения (compute_feature_importance)
             # Преобразуем все DataFrame в fit_summary в dict
             def convert_df(obj):
                 if isinstance(obj, dict):
@@ -119,22 +332,50 @@ class AutoGluonStrategy(AutoMLStrategy):
             with open(os.path.join(model_path, 'fit_summary.json'), 'w', encoding='utf-8') as f:
                 json.dump(fit_summary_serializable, f, ensure_ascii=False, indent=2)
             # Сохраняем статус
-            meta = load_session_metadata(session_id)
-            if meta is not None:
-                meta['status'] = 'completed'
-                meta['model_path'] = model_path
-                save_session_metadata(session_id, meta)
+            update_session_metadata(session_id, {
+                'status': 'completed',
+                'model_path': model_path,
+                'serving_model_path': model_metadata["serving_artifact"]["path"],
+                # Отмена с keep_best: модели, обученные до остановки, доступны для прогноза
+                'stopped_early': stop_requested(),
+            })
             logging.info(f"[AutoGluonStrategy] Обучение завершено для session_id={session_id}")
         except Exception as e:
             logging.error(f"[AutoGluonStrategy] Ошибка обучения: {e}", exc_info=True)
-            meta = load_session_metadata(session_id)
-            if meta is not None:
-                meta['status'] = 'failed'
-                meta['error'] = str(e)
-                save_session_metadata(session_id, meta)
+            update_session_metadata(session_id, {'status': 'failed', 'error': str(e)})
             raise
         finally:
-            autogluon_train_semaphore.release()
+            predictor_cache.invalidate(model_path)
+            predictor_cache.invalidate(serving_path)
+
+    def discard_artifacts(self, session_id: str) -> None:
+        session_path = get_session_path(session_id)
+        for dir_name in ('autogluon', SERVING_DIR_NAME):
+            path = os.path.join(session_path, dir_name)
+            predictor_cache.invalidate(path)
+            shutil.rmtree(path, ignore_errors=True)
+
+    def compute_feature_importance(self, df: Any, training_params: Any, session_id: str) -> None:
+        """
+        Permutation feature importance обученной модели на подвыборке обучающих данных
+        (feature_importance_subsample_size строк, feature_importance_num_shuffle_sets перестановок,
+        не дольше feature_importance_time_limit секунд). Результат — autogluon/feature_importance.csv.
+        """
+        model_path = os.path.join(get_session_path(session_id), 'autogluon')
+        predictor = TabularPredictor.load(model_path)
+        fi = predictor.feature_importance(
+            df,
+            subsample_size=getattr(training_params, 'feature_importance_subsample_size', None),
+            num_shuffle_sets=getattr(training_params, 'feature_importance_num_shuffle_sets', None),
+            time_limit=getattr(training_params, 'feature_importance_time_limit', None),
+        )
+        if 'feature' not in fi.columns:
+            fi.insert(0, 'feature', fi.index)
+        # Файл появляется целиком: /training_status не прочитает недописанный CSV
+        fi_path = os.path.join(model_path, 'feature_importance.csv')
+        fi.to_csv(fi_path + '.tmp', index=False)
+        os.replace(fi_path + '.tmp', fi_path)
+        logging.info(f"[AutoGluonStrategy] Feature importance сохранён: {fi_path}")
 
     def predict(self, df: Any, session_id: str, training_params: Any):
         """
@@ -143,14 +384,13 @@ class AutoGluonStrategy(AutoMLStrategy):
         session_id: str
         training_params: TrainingParameters (используется только для метаданных)
         """
-        session_path = get_session_path(session_id)
-        model_path = os.path.join(session_path, 'autogluon')
+        model_path = self.serving_model_path(session_id)
         if not os.path.exists(model_path):
             logging.error(f"Папка с моделью не найдена: {model_path}")
             raise HTTPException(status_code=404, detail="Папка с моделью не найдена")
         try:
-            predictor = TabularPredictor.load(model_path)
-            logging.info(f"Модель TabularPredictor успешно загружена из {model_path}")
+            predictor = predictor_cache.get(model_path)
+            logging.info(f"Модель TabularPredictor получена из кэша предикторов: {model_path}")
         except Exception as e:
             logging.error(f"Ошибка загрузки модели: {e}")
             raise HTTPException(status_code=500, detail=f"Ошибка загрузки модели: {e}")
@@ -179,4 +419,33 @@ class AutoGluonStrategy(AutoMLStrategy):
             logging.error(f"Ошибка при прогнозировании: {e}")
             raise HTTPException(status_code=500, detail=f"Ошибка при прогнозировании: {e}")
 
+    def score(self, df: Any, session_id: str, training_params: Any):
+        """
+        Онлайн-скоринг небольшого батча строк тёплым предиктором, без записи на диск.
+        Возвращает (predictions: pd.Series, probabilities: pd.DataFrame | None).
+        """
+        model_path = self.serving_model_path(session_id)
+        if not os.path.exists(model_path):
+            raise HTTPException(status_code=404, detail="Папка с моделью не найдена")
+        try:
+            predictor = predictor_cache.get(model_path)
+        except Exception as e:
+            logging.error(f"[AutoGluonStrategy.score] Ошибка загрузки модели: {e}")
+            raise HTTPException(status_code=500, detail=f"Ошибка загрузки модели: {e}")
+        target_col = training_params.get('target_column') if isinstance(training_params, dict) else getattr(training_params, 'target_column', None)
+        if target_col and target_col in df.columns:
+            df = df.drop(columns=[target_col])
+        try:
+            if predictor.can_predict_proba:
+                # Одна проходка по моделям: классы получаем из вероятностей
+                proba = predictor.predict_proba(df)
+                preds = predictor.predict_from_proba(proba)
+            else:
+                proba = None
+                preds = predictor.predict(df)
+            return preds, proba
+        except Exception as e:
+            logging.error(f"[AutoGluonStrategy.score] Ошибка при скоринге: {e}")
+            raise HTTPException(status_code=500, detail=f"Ошибка при скоринге: {e}")
+
 autogluon_strategy = AutoGluonStrategy()
\ No newline at end of file
@@ -1,12 +1,56 @@
 from abc import ABC, abstractmethod
+import json
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 
 from sessions.utils import get_session_path
 from training.model import TrainingParameters
 
+# Колонка лидерборда с измеренным временем прогноза одной строки (мс)
+INFER_TIME_COLUMN = "infer_time_per_row_ms"
+
+
+def select_within_inference_budget(leaderboard: pd.DataFrame, infer_limit_ms: Optional[float]) -> pd.Series:
+    """
+    Строка лидерборда (отсортированного по качеству) с лучшей моделью, укладывающейся в бюджет
+    времени прогноза одной строки. Если в бюджет не укладывается ни одна модель — самая быстрая.
+    Без бюджета или без замеров — первая строка.
+    """
+    if not infer_limit_ms or INFER_TIME_COLUMN not in leaderboard.columns or leaderboard[INFER_TIME_COLUMN].isna().all():
+        return leaderboard.iloc[0]
+    within_budget = leaderboard[leaderboard[INFER_TIME_COLUMN] <= infer_limit_ms]
+    if not within_budget.empty:
+        return within_budget.iloc[0]
+    return leaderboard.loc[leaderboard[INFER_TIME_COLUMN].idxmin()]
+
+
+def retrain_hyperparameters(
+    model_configs: List[Dict[str, Any]],
+    ensemble_weights: Optional[Dict[str, float]],
+    top_k: int,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    hyperparameters для быстрого повторного обучения: top_k конфигураций моделей прошлой сессии
+    (model_configs — в порядке лидерборда). Сначала модели с наибольшим весом в ансамбле,
+    затем остальные по качеству; одинаковые конфигурации не повторяются.
+    """
+    weights = ensemble_weights or {}
+    order = sorted(range(len(model_configs)), key=lambda i: (-weights.get(model_configs[i]["model"], 0.0), i))
+    hyperparameters: Dict[str, List[Dict[str, Any]]] = {}
+    seen = set()
+    for i in order:
+        if len(seen) >= top_k:
+            break
+        config = model_configs[i]
+        key = json.dumps([config["ag_key"], config["hyperparameters"]], sort_keys=True, default=str)
+        if key in seen:
+            continue
+        seen.add(key)
+        hyperparameters.setdefault(config["ag_key"], []).append(config["hyperparameters"])
+    return hyperparameters
+
 class AutoMLStrategy(ABC):
     """Abstract base class for AutoML strategies."""
 
@@ -16,10 +60,26 @@ class AutoMLStrategy(ABC):
         ts_df: Any, # Prepared TimeSeriesDataFrame (AutoGluon) or pd.DataFrame (PyCaret)
         training_params: TrainingParameters,
         session_id: str, # For logging/status updates
+        resources: Optional[Dict[str, Any]] = None, # CPU/GPU/memory budget of the training process
     ) -> Dict[str, Any]: # Returns metadata like leaderboard path, best score for this strategy
         """Trains the model using the specific AutoML library."""
         pass
 
+    @abstractmethod
+    def compute_feature_importance(
+        self,
+        df: pd.DataFrame, # Training frame after the same preprocessing as in train()
+        training_params: TrainingParameters,
+        session_id: str
+    ) -> None:
+        """Computes feature importance of the trained model (deferred post-training job)."""
+        pass
+
+    @abstractmethod
+    def discard_artifacts(self, session_id: str) -> None:
+        """Removes partially trained model files of a cancelled training."""
+        pass
+
     @abstractmethod
     def predict(
         self,
@@ -30,4 +90,14 @@ class AutoMLStrategy(ABC):
         """Makes predictions using a trained model."""
         pass
 
+    @abstractmethod
+    def score(
+        self,
+        df: pd.DataFrame,
+        session_id: str,
+        training_params: TrainingParameters
+    ) -> Tuple[pd.Series, Optional[pd.DataFrame]]: # Returns predictions and class probabilities (None for regression)
+        """Scores a small batch of rows with a warm model, without touching the disk."""
+        pass
+
 
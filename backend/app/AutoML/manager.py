@@ -2,7 +2,8 @@ import os
 import logging
 
 import pandas as pd
-from sessions.utils import get_session_path
+from sessions.utils import get_session_path, load_session_metadata
+from AutoML.automl import INFER_TIME_COLUMN, select_within_inference_budget
 from AutoML.autogluon_strategy import autogluon_strategy
 
 class AutoMLManager:
@@ -16,7 +17,10 @@ class AutoMLManager:
             if os.path.exists(file_path):
                 df = pd.read_csv(file_path)
                 df["strategy"] = strategy
-                dfs.append(df[["model", "score_val", "strategy"]])
+                columns = ["model", "score_val", "strategy"]
+                if INFER_TIME_COLUMN in df.columns:
+                    columns.append(INFER_TIME_COLUMN)
+                dfs.append(df[columns])
             else:
                 pass
 
@@ -27,11 +31,23 @@ class AutoMLManager:
         else:
             return pd.DataFrame(columns=["model", "score_val", "strategy"])
         
+    # {session_id: (mtime leaderboard.csv, имя стратегии)} — чтобы онлайн-скоринг не читал CSV на каждый запрос
+    _best_strategy_cache = {}
+
     def get_best_strategy(self, session_id):
         session_path = get_session_path(session_id)
         leaderboard_path = os.path.join(session_path, "leaderboard.csv")
-        leaderboard = pd.read_csv(leaderboard_path)
-        best_strategy = leaderboard.iloc[0]["strategy"]
+        mtime = os.path.getmtime(leaderboard_path)
+        cached = self._best_strategy_cache.get(session_id)
+        if cached is not None and cached[0] == mtime:
+            best_strategy = cached[1]
+        else:
+            leaderboard = pd.read_csv(leaderboard_path)
+            # Лучшая модель, укладывающаяся в бюджет времени прогноза сессии (если он задан)
+            params = (load_session_metadata(session_id) or {}).get("training_parameters") or {}
+            best_row = select_within_inference_budget(leaderboard, params.get("inference_time_limit_ms"))
+            best_strategy = best_row["strategy"]
+            self._best_strategy_cache[session_id] = (mtime, best_strategy)
         if best_strategy == 'autogluon':
             return autogluon_strategy
 
@@ -0,0 +1,123 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# Бюджет памяти кэша в мегабайтах (оценивается по размеру папки модели на диске)
+PREDICTOR_CACHE_MAX_MB = int(os.getenv("PREDICTOR_CACHE_MAX_MB", "4096"))
+
+
+def _dir_size_bytes(path: str) -> int:
+    """Суммарный размер файлов в папке модели — грубая оценка памяти загруженного предиктора."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for fname in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fname))
+            except OSError:
+                pass
+    return total
+
+
+def _model_version(path: str) -> Optional[float]:
+    """Время изменения predictor.pkl — меняется при переобучении модели в этой папке."""
+    try:
+        return os.path.getmtime(os.path.join(path, "predictor.pkl"))
+    except OSError:
+        return None
+
+
+def _load_tabular_predictor(path: str) -> Any:
+    from autogluon.tabular import TabularPredictor
+    return TabularPredictor.load(path)
+
+
+class PredictorCache:
+    """
+    Процессный LRU-кэш загруженных предикторов, ключ — путь к папке модели.
+    Вытесняет давно не использованные модели, когда суммарный размер превышает бюджет.
+    """
+
+    def __init__(self, max_bytes: int, loader: Callable[[str], Any] = _load_tabular_predictor):
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_path: str) -> Any:
+        """Возвращает предиктор из кэша или загружает его с диска."""
+        key = os.path.abspath(model_path)
+        version = _model_version(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["version"] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["predictor"]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Загружаем вне общего замка, чтобы не блокировать другие модели
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry["version"] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["predictor"]
+                self.misses += 1
+            predictor = self.loader(key)
+            size = _dir_size_bytes(key)
+            with self._lock:
+                self._entries.pop(key, None)
+                self._entries[key] = {"predictor": predictor, "size": size, "version": version}
+                self._evict()
+            logging.info(f"[PredictorCache] Модель загружена в кэш: {key} ({size / 1024 / 1024:.1f} MB)")
+            return predictor
+
+    def _evict(self) -> None:
+        # Последний добавленный элемент не вытесняем, даже если он один больше бюджета
+        while len(self._entries) > 1 and self.total_bytes() > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            self._load_locks.pop(key, None)
+            self.evictions += 1
+            logging.info(f"[PredictorCache] Модель вытеснена из кэша: {key}")
+
+    def total_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._entries.values())
+
+    def invalidate(self, path: str) -> int:
+        """Удаляет из кэша все модели, лежащие в path (папка модели или целой сессии)."""
+        prefix = os.path.abspath(path)
+        with self._lock:
+            keys = [k for k in self._entries if k == prefix or k.startswith(prefix + os.sep)]
+            for key in keys:
+                self._entries.pop(key, None)
+                self._load_locks.pop(key, None)
+        if keys:
+            logging.info(f"[PredictorCache] Инвалидировано моделей: {len(keys)} для {prefix}")
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._load_locks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size_mb": round(self.total_bytes() / 1024 / 1024, 2),
+                "max_size_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "models": list(self._entries.keys()),
+            }
+
+
+predictor_cache = PredictorCache(PREDICTOR_CACHE_MAX_MB * 1024 * 1024)
@@ -0,0 +1,76 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .settings import settings
+
+# Время жизни закэшированных метаданных каталога БД (секунды)
+DB_CATALOG_TTL_SECONDS = float(os.getenv("DB_CATALOG_TTL_SECONDS", "60"))
+
+
+class CatalogCache:
+    """
+    TTL-кэш метаданных каталога БД (списки таблиц, количества, колонки, первичные ключи) по пользователю.
+    Ключ: (пользователь, БД, вид метаданных, аргументы). Записи сбрасываются по TTL
+    или явно через invalidate() после изменения структуры БД (например, create_table_from_df).
+    """
+
+    # Виды метаданных, которые зависят от набора таблиц, а не от конкретной таблицы
+    LISTING_KINDS = ("tables_by_schema", "table_counts_by_schema")
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(username: str, kind: str, *args: Any) -> Tuple:
+        return (username, settings.DB_HOST, settings.DB_PORT, settings.DB_NAME, kind) + tuple(args)
+
+    async def get_or_load(self, username: str, kind: str, args: Tuple, loader: Callable[[], Awaitable[Any]], refresh: bool = False) -> Any:
+        """Значение из кэша или результат loader(), который кэшируется на ttl_seconds."""
+        key = self._key(username, kind, *args)
+        now = time.monotonic()
+        if not refresh and self.ttl_seconds > 0:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self.hits += 1
+                    return entry[1]
+        with self._lock:
+            self.misses += 1
+        value = await loader()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        return value
+
+    def invalidate(self, db_schema: Optional[str] = None, table_name: Optional[str] = None) -> None:
+        """
+        Сбрасывает списки таблиц всех пользователей и метаданные указанной таблицы
+        (без аргументов — весь кэш).
+        """
+        with self._lock:
+            if db_schema is None and table_name is None:
+                self._entries.clear()
+            else:
+                self._entries = {
+                    key: entry for key, entry in self._entries.items()
+                    if key[4] not in self.LISTING_KINDS and key[5:7] != (db_schema, table_name)
+                }
+        logging.info(f"[CatalogCache] Кэш каталога сброшен (таблица: {db_schema}.{table_name})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+catalog_cache = CatalogCache(DB_CATALOG_TTL_SECONDS)
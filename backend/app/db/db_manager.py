@@ -1,22 +1,67 @@
 import io
+import os
+import re
+import datetime
+import asyncio
+import time
+import uuid
+import logging
 import asyncpg
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 from contextlib import asynccontextmanager
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Union
 from functools import wraps
 from .settings import settings
+from .pool_manager import pool_manager
+from .catalog import catalog_cache
+
+try:
+    from src.data.type_optimization import detect_date_format
+except ImportError:  # пакет db импортирован как backend.app.db (tests/test_db_manager.py)
+    from ..src.data.type_optimization import detect_date_format
+
+# Размер куска кадра (строк), который превращается в записи COPY за один раз
+COPY_CHUNK_ROWS = int(os.getenv("DB_COPY_CHUNK_ROWS", "100000"))
+# Размер куска (строк) при потоковом чтении таблицы серверным курсором
+STREAM_BATCH_ROWS = int(os.getenv("DB_STREAM_BATCH_ROWS", "50000"))
+# Параллельная загрузка: число одновременных COPY, минимальный размер части и повторы упавшей части
+UPLOAD_WORKERS = int(os.getenv("DB_UPLOAD_WORKERS", "4"))
+UPLOAD_MIN_PARTITION_ROWS = int(os.getenv("DB_UPLOAD_MIN_PARTITION_ROWS", "100000"))
+UPLOAD_RETRIES = int(os.getenv("DB_UPLOAD_RETRIES", "2"))
+# Staging-таблицы параллельной загрузки: префикс имени (в имени — время создания) и возраст, после которого
+# таблица считается брошенной (процесс загрузки упал) и удаляется при следующей параллельной загрузке в схему
+STAGING_TABLE_PREFIX = "_stage_"
+STAGING_TABLE_MAX_AGE_SECONDS = float(os.getenv("DB_STAGING_TABLE_MAX_AGE_SECONDS", "21600"))
+_STAGING_TABLE_NAME = re.compile(r"^" + STAGING_TABLE_PREFIX + r"(\d+)_[0-9a-f]{32}$")
+
+
+def detect_date_formats(df: pd.DataFrame, known: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Optional[str]]:
+    """
+    Решения о датах для object-столбцов: {колонка: формат | "mixed" | None (не дата)}.
+    Колонки из known не проверяются повторно — решения сохраняются в метаданных сессии и переиспользуются.
+    """
+    decisions = dict(known or {})
+    for col in df.select_dtypes(include=['object']).columns:
+        if col not in decisions:
+            decisions[col] = detect_date_format(df[col])
+    return decisions
 
 
-def auto_convert_dates(df: pd.DataFrame) -> pd.DataFrame:
+def auto_convert_dates(df: pd.DataFrame, date_formats: Optional[Dict[str, Optional[str]]] = None) -> pd.DataFrame:
     """
-    Автоматически приводит все object-столбцы к datetime, если все не-null значения успешно преобразуются.
-    Всегда сохраняет как datetime (TIMESTAMP), не приводит к типу date.
-    Возвращает новый DataFrame (копия).
+    Автоматически приводит object-столбцы с датами к datetime (TIMESTAMP), если все не-null значения преобразуются.
+    Кандидаты выбираются по выборке (detect_date_formats) или по готовым решениям date_formats,
+    затем конвертируются целиком с явным форматом. Не приводит к типу date.
+    Возвращает новый DataFrame (исходный не изменяется).
     """
-    df = df.copy()
-    for col in df.select_dtypes(include=['object']).columns:
+    df = df.copy(deep=False)
+    for col, fmt in detect_date_formats(df, date_formats).items():
+        if fmt is None or col not in df.columns or df[col].dtype != object:
+            continue
         orig_notnull = df[col].notnull()
-        converted = pd.to_datetime(df[col], errors='coerce')
+        converted = pd.to_datetime(df[col], format=fmt, errors='coerce')
         if (converted.notna() | ~orig_notnull).all():
             df[col] = converted
     # Не преобразуем к date, всегда оставляем datetime64[ns]
@@ -27,19 +72,10 @@ def auto_convert_dates(df: pd.DataFrame) -> pd.DataFrame:
 async def get_connection(username: str, password: str):
     """
     Асинхронный контекстный менеджер для получения подключения к базе данных.
-    Гарантирует закрытие соединения после использования.
-    """
-    conn = await asyncpg.connect(
-        user=username,
-        password=password,
-        database=settings.DB_NAME,
-        host=settings.DB_HOST,
-        port=int(settings.DB_PORT)
-    )
-    try:
+    Соединение берётся из пула пользователя (см. pool_manager) и возвращается в него после использования.
+    """
+    async with pool_manager.acquire(username, password) as conn:
         yield conn
-    finally:
-        await conn.close()
 
 
 # --- Соответствие типов pandas -> PostgreSQL ---
@@ -70,6 +106,23 @@ PG_TO_PD_TYPE_MAP = {
     'char': 'object',
 }
 
+# --- Соответствие типов PostgreSQL -> Arrow (для потокового чтения; прочие типы выводятся по значениям) ---
+PG_TO_ARROW_TYPE_MAP = {
+    'int2': pa.int16(),
+    'int4': pa.int32(),
+    'int8': pa.int64(),
+    'float4': pa.float32(),
+    'float8': pa.float64(),
+    'numeric': pa.float64(),
+    'bool': pa.bool_(),
+    'text': pa.string(),
+    'varchar': pa.string(),
+    'bpchar': pa.string(),
+    'date': pa.date32(),
+    'timestamp': pa.timestamp('us'),
+    'timestamptz': pa.timestamp('us', tz='UTC'),
+}
+
 # --- Декоратор для режима только для чтения ---
 def read_only_guard(func):
     """
@@ -83,27 +136,166 @@ def read_only_guard(func):
     return wrapper
 
 
+def _to_arrow_array(values: tuple, arrow_type: Any) -> pa.Array:
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        pass
+    if arrow_type is not None:
+        try:
+            # Например, numeric (Decimal) -> float64
+            return pa.array(values).cast(arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            pass
+    # Типы без прямого соответствия в Arrow (json, uuid, смешанные значения) — строками
+    return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def _rows_to_record_batch(rows: list, names: List[str], arrow_types: List[Any]) -> pa.RecordBatch:
+    """Собирает Arrow RecordBatch из записей asyncpg по колонкам (без промежуточных dict)."""
+    arrays = [_to_arrow_array(values, arrow_type) for values, arrow_type in zip(zip(*rows), arrow_types)]
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+# Операторы условий отбора строк (download_filter): оператор условия -> шаблон SQL
+FILTER_OPERATORS = {
+    "=": "{column} = {value}",
+    "!=": "{column} <> {value}",
+    "<": "{column} < {value}",
+    "<=": "{column} <= {value}",
+    ">": "{column} > {value}",
+    ">=": "{column} >= {value}",
+    "in": "{column} = ANY({value})",
+    "not_in": "NOT ({column} = ANY({value}))",
+    "like": "{column}::text LIKE {value}",
+    "is_null": "{column} IS NULL",
+    "not_null": "{column} IS NOT NULL",
+}
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_filter_clause(filters: List[Dict[str, Any]], column_types: Dict[str, str]) -> Tuple[str, List[Any]]:
+    """
+    Собирает WHERE из структурированных условий {column, op, value} с параметрами $n.
+    Значения передаются текстом и приводятся в SQL к типу колонки (column_types — из каталога PostgreSQL),
+    поэтому одинаково работают числа, даты и строки. Колонки и операторы проверяются по белым спискам.
+    """
+    clauses = []
+    params: List[Any] = []
+    for condition in filters:
+        column, op, value = condition["column"], condition.get("op", "="), condition.get("value")
+        if column not in column_types:
+            raise ValueError(f"Колонка фильтра '{column}' не найдена в таблице")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Неподдерживаемый оператор фильтра: {op}")
+        placeholder = None
+        if op in ("in", "not_in"):
+            if not isinstance(value, list) or not value:
+                raise ValueError(f"Для оператора {op} нужен непустой список значений")
+            params.append([None if v is None else str(v) for v in value])
+            placeholder = f"${len(params)}::text[]::{column_types[column]}[]"
+        elif op == "like":
+            params.append(str(value))
+            placeholder = f"${len(params)}"
+        elif op not in ("is_null", "not_null"):
+            if value is None:
+                raise ValueError(f"Для оператора {op} нужно значение")
+            params.append(str(value))
+            placeholder = f"${len(params)}::text::{column_types[column]}"
+        clauses.append(FILTER_OPERATORS[op].format(column=_quote_ident(column), value=placeholder))
+    return " AND ".join(clauses), params
+
+
+async def _column_types(conn: asyncpg.Connection, db_schema: str, table_name: str) -> Dict[str, str]:
+    """Типы колонок таблицы в синтаксисе SQL (format_type), пригодные для приведения ::type."""
+    rows = await conn.fetch(
+        """
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod) AS type_name
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass($1) AND a.attnum > 0 AND NOT a.attisdropped
+        """,
+        f"{_quote_ident(db_schema)}.{_quote_ident(table_name)}",
+    )
+    return {row["attname"]: row["type_name"] for row in rows}
+
+
+async def stream_table_batches(
+    db_schema: str,
+    table_name: str,
+    username: str,
+    password: str,
+    batch_size: int = STREAM_BATCH_ROWS,
+    columns: Optional[List[str]] = None,
+    as_arrow: bool = False,
+    sample_percent: Optional[float] = None,
+    filters: Optional[List[Dict[str, Any]]] = None,
+) -> AsyncIterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """
+    Потоково читает таблицу серверным курсором и отдаёт её кусками по batch_size строк:
+    pandas DataFrame (по умолчанию) или Arrow RecordBatch (as_arrow=True).
+    Типы колонок берутся из описания запроса, поэтому у всех кусков одна схема.
+    В памяти одновременно находится только один кусок.
+    Проекция (columns), выборка строк (sample_percent, TABLESAMPLE BERNOULLI) и фильтр (filters —
+    условия {column, op, value}, значения передаются параметрами, см. build_filter_clause)
+    выполняются на стороне PostgreSQL; запрос идёт в транзакции только для чтения.
+    """
+    columns_sql = ', '.join([_quote_ident(col) for col in columns]) if columns else '*'
+    query = f'SELECT {columns_sql} FROM {_quote_ident(db_schema)}.{_quote_ident(table_name)}'
+    if sample_percent is not None:
+        if not (0 < sample_percent <= 100):
+            raise ValueError("Процент выборки строк должен быть в диапазоне (0, 100].")
+        if sample_percent < 100:
+            query += f' TABLESAMPLE BERNOULLI ({float(sample_percent)})'
+    params: List[Any] = []
+    async with get_connection(username, password) as conn:
+        if not await _table_exists(conn, db_schema, table_name):
+            raise ValueError(f"Таблица '{table_name}' не найдена или недоступна в схеме '{db_schema}'.")
+        if filters:
+            where, params = build_filter_clause(filters, await _column_types(conn, db_schema, table_name))
+            query += f' WHERE {where}'
+        # Серверный курсор в asyncpg живёт только внутри транзакции
+        async with conn.transaction(readonly=True):
+            stmt = await conn.prepare(query)
+            attributes = stmt.get_attributes()
+            names = [attr.name for attr in attributes]
+            arrow_types = [PG_TO_ARROW_TYPE_MAP.get(attr.type.name) for attr in attributes]
+            cursor = await stmt.cursor(*params)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                batch = _rows_to_record_batch(rows, names, arrow_types)
+                yield batch if as_arrow else batch.to_pandas(coerce_temporal_nanoseconds=True)
+
+
+async def _table_exists(conn: asyncpg.Connection, db_schema: str, table_name: str) -> bool:
+    check_query = """
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.tables
+            WHERE table_schema = $1 AND table_name = $2
+        )
+    """
+    return await conn.fetchval(check_query, db_schema, table_name)
+
+
 # --- Получение таблицы как DataFrame ---
 async def fetch_table_as_dataframe(table_name: str, username: str, password: str) -> pd.DataFrame:
     """
     Извлекает всю таблицу из базы данных и возвращает ее в виде pandas DataFrame.
+    Таблица читается кусками (stream_table_batches) и склеивается один раз в конце.
     """
-    async with get_connection(username, password) as conn:
-        # Проверяем существование таблицы
-        check_query = """
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = $1 AND table_name = $2
-            )
-        """
-        exists = await conn.fetchval(check_query, settings.SCHEMA, table_name)
-        if not exists:
-            raise Exception(f"Таблица '{table_name}' не найдена в схеме '{settings.SCHEMA}'")
-
-        # Формируем запрос для выбора всех данных из таблицы
-        query = f'SELECT * FROM "{settings.SCHEMA}"."{table_name}"'
-        rows = await conn.fetch(query)
-        return pd.DataFrame([dict(row) for row in rows]) if rows else pd.DataFrame()
+    try:
+        batches = [
+            batch async for batch in stream_table_batches(settings.SCHEMA, table_name, username, password, as_arrow=True)
+        ]
+    except ValueError:
+        raise Exception(f"Таблица '{table_name}' не найдена в схеме '{settings.SCHEMA}'")
+    if not batches:
+        return pd.DataFrame()
+    return pa.Table.from_batches(batches).to_pandas(coerce_temporal_nanoseconds=True)
 
 
 # --- Создание таблицы из DataFrame ---
@@ -172,12 +364,15 @@ async def create_table_from_df(df: pd.DataFrame, db_schema: str, table_name: str
         # Формируем запрос для создания таблицы
         create_query = f'CREATE TABLE "{db_schema}"."{table_name}" ({columns_sql}{pk_sql})'
         await conn.execute(create_query)
+    catalog_cache.invalidate(db_schema, table_name)
 
 
-async def _get_pk_columns(conn: asyncpg.Connection, db_schema: str, table_name: str) -> List[str]:
+async def _get_pk_columns(conn: asyncpg.Connection, db_schema: str, table_name: str, username: Optional[str] = None) -> List[str]:
     """
     Вспомогательная функция для получения списка столбцов первичного ключа
     для указанной таблицы из information_schema.
+    С username результат берётся из кэша каталога (catalog_cache). Ошибка запроса не превращается
+    в пустой список: иначе upsert на время TTL молча стал бы обычной вставкой.
     """
     query = """
         SELECT kcu.column_name
@@ -187,14 +382,75 @@ async def _get_pk_columns(conn: asyncpg.Connection, db_schema: str, table_name:
           AND tc.table_schema = kcu.table_schema
         WHERE tc.constraint_type = 'PRIMARY KEY'
           AND tc.table_schema = $1
-          AND tc.table_name = $2;
+          AND tc.table_name = $2
+        ORDER BY kcu.ordinal_position;
     """
-    try:
+
+    async def load() -> List[str]:
         pk_records = await conn.fetch(query, db_schema, table_name)
         return [record['column_name'] for record in pk_records]
-    except Exception as e:
-        return []
-    
+
+    if username is None:
+        return await load()
+    return await catalog_cache.get_or_load(username, "pk_columns", (db_schema, table_name), load)
+
+
+def _iter_db_records(df: pd.DataFrame, chunk_rows: int = COPY_CHUNK_ROWS):
+    """
+    Построчные кортежи для COPY, собранные по колонкам: NaN/NaT -> None, числа numpy -> типы Python,
+    datetime64 -> Timestamp (подкласс datetime). Кадр обрабатывается кусками по chunk_rows строк,
+    поэтому в памяти нет полной копии данных в виде объектов Python.
+    """
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        columns = [
+            chunk[col].astype(object).where(chunk[col].notna(), None).tolist()
+            for col in chunk.columns
+        ]
+        yield from zip(*columns)
+
+
+def _conflict_clause(columns: List[str], pk_columns: List[str]) -> str:
+    pk_columns_str = ', '.join([f'"{col}"' for col in pk_columns])
+    update_cols = [col for col in columns if col not in pk_columns]
+    if update_cols:
+        update_set_str = ', '.join([f'"{col}" = EXCLUDED."{col}"' for col in update_cols])
+        return f' ON CONFLICT ({pk_columns_str}) DO UPDATE SET {update_set_str}'
+    # Если все столбцы - часть PK, ничего не делаем при конфликте
+    return f' ON CONFLICT ({pk_columns_str}) DO NOTHING'
+
+
+async def _copy_df_to_table(
+    conn: asyncpg.Connection,
+    df: pd.DataFrame,
+    db_schema: str,
+    table_name: str,
+    pk_columns: List[str],
+) -> None:
+    """
+    Массовая загрузка через бинарный COPY. Без PK — COPY прямо в таблицу.
+    С PK — COPY во временную staging-таблицу и один INSERT ... SELECT ... ON CONFLICT в той же транзакции.
+    """
+    columns = [str(col) for col in df.columns]
+    async with conn.transaction():
+        if not pk_columns:
+            await conn.copy_records_to_table(
+                table_name, records=_iter_db_records(df), columns=columns, schema_name=db_schema
+            )
+            return
+        # Как и при построчном upsert, при повторе ключа в кадре побеждает последняя строка
+        df = df.drop_duplicates(subset=pk_columns, keep='last')
+        staging_table = f"_stage_{uuid.uuid4().hex}"
+        await conn.execute(
+            f'CREATE TEMP TABLE "{staging_table}" (LIKE "{db_schema}"."{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        await conn.copy_records_to_table(staging_table, records=_iter_db_records(df), columns=columns)
+        columns_str = ', '.join([f'"{col}"' for col in columns])
+        await conn.execute(
+            f'INSERT INTO "{db_schema}"."{table_name}" ({columns_str}) '
+            f'SELECT {columns_str} FROM "{staging_table}"' + _conflict_clause(columns, pk_columns)
+        )
+
 @read_only_guard
 async def upload_df_to_db(
     df: pd.DataFrame,
@@ -203,6 +459,7 @@ async def upload_df_to_db(
     username: str,
     password: str,
     update_on_pk: bool = True,
+    bulk: bool = True,
 ) -> bool:
     """
     Загружает pandas DataFrame в существующую таблицу в базе данных.
@@ -210,6 +467,9 @@ async def upload_df_to_db(
 
     Если update_on_pk=True, функция попытается автоматически определить
     первичный ключ таблицы и выполнить "upsert" (INSERT ON CONFLICT UPDATE).
+
+    bulk=True (по умолчанию) — загрузка бинарным COPY (через staging-таблицу для upsert),
+    bulk=False — построчный INSERT через executemany.
     """
     def convert_dates_for_db(val, dtype=None):
         import datetime
@@ -235,7 +495,7 @@ async def upload_df_to_db(
             pk_columns = []
             if update_on_pk:
                 # Получаем первичный ключ из БД
-                pk_columns = await _get_pk_columns(conn, db_schema, table_name)
+                pk_columns = await _get_pk_columns(conn, db_schema, table_name, username)
 
                 if not pk_columns:
                     # Если нет PK, просто делаем обычный insert без upsert
@@ -247,6 +507,16 @@ async def upload_df_to_db(
                         f"{missing_cols}, необходимые для update_on_pk."
                     )
 
+            if bulk:
+                started = time.perf_counter()
+                await _copy_df_to_table(conn, df, db_schema, table_name, pk_columns if update_on_pk else [])
+                elapsed = time.perf_counter() - started
+                logging.info(
+                    f"[upload_df_to_db] {db_schema}.{table_name}: {len(df)} строк за {elapsed:.2f} с "
+                    f"({len(df) / max(elapsed, 1e-9):.0f} строк/с)"
+                )
+                return True
+
             # Преобразуем NaN в None и корректно обрабатываем даты/строки
             records = df.where(pd.notnull(df), None).to_dict(orient='records')
             dtypes = {col: str(df[col].dtype) for col in df.columns}
@@ -276,6 +546,145 @@ async def upload_df_to_db(
             await conn.executemany(insert_query, [list(record.values()) for record in records])
     return True
 
+def _partition_df(df: pd.DataFrame, n_partitions: int, pk_columns: List[str]) -> List[pd.DataFrame]:
+    """Делит кадр на части: по хэшу PK (строки одного ключа попадают в одну часть) или по позиции."""
+    if n_partitions <= 1:
+        return [df]
+    if pk_columns:
+        part_ids = pd.util.hash_pandas_object(df[pk_columns], index=False).to_numpy() % n_partitions
+        parts = [df[part_ids == i] for i in range(n_partitions)]
+    else:
+        bounds = np.linspace(0, len(df), n_partitions + 1, dtype=int)
+        parts = [df.iloc[bounds[i]:bounds[i + 1]] for i in range(n_partitions)]
+    return [part for part in parts if not part.empty]
+
+
+async def _copy_partition(
+    part: pd.DataFrame, staging_table: str, db_schema: str, username: str, password: str, max_retries: int
+) -> int:
+    """COPY части в staging-таблицу на своём соединении из пула. COPY атомарен, поэтому часть можно повторить целиком."""
+    columns = [str(col) for col in part.columns]
+    attempt = 0
+    while True:
+        try:
+            async with get_connection(username, password) as conn:
+                await conn.copy_records_to_table(
+                    staging_table, records=_iter_db_records(part), columns=columns, schema_name=db_schema
+                )
+            return attempt
+        except (asyncpg.PostgresConnectionError, asyncpg.InterfaceError, OSError, asyncpg.DeadlockDetectedError,
+                asyncpg.SerializationError, asyncpg.TooManyConnectionsError) as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            logging.warning(f"[upload_df_to_db_parallel] Повтор части ({len(part)} строк), попытка {attempt}: {e}")
+            await asyncio.sleep(min(2 ** attempt, 10))
+
+
+def _staging_table_name() -> str:
+    return f"{STAGING_TABLE_PREFIX}{int(time.time())}_{uuid.uuid4().hex}"
+
+
+def stale_staging_tables(table_names: List[str], now: float, max_age_seconds: float) -> List[str]:
+    """Staging-таблицы параллельной загрузки, созданные раньше now - max_age_seconds."""
+    stale = []
+    for name in table_names:
+        match = _STAGING_TABLE_NAME.match(name)
+        if match and now - int(match.group(1)) > max_age_seconds:
+            stale.append(name)
+    return stale
+
+
+async def _drop_stale_staging_tables(conn: asyncpg.Connection, db_schema: str) -> None:
+    """Удаляет staging-таблицы, оставшиеся от загрузок, чей процесс завершился, не дойдя до DROP."""
+    rows = await conn.fetch(
+        "SELECT tablename FROM pg_tables WHERE schemaname = $1 AND starts_with(tablename, $2)",
+        db_schema, STAGING_TABLE_PREFIX,
+    )
+    for name in stale_staging_tables([row["tablename"] for row in rows], time.time(), STAGING_TABLE_MAX_AGE_SECONDS):
+        try:
+            await conn.execute(f'DROP TABLE IF EXISTS "{db_schema}"."{name}"')
+            logging.info(f"[upload_df_to_db_parallel] Удалена брошенная staging-таблица {db_schema}.{name}")
+        except asyncpg.PostgresError as e:
+            # Таблица другого пользователя без прав на удаление — её удалит владелец
+            logging.warning(f"[upload_df_to_db_parallel] Не удалось удалить staging-таблицу {db_schema}.{name}: {e}")
+
+
+@read_only_guard
+async def upload_df_to_db_parallel(
+    df: pd.DataFrame,
+    db_schema: str,
+    table_name: str,
+    username: str,
+    password: str,
+    update_on_pk: bool = True,
+    workers: int = UPLOAD_WORKERS,
+    max_retries: int = UPLOAD_RETRIES,
+) -> Dict[str, Any]:
+    """
+    Параллельная загрузка большого DataFrame в существующую таблицу.
+    Кадр делится на части (по хэшу первичного ключа для upsert), части параллельно
+    загружаются COPY по нескольким соединениям из пула в общую UNLOGGED staging-таблицу
+    (TEMP-таблица не видна другим соединениям), упавшие части повторяются. Staging-таблицы,
+    брошенные упавшим процессом, удаляются при следующей параллельной загрузке в схему. Затем одна транзакция переносит данные в целевую таблицу
+    (INSERT ... ON CONFLICT для upsert), поэтому таблица получает все строки или ни одной.
+    Небольшие кадры загружаются обычным upload_df_to_db.
+    Возвращает статистику: строки, части, повторы, время и строк/с.
+    """
+    started = time.perf_counter()
+    n_partitions = max(1, min(workers, len(df) // UPLOAD_MIN_PARTITION_ROWS))
+    if n_partitions == 1:
+        await upload_df_to_db(df, db_schema, table_name, username, password, update_on_pk=update_on_pk)
+        elapsed = time.perf_counter() - started
+        return {"rows": len(df), "partitions": 1, "retries": 0, "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(len(df) / max(elapsed, 1e-9))}
+
+    pk_columns: List[str] = []
+    staging_table = _staging_table_name()
+    async with get_connection(username, password) as conn:
+        await _drop_stale_staging_tables(conn, db_schema)
+        if update_on_pk:
+            pk_columns = await _get_pk_columns(conn, db_schema, table_name, username)
+            missing_cols = [col for col in pk_columns if col not in df.columns]
+            if missing_cols:
+                raise ValueError(
+                    f"DataFrame не содержит столбцы первичного ключа {missing_cols}, необходимые для update_on_pk."
+                )
+        await conn.execute(
+            f'CREATE UNLOGGED TABLE "{db_schema}"."{staging_table}" (LIKE "{db_schema}"."{table_name}" INCLUDING DEFAULTS)'
+        )
+    try:
+        if pk_columns:
+            # Как и при построчном upsert, при повторе ключа в кадре побеждает последняя строка
+            df = df.drop_duplicates(subset=pk_columns, keep='last')
+        parts = _partition_df(df, n_partitions, pk_columns)
+        retries = await asyncio.gather(*(
+            _copy_partition(part, staging_table, db_schema, username, password, max_retries) for part in parts
+        ))
+        columns_str = ', '.join([f'"{col}"' for col in df.columns])
+        merge_query = (
+            f'INSERT INTO "{db_schema}"."{table_name}" ({columns_str}) '
+            f'SELECT {columns_str} FROM "{db_schema}"."{staging_table}"'
+        )
+        if pk_columns:
+            merge_query += _conflict_clause([str(col) for col in df.columns], pk_columns)
+        async with get_connection(username, password) as conn:
+            async with conn.transaction():
+                await conn.execute(merge_query)
+    finally:
+        async with get_connection(username, password) as conn:
+            await conn.execute(f'DROP TABLE IF EXISTS "{db_schema}"."{staging_table}"')
+    elapsed = time.perf_counter() - started
+    stats = {
+        "rows": len(df),
+        "partitions": len(parts),
+        "retries": int(sum(retries)),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(len(df) / max(elapsed, 1e-9)),
+    }
+    logging.info(f"[upload_df_to_db_parallel] {db_schema}.{table_name}: {stats}")
+    return stats
+
 def clean_value(val):
         try:
             import math
@@ -314,7 +723,7 @@ async def upload_dicts_to_db(
     async with get_connection(username, password) as conn:
         pk_columns = []
         if update_on_pk:
-            pk_columns = await _get_pk_columns(conn, db_schema, table_name)
+            pk_columns = await _get_pk_columns(conn, db_schema, table_name, username)
             if pk_columns and not all(col in columns for col in pk_columns):
                 missing_cols = [col for col in pk_columns if col not in columns]
                 raise ValueError(
@@ -383,39 +792,36 @@ async def get_user_table_names(username: str, password: str) -> List[str]:
 
 
 # --- Получение доступных пользователю таблиц по всем схемам ---
-async def get_user_table_names_by_schema(username: str, password: str) -> dict:
+async def get_user_table_names_by_schema(username: str, password: str, refresh: bool = False) -> dict:
     """
     Возвращает словарь {schema: [table1, table2, ...]} с таблицами, к которым пользователь имеет SELECT.
     Включает все схемы, к которым пользователь имеет право USAGE или является владельцем.
+    Выполняется одним запросом к pg_catalog; результат кэшируется (catalog_cache), refresh=True — мимо кэша.
     """
-    # Make sure to await get_connection as it returns an awaitable object
-    async with get_connection(username, password) as conn:
+    async def load() -> dict:
+        async with get_connection(username, password) as conn:
+            # Все схемы с правом USAGE (кроме служебных) и их таблицы с правом SELECT
+            query = """
+                SELECT n.nspname AS schema_name, c.relname AS table_name
+                FROM pg_namespace n
+                LEFT JOIN pg_class c
+                  ON c.relnamespace = n.oid
+                 AND c.relkind IN ('r', 'p')
+                 AND has_table_privilege(current_user, c.oid, 'SELECT')
+                WHERE n.nspname NOT IN ('pg_catalog', 'information_schema', 'pg_toast')
+                  AND has_schema_privilege(current_user, n.nspname, 'USAGE')
+                ORDER BY n.nspname, c.relname
+            """
+            rows = await conn.fetch(query)
         result = {}
-
-        # Получаем все схемы, к которым пользователь имеет право USAGE,
-        # или которые принадлежат текущему пользователю (current_user), кроме служебных
-        schemas_query = """
-            SELECT nspname AS schema_name
-            FROM pg_namespace
-            WHERE nspname NOT IN ('pg_catalog', 'information_schema', 'pg_toast')
-            AND has_schema_privilege(current_user, nspname, 'USAGE');
-        """
-        schemas = await conn.fetch(schemas_query)
-        for row in schemas:
-            schema = row['schema_name']
-            tables_query = f'''
-                SELECT tablename
-                FROM pg_tables
-                WHERE schemaname = $1
-                  AND has_table_privilege(current_user, concat(schemaname, '.', tablename), 'SELECT');
-            '''
-            tables = await conn.fetch(tables_query, schema)
-            
-            table_names = [record['tablename'] for record in tables]
-            result[schema] = table_names
-            
+        for row in rows:
+            tables = result.setdefault(row['schema_name'], [])
+            if row['table_name'] is not None:
+                tables.append(row['table_name'])
         return result
 
+    return await catalog_cache.get_or_load(username, "tables_by_schema", (), load, refresh=refresh)
+
 # --- Проверка подключения к БД ---
 async def check_db_connection(username: str, password: str) -> bool:
     """
@@ -428,62 +834,66 @@ async def check_db_connection(username: str, password: str) -> bool:
     except Exception:
         return False
 
-# --- Проверка БД и DF на соответствие столбцов ---
-async def check_df_matches_table_schema(df: pd.DataFrame, db_schema: str, table_name: str, username: str, password: str) -> bool:
+# --- Колонки таблицы (с кэшем каталога) ---
+async def get_table_columns(db_schema: str, table_name: str, username: str, password: str, refresh: bool = False) -> Optional[List[Tuple[str, str]]]:
     """
-    Проверяет, соответствует ли структура DataFrame структуре таблицы в базе данных.
+    Возвращает [(column_name, data_type), ...] в порядке колонок таблицы или None, если таблицы нет.
+    Результат кэшируется (catalog_cache).
     """
-    try:
+    async def load() -> Optional[List[Tuple[str, str]]]:
         async with get_connection(username, password) as conn:
-            # Проверяем существование таблицы
-            check_query = """
-                SELECT EXISTS (
-                    SELECT 1 FROM information_schema.tables
-                    WHERE table_schema = $1 AND table_name = $2
-                )
-            """
-            exists = await conn.fetchval(check_query, db_schema, table_name)
-            if not exists:
-                return False
-            
-            # Получаем информацию о столбцах таблицы
+            if not await _table_exists(conn, db_schema, table_name):
+                return None
             columns_query = """
                 SELECT column_name, data_type
                 FROM information_schema.columns
                 WHERE table_schema = $1 AND table_name = $2
                 ORDER BY ordinal_position
             """
-            db_columns = await conn.fetch(columns_query, db_schema, table_name)
-            
-            db_schema = {row['column_name'].lower(): PG_TO_PD_TYPE_MAP.get(row['data_type'].lower(), 'object')
-                         for row in db_columns}
-            
-            df_columns_lower = set(col.lower() for col in df.columns)
-            db_columns_lower = set(db_schema.keys())
-            
-            if not df_columns_lower.issubset(db_columns_lower):
-                return False
-            for col in df.columns:
-                df_type = str(df[col].dtype)
-                if pd.api.types.is_datetime64_any_dtype(df[col]):
-                    df_type = 'datetime64[ns]'
-                    
-                expected_type = db_schema.get(col.lower())
+            rows = await conn.fetch(columns_query, db_schema, table_name)
+            return [(row['column_name'], row['data_type']) for row in rows]
+
+    return await catalog_cache.get_or_load(username, "columns", (db_schema, table_name), load, refresh=refresh)
+
+# --- Проверка БД и DF на соответствие столбцов ---
+async def check_df_matches_table_schema(df: pd.DataFrame, db_schema: str, table_name: str, username: str, password: str) -> bool:
+    """
+    Проверяет, соответствует ли структура DataFrame структуре таблицы в базе данных.
+    """
+    try:
+        db_columns = await get_table_columns(db_schema, table_name, username, password)
+        if db_columns is None:
+            return False
+
+        db_schema = {name.lower(): PG_TO_PD_TYPE_MAP.get(data_type.lower(), 'object')
+                     for name, data_type in db_columns}
+        
+        df_columns_lower = set(col.lower() for col in df.columns)
+        db_columns_lower = set(db_schema.keys())
+        
+        if not df_columns_lower.issubset(db_columns_lower):
+            return False
+        for col in df.columns:
+            df_type = str(df[col].dtype)
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                df_type = 'datetime64[ns]'
                 
-                if expected_type is None: # Столбец в DF есть, но нет в схеме БД
-                    return False
-
-                # Проверяем совместимость типов
-                if df_type != expected_type and not (
-                    (df_type.startswith('int') and expected_type == 'int64') or
-                    (df_type.startswith('float') and expected_type == 'float64') or
-                    (df_type in ('object', 'string') and expected_type == 'object') or
-                    (df_type.startswith('int') and expected_type == 'float64')
-                ):
-                    return False
-            
-            return True
+            expected_type = db_schema.get(col.lower())
             
+            if expected_type is None: # Столбец в DF есть, но нет в схеме БД
+                return False
+
+            # Проверяем совместимость типов
+            if df_type != expected_type and not (
+                (df_type.startswith('int') and expected_type == 'int64') or
+                (df_type.startswith('float') and expected_type == 'float64') or
+                (df_type in ('object', 'string', 'category') and expected_type == 'object') or
+                (df_type.startswith('int') and expected_type == 'float64')
+            ):
+                return False
+        
+        return True
+        
     except Exception as e:
         # Логируем исключение для отладки
         return False
@@ -503,22 +913,21 @@ async def get_total_table_count(username: str, password: str) -> int:
         return count
 
 # --- Получение количества всех таблиц по всем схемам ---
-async def get_total_table_count_by_schema(username: str, password: str) -> dict:
+async def get_total_table_count_by_schema(username: str, password: str, refresh: bool = False) -> dict:
     """
     Возвращает словарь {schema: count} с количеством таблиц в каждой схеме.
+    Выполняется одним сгруппированным запросом; результат кэшируется (catalog_cache).
     """
-    async with get_connection(username, password) as conn:
-        schemas_query = """
-            SELECT schema_name FROM information_schema.schemata
-            WHERE schema_name NOT IN ('pg_catalog', 'information_schema')
-        """
-        schemas = await conn.fetch(schemas_query)
-        result = {}
-        for row in schemas:
-            schema = row['schema_name']
-            count_query = '''
-                SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = $1
-            '''
-            count = await conn.fetchval(count_query, schema)
-            result[schema] = count
-        return result
\ No newline at end of file
+    async def load() -> dict:
+        async with get_connection(username, password) as conn:
+            query = """
+                SELECT s.schema_name, COUNT(t.table_name) AS table_count
+                FROM information_schema.schemata s
+                LEFT JOIN information_schema.tables t ON t.table_schema = s.schema_name
+                WHERE s.schema_name NOT IN ('pg_catalog', 'information_schema')
+                GROUP BY s.schema_name
+            """
+            rows = await conn.fetch(query)
+        return {row['schema_name']: row['table_count'] for row in rows}
+
+    return await catalog_cache.get_or_load(username, "table_counts_by_schema", (), load, refresh=refresh)
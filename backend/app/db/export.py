@@ -0,0 +1,160 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from training.ingestion import writer_schema
+
+# Форматы выгрузки таблиц: media type и расширение файла
+EXPORT_FORMATS: Dict[str, Dict[str, str]] = {
+    "xlsx": {"media_type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "extension": "xlsx"},
+    "csv": {"media_type": "text/csv; charset=utf-8", "extension": "csv"},
+    "parquet": {"media_type": "application/vnd.apache.parquet", "extension": "parquet"},
+    "arrow": {"media_type": "application/vnd.apache.arrow.stream", "extension": "arrow"},
+}
+# Максимум строк на листе Excel (включая заголовок)
+XLSX_MAX_ROWS = 1048576
+# Размер куска при отдаче готового xlsx-файла
+XLSX_READ_CHUNK_BYTES = 1024 * 1024
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файлоподобный приёмник для писателей Arrow: копит записанные байты, пока их не заберёт drain()."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _conform(batch: pa.RecordBatch, schema: Optional[pa.Schema]) -> pa.RecordBatch:
+    """Приводит кусок к схеме выгрузки (тип, выведенный по значениям, может меняться между кусками)."""
+    if batch.schema == schema:
+        return batch
+    return pa.Table.from_batches([batch]).cast(schema).to_batches()[0]
+
+
+async def _csv_chunks(batches: AsyncIterator[pa.RecordBatch]) -> AsyncIterator[bytes]:
+    schema = None
+    async for batch in batches:
+        include_header = schema is None
+        if include_header:
+            schema = writer_schema(batch.schema)
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(_conform(batch, schema), sink, write_options=pa_csv.WriteOptions(include_header=include_header))
+        yield sink.getvalue().to_pybytes()
+
+
+async def _arrow_writer_chunks(
+    batches: AsyncIterator[pa.RecordBatch],
+    open_writer: Callable[[_ChunkSink, pa.Schema], object],
+) -> AsyncIterator[bytes]:
+    """
+    Общий цикл для parquet и Arrow IPC: каждый кусок пишется писателем и сразу отдаётся клиенту.
+    Схема берётся по первому куску (writer_schema: колонки без значений в нём — строками).
+    """
+    sink = _ChunkSink()
+    writer = None
+    schema = None
+    async for batch in batches:
+        if writer is None:
+            schema = writer_schema(batch.schema)
+            writer = open_writer(sink, schema)
+        writer.write_batch(_conform(batch, schema))
+        data = sink.drain()
+        if data:
+            yield data
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+class _ParquetStreamWriter:
+    def __init__(self, sink: _ChunkSink, schema: pa.Schema):
+        self._writer = pq.ParquetWriter(sink, schema)
+
+    def write_batch(self, batch: pa.RecordBatch) -> None:
+        # Каждый кусок курсора — отдельная row group
+        self._writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _write_xlsx_rows(workbook, state: dict, batch: pa.RecordBatch) -> None:
+    columns = batch.schema.names
+    for row in zip(*(column.to_pylist() for column in batch.columns)):
+        if state["worksheet"] is None or state["row"] >= XLSX_MAX_ROWS:
+            # Лист Excel заполнен — продолжаем на следующем
+            state["worksheet"] = workbook.add_worksheet()
+            state["worksheet"].write_row(0, 0, columns)
+            state["row"] = 1
+        state["worksheet"].write_row(state["row"], 0, row)
+        state["row"] += 1
+
+
+async def _xlsx_chunks(batches: AsyncIterator[pa.RecordBatch]) -> AsyncIterator[bytes]:
+    """
+    xlsx — zip-архив, который нельзя отдавать до завершения записи. Строки пишутся в режиме constant_memory
+    во временный файл (в памяти держится одна строка листа), затем файл отдаётся кусками и удаляется.
+    """
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {
+            "constant_memory": True,
+            "nan_inf_to_errors": True,
+            "remove_timezone": True,
+            "default_date_format": "yyyy-mm-dd hh:mm:ss",
+        })
+        state = {"worksheet": None, "row": 0}
+        async for batch in batches:
+            await asyncio.to_thread(_write_xlsx_rows, workbook, state, batch)
+        await asyncio.to_thread(workbook.close)
+        with open(path, "rb") as f:
+            while True:
+                data = await asyncio.to_thread(f.read, XLSX_READ_CHUNK_BYTES)
+                if not data:
+                    break
+                yield data
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f"[export] Не удалось удалить временный файл {path}: {e}")
+
+
+def export_batches(batches: AsyncIterator[pa.RecordBatch], fmt: str) -> AsyncIterator[bytes]:
+    """Превращает поток Arrow-кусков таблицы в поток байтов файла выбранного формата (см. EXPORT_FORMATS)."""
+    if fmt == "csv":
+        return _csv_chunks(batches)
+    if fmt == "parquet":
+        return _arrow_writer_chunks(batches, _ParquetStreamWriter)
+    if fmt == "arrow":
+        return _arrow_writer_chunks(batches, pa.ipc.new_stream)
+    if fmt == "xlsx":
+        return _xlsx_chunks(batches)
+    raise ValueError(f"Неподдерживаемый формат выгрузки: {fmt}")
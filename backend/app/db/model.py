@@ -64,6 +64,7 @@ class TablePreviewRequest(BaseModel):
 class DownloadTableRequest(BaseModel):
     db_schema: str
     table: str
+    format: Optional[str] = "xlsx"  # xlsx, csv, parquet или arrow
 
 class SavePredictionRequest(BaseModel):
     db_schema: str
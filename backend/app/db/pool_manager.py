@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import asyncpg
+
+from .settings import settings
+
+# Лимиты соединений: на один пул (пару логин/пароль) и суммарно на процесс API
+DB_POOL_MAX_SIZE_PER_USER = int(os.getenv("DB_POOL_MAX_SIZE_PER_USER", "5"))
+DB_POOL_MAX_TOTAL = int(os.getenv("DB_POOL_MAX_TOTAL", "50"))
+# Пул без активных соединений закрывается после стольких секунд простоя
+DB_POOL_IDLE_SECONDS = float(os.getenv("DB_POOL_IDLE_SECONDS", "300"))
+
+
+class PoolManager:
+    """
+    Пулы asyncpg, по одному на пару (логин, пароль) из JWT и параметры подключения к БД.
+    Пул привязан к event loop, в котором создан. Суммарный max_size всех пулов не превышает max_total:
+    при нехватке бюджета закрываются давно не используемые пулы без занятых соединений.
+    Простаивающие пулы закрываются лениво, при очередном запросе соединения.
+    """
+
+    def __init__(self, max_size_per_user: int, max_total: int, idle_seconds: float):
+        self.max_size_per_user = max_size_per_user
+        self.max_total = max_total
+        self.idle_seconds = idle_seconds
+        # key -> {"pool", "loop", "username", "max_size", "last_used", "acquired"}
+        self._pools: Dict[Tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.pools_created = 0
+        self.pools_closed = 0
+
+    @staticmethod
+    def _key(username: str, password: str, loop: asyncio.AbstractEventLoop) -> Tuple:
+        password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return (username, password_hash, settings.DB_HOST, settings.DB_PORT, settings.DB_NAME, id(loop))
+
+    @asynccontextmanager
+    async def acquire(self, username: str, password: str):
+        """Соединение из пула пользователя; возвращается в пул при выходе из контекста."""
+        loop = asyncio.get_running_loop()
+        await self._sweep_idle(loop)
+        key = self._key(username, password, loop)
+        entry = await self._get_or_create(key, username, password, loop)
+        entry["acquired"] += 1
+        try:
+            conn = await entry["pool"].acquire()
+        except Exception:
+            entry["acquired"] -= 1
+            if entry["pool"].get_size() == 0:
+                # Ни одного соединения так и не открылось (например, неверный пароль) — пул не держим
+                await self._close(key)
+            raise
+        try:
+            yield conn
+        finally:
+            entry["last_used"] = time.monotonic()
+            entry["acquired"] -= 1
+            await entry["pool"].release(conn)
+
+    async def _get_or_create(self, key: Tuple, username: str, password: str, loop) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._pools.get(key)
+        if entry is not None:
+            if entry["loop"] is loop:
+                return entry
+            # id() закрытого event loop достался новому — старый пул непригоден
+            await self._close(key)
+        max_size = await self._reserve_budget(loop)
+        pool = await asyncpg.create_pool(
+            user=username,
+            password=password,
+            database=settings.DB_NAME,
+            host=settings.DB_HOST,
+            port=int(settings.DB_PORT),
+            min_size=0,
+            max_size=max_size,
+            max_inactive_connection_lifetime=self.idle_seconds,
+        )
+        with self._lock:
+            existing = self._pools.get(key)
+            if existing is None:
+                self._pools[key] = entry = {
+                    "pool": pool,
+                    "loop": loop,
+                    "username": username,
+                    "max_size": max_size,
+                    "last_used": time.monotonic(),
+                    "acquired": 0,
+                }
+                self.pools_created += 1
+        if existing is not None:
+            # Пул для этого ключа успели создать параллельно — лишний закрываем
+            await pool.close()
+            return existing
+        logging.info(f"[PoolManager] Создан пул для пользователя '{username}' (max_size={max_size})")
+        return entry
+
+    async def _reserve_budget(self, loop) -> int:
+        """Размер нового пула в пределах общего лимита; при нехватке закрывает простаивающие пулы (LRU)."""
+        while True:
+            with self._lock:
+                used = sum(entry["max_size"] for entry in self._pools.values())
+                free = self.max_total - used
+                if free >= 1:
+                    return min(self.max_size_per_user, free)
+                idle = sorted(
+                    (entry["last_used"], key) for key, entry in self._pools.items()
+                    if entry["acquired"] == 0 and (entry["loop"] is loop or entry["loop"].is_closed())
+                )
+            if not idle:
+                raise ConnectionError(
+                    f"Достигнут общий лимит соединений с БД ({self.max_total}), свободных пулов нет"
+                )
+            await self._close(idle[0][1])
+
+    async def _close(self, key: Tuple) -> None:
+        with self._lock:
+            entry = self._pools.pop(key, None)
+        if entry is None:
+            return
+        self.pools_closed += 1
+        try:
+            if entry["loop"] is asyncio.get_running_loop():
+                await entry["pool"].close()
+            else:
+                entry["pool"].terminate()
+        except Exception as e:
+            logging.warning(f"[PoolManager] Ошибка закрытия пула пользователя '{entry['username']}': {e}")
+
+    async def _sweep_idle(self, loop) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep < min(self.idle_seconds, 60):
+            return
+        self._last_sweep = now
+        with self._lock:
+            stale = [
+                key for key, entry in self._pools.items()
+                if entry["loop"].is_closed()
+                or (entry["loop"] is loop and entry["acquired"] == 0 and now - entry["last_used"] > self.idle_seconds)
+            ]
+        for key in stale:
+            await self._close(key)
+        if stale:
+            logging.info(f"[PoolManager] Закрыто простаивающих пулов: {len(stale)}")
+
+    async def close_all(self) -> None:
+        with self._lock:
+            keys = list(self._pools.keys())
+        for key in keys:
+            await self._close(key)
+
+    def stats(self, username: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Статистика пулов. С username в "pools" только пулы этого пользователя (имена других пользователей БД
+        не раскрываются), итоговые значения — по всем пулам без имён.
+        """
+        now = time.monotonic()
+        with self._lock:
+            all_pools = [
+                {
+                    "username": entry["username"],
+                    "size": entry["pool"].get_size(),
+                    "idle": entry["pool"].get_idle_size(),
+                    "max_size": entry["max_size"],
+                    "acquired": entry["acquired"],
+                    "idle_seconds": round(now - entry["last_used"], 1),
+                }
+                for entry in self._pools.values()
+            ]
+        return {
+            "pools": [p for p in all_pools if username is None or p["username"] == username],
+            "pools_count": len(all_pools),
+            "total_connections": sum(p["size"] for p in all_pools),
+            "total_max_size": sum(p["max_size"] for p in all_pools),
+            "max_total": self.max_total,
+            "max_size_per_user": self.max_size_per_user,
+            "pools_created": self.pools_created,
+            "pools_closed": self.pools_closed,
+        }
+
+
+pool_manager = PoolManager(DB_POOL_MAX_SIZE_PER_USER, DB_POOL_MAX_TOTAL, DB_POOL_IDLE_SECONDS)
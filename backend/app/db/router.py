@@ -12,17 +12,22 @@ from .model import (
     TablePreviewRequest, DownloadTableRequest, SavePredictionRequest, CreateTableFromFileRequest, CheckDFMatchesTableSchemaRequest
 )
 from .settings import settings
+from .pool_manager import pool_manager
+from .catalog import catalog_cache
 from .env_utils import validate_secret_key, update_env_variables
 from .db_manager import (
     get_user_table_names_by_schema,
     get_table_rows,
     create_table_from_df,
     upload_df_to_db,
+    upload_df_to_db_parallel,
     check_db_connection,
     check_df_matches_table_schema,
     get_total_table_count_by_schema,
+    stream_table_batches,
     auto_convert_dates
 )
+from .export import EXPORT_FORMATS, export_batches
 import logging
 
 router = APIRouter()
@@ -90,15 +95,24 @@ async def login_for_access_token(data: DBConnectionRequest):
     return DBConnectionResponse(success=True, detail="Connection successful, token issued", access_token=access_token)
 
 
+@router.get('/db-pool-stats')
+async def get_db_pool_stats(db_creds: dict = Depends(get_current_user_db_creds)):
+    """Статистика пула соединений с БД текущего пользователя, итоги по всем пулам, общий лимит соединений и кэш каталога."""
+    stats = pool_manager.stats(username=db_creds["username"])
+    stats["catalog_cache"] = catalog_cache.stats()
+    return stats
+
+
 @router.get('/get-tables', response_model=TablesResponse)
-async def get_tables(db_creds: dict = Depends(get_current_user_db_creds)):
+async def get_tables(refresh: bool = False, db_creds: dict = Depends(get_current_user_db_creds)):
     """
     Возвращает словарь {schema: [таблицы]} и количество таблиц по схемам.
+    Списки кэшируются на DB_CATALOG_TTL_SECONDS; refresh=true перечитывает каталог.
     """
     try:
-        user_tables = await get_user_table_names_by_schema(db_creds["username"], db_creds["password"])
+        user_tables = await get_user_table_names_by_schema(db_creds["username"], db_creds["password"], refresh=refresh)
         # Получаем количество всех таблиц под суперпользователем
-        total_counts = await get_total_table_count_by_schema(settings.SUPERUSER_DB_USER, settings.SUPERUSER_DB_PASS)
+        total_counts = await get_total_table_count_by_schema(settings.SUPERUSER_DB_USER, settings.SUPERUSER_DB_PASS, refresh=refresh)
         count_available = sum(len(tables) for tables in user_tables.values())
         count_total = sum(total_counts.values())
         return TablesResponse(success=True, tables=user_tables, count_available=count_available, count_total=count_total)
@@ -191,33 +205,48 @@ async def download_table_from_db_endpoint(
     db_creds: dict = Depends(get_current_user_db_creds)
 ):
     """
-    Возвращает все данные из указанной таблицы в виде Excel-файла.
-    Тело запроса: {"db_schema": ..., "table": ...} или {"schema": ..., "table": ...}
+    Потоково выгружает все данные из указанной таблицы в файл: xlsx (по умолчанию), csv, parquet или arrow.
+    Таблица читается серверным курсором кусками, куски сразу пишутся в ответ (xlsx — через временный файл).
+    Тело запроса: {"db_schema": ..., "table": ..., "format": ...} или {"schema": ..., "table": ...}
     """
     db_schema = getattr(req, 'db_schema', None) or getattr(req, 'schema', None)
     table_name = req.table
     if not db_schema or not table_name:
         raise HTTPException(status_code=400, detail="db_schema (или schema) и table обязательны")
+    export_format = (req.format or "xlsx").lower()
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый формат выгрузки: {req.format}. Доступны: {', '.join(EXPORT_FORMATS)}")
+    batches = stream_table_batches(db_schema, table_name, db_creds['username'], db_creds['password'], as_arrow=True)
     try:
-        result = await get_table_rows(db_schema, table_name, db_creds['username'], db_creds['password'])
-        if not result or len(result) == 0:
-            raise HTTPException(status_code=404, detail=f"Таблица '{table_name}' пуста или не найдена")
-        df = pd.DataFrame(result)
-        output = io.BytesIO()
-        df.to_excel(output, index=False)
-        output.seek(0)
-        logging.info(f"[download-table-from-db] Таблица '{table_name}' успешно выгружена в Excel.")
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename={table_name}.xlsx"
-            }
-        )
+        # Первый кусок читаем до начала ответа, чтобы ошибки (нет таблицы, нет доступа) вернулись кодом HTTP
+        first_batch = await anext(batches, None)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки таблицы: {str(e)}")
+    if first_batch is None:
+        raise HTTPException(status_code=404, detail=f"Таблица '{table_name}' пуста или не найдена")
+
+    async def all_batches():
+        yield first_batch
+        async for batch in batches:
+            yield batch
+
+    async def body():
+        try:
+            async for chunk in export_batches(all_batches(), export_format):
+                yield chunk
+            logging.info(f"[download-table-from-db] Таблица '{table_name}' успешно выгружена в {export_format}.")
+        finally:
+            await batches.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[export_format]["media_type"],
+        headers={
+            "Content-Disposition": f"attachment; filename={table_name}.{EXPORT_FORMATS[export_format]['extension']}"
+        }
+    )
 
 
 @router.post('/save-prediction-to-db')
@@ -247,13 +276,13 @@ async def save_prediction_to_db(
             raise HTTPException(status_code=400, detail="Файл прогноза пустой")
         if create_new:
             await create_table_from_df(df, db_schema, table_name, db_creds['username'], db_creds['password'])
-            await upload_df_to_db(df, db_schema, table_name, db_creds['username'], db_creds['password'])
         else:
             matches = await check_df_matches_table_schema(df, db_schema, table_name, db_creds['username'], db_creds['password'])
             if not matches:
                 raise HTTPException(status_code=400, detail=f"Структура DataFrame не совпадает со структурой таблицы '{table_name}' в БД. Проверьте названия и типы столбцов.")
-            await upload_df_to_db(df, db_schema, table_name, db_creds['username'], db_creds['password'])
-        return {"success": True, "detail": f"Прогноз успешно сохранён в таблицу '{table_name}'"}
+        # Большие прогнозы грузятся параллельно по нескольким соединениям
+        upload_stats = await upload_df_to_db_parallel(df, db_schema, table_name, db_creds['username'], db_creds['password'])
+        return {"success": True, "detail": f"Прогноз успешно сохранён в таблицу '{table_name}'", "upload_stats": upload_stats}
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -14,6 +14,9 @@ from logging.handlers import TimedRotatingFileHandler
 import os
 import asyncio
 from utils.cleanup import cleanup_old_training_sessions
+from training.executor import training_executor
+from db.pool_manager import pool_manager
+from prediction.parallel import parallel_scorer
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -26,11 +29,15 @@ async def periodic_cleanup():
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Поднимаем очередь обучений: осиротевшие после перезапуска задания возвращаются в очередь
+    training_executor.start()
     task = asyncio.create_task(periodic_cleanup())
     try:
         yield
     finally:
         task.cancel()
+        await pool_manager.close_all()
+        parallel_scorer.shutdown()
 
 app = FastAPI(
     title="Time Series Analysis API",
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import os
+from typing import Any, Callable, Dict, List, Tuple
+
+# Окно ожидания соседних запросов (мс) и максимальный размер объединённого батча (строк)
+SCORE_BATCH_WINDOW_MS = float(os.getenv("SCORE_BATCH_WINDOW_MS", "5"))
+SCORE_MAX_BATCH_ROWS = int(os.getenv("SCORE_MAX_BATCH_ROWS", "512"))
+
+
+class ScoreBatcher:
+    """
+    Объединяет конкурентные запросы скоринга одной сессии с одинаковым набором колонок в один
+    векторизованный вызов модели. Запросы копятся window_ms миллисекунд или до max_batch_rows строк,
+    затем скорятся одним кадром, а результат разрезается обратно по вызывающим в исходном порядке.
+    Если объединённый батч падает, запросы скорятся по отдельности — ошибку получает только тот,
+    чей запрос её вызвал.
+    score_fn(session_id, records) -> {"predictions": [...], "probabilities": [...] | None}
+    """
+
+    def __init__(self, score_fn: Callable[[str, List[Dict[str, Any]]], Dict[str, Any]], window_ms: float, max_batch_rows: int):
+        self.score_fn = score_fn
+        self.window_ms = window_ms
+        self.max_batch_rows = max_batch_rows
+        # {(session_id, колонки): {"items": [(records, future), ...], "rows": int, "timer": asyncio.TimerHandle}}
+        self._pending: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+        self.requests = 0
+        self.batches = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _batch_key(session_id: str, records: List[Dict[str, Any]]) -> Tuple[str, Tuple[str, ...]]:
+        """Объединяются только запросы с одинаковыми колонками: иначе в кадре появятся колонки из NaN."""
+        return session_id, tuple(sorted({column for rec in records for column in rec}))
+
+    async def submit(self, session_id: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.requests += 1
+        if self.window_ms <= 0 or len(records) >= self.max_batch_rows:
+            # Батчинг выключен или запрос сам по себе уже полный батч
+            self.batches += 1
+            return await asyncio.to_thread(self.score_fn, session_id, records)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = self._batch_key(session_id, records)
+        batch = self._pending.get(key)
+        if batch is not None and batch["rows"] + len(records) > self.max_batch_rows:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = {"items": [], "rows": 0}
+            batch["timer"] = loop.call_later(self.window_ms / 1000, self._flush, key)
+            self._pending[key] = batch
+        batch["items"].append((records, future))
+        batch["rows"] += len(records)
+        if batch["rows"] >= self.max_batch_rows:
+            self._flush(key)
+        return await future
+
+    def _flush(self, key: Tuple[str, Tuple[str, ...]]) -> None:
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch["timer"].cancel()
+        self.batches += 1
+        asyncio.get_running_loop().create_task(self._run_batch(key[0], batch["items"]))
+
+    async def _run_separately(self, session_id: str, items: list) -> None:
+        """Скоринг каждого запроса отдельным вызовом: ошибка одного запроса не достаётся соседям."""
+        for records, future in items:
+            try:
+                result = await asyncio.to_thread(self.score_fn, session_id, records)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, session_id: str, items: list) -> None:
+        all_records = [rec for records, _ in items for rec in records]
+        try:
+            result = await asyncio.to_thread(self.score_fn, session_id, all_records)
+        except Exception as e:
+            if len(items) == 1:
+                if not items[0][1].done():
+                    items[0][1].set_exception(e)
+                return
+            logging.warning(f"[ScoreBatcher] session_id={session_id}: батч из {len(items)} запросов упал ({e}), скоринг по отдельности")
+            self.fallbacks += 1
+            await self._run_separately(session_id, items)
+            return
+        if len(items) > 1:
+            logging.info(f"[ScoreBatcher] session_id={session_id}: объединено запросов {len(items)}, строк {len(all_records)}")
+        offset = 0
+        predictions = result["predictions"]
+        probabilities = result.get("probabilities")
+        for records, future in items:
+            end = offset + len(records)
+            part = {
+                "predictions": predictions[offset:end],
+                "probabilities": probabilities[offset:end] if probabilities is not None else None,
+            }
+            if not future.done():
+                future.set_result(part)
+            offset = end
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "fallbacks": self.fallbacks,
+            "window_ms": self.window_ms,
+            "max_batch_rows": self.max_batch_rows,
+        }
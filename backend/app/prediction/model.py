@@ -0,0 +1,13 @@
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class ScoreRequest(BaseModel):
+    records: List[Dict[str, Any]] = Field(..., description="Строки для скоринга: список словарей {колонка: значение}.")
+
+
+class ScoreResponse(BaseModel):
+    session_id: str
+    predictions: List[Any] = Field(..., description="Прогноз для каждой строки в порядке запроса.")
+    probabilities: Optional[List[Dict[str, float]]] = Field(None, description="Вероятности классов для каждой строки (None для регрессии).")
+    elapsed_ms: float
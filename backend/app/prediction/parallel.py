@@ -0,0 +1,218 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException
+
+from training.executor import LOG_PATH, THREAD_ENV_VARS
+from training.ingestion import writer_schema
+
+# Число процессов параллельного скоринга и потоков BLAS/OpenMP в каждом (процессы x потоки ≈ ядра)
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+PREDICT_THREADS_PER_WORKER = int(os.getenv("PREDICT_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // PREDICT_WORKERS))))
+
+# Состояние процесса-воркера: потоки и признак применённого threadpool_limits
+_worker_state: Dict[str, Any] = {}
+
+
+class ScoringWorkerError(Exception):
+    """Ошибка прогноза в процессе-воркере; в отличие от HTTPException передаётся между процессами."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _init_scoring_worker(threads: int) -> None:
+    """Инициализация spawn-процесса скоринга: ограничение потоков до загрузки numpy/LightGBM/torch."""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[logging.FileHandler(LOG_PATH, encoding='utf-8')],
+    )
+    _worker_state["threads"] = threads
+    _worker_state["limited"] = False
+
+
+def _limit_loaded_threadpools() -> None:
+    """После загрузки модели ограничивает пулы потоков уже подгруженных библиотек (один раз на процесс)."""
+    if _worker_state.get("limited"):
+        return
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=_worker_state["threads"])
+    except ImportError:
+        logging.warning("[_limit_loaded_threadpools] threadpoolctl не установлен, действуют только переменные окружения")
+    _worker_state["limited"] = True
+
+
+def _score_row_group(session_id: str, metadata: dict, input_path: str, row_group: int, part_path: str) -> int:
+    """
+    Задача воркера: прогноз одной row group входного parquet, результат пишется в part_path.
+    Предиктор берётся из кэша предикторов процесса — загружается один раз на процесс.
+    """
+    # Ленивые импорты: модуль импортируется и в процессе API, и в процессах скоринга
+    from AutoML.manager import automl_manager
+    from prediction.router import model_features
+    from src.data.type_optimization import restore_input_columns
+
+    df = pq.ParquetFile(input_path).read_row_group(row_group).to_pandas()
+    try:
+        best_strategy = automl_manager.get_best_strategy(session_id)
+        preds = best_strategy.predict(model_features(df, metadata), session_id, metadata["training_parameters"])
+    except HTTPException as e:
+        raise ScoringWorkerError(e.status_code, str(e.detail))
+    preds = restore_input_columns(preds, df)
+    _limit_loaded_threadpools()
+    pq.write_table(pa.Table.from_pandas(preds, preserve_index=False), part_path)
+    return len(preds)
+
+
+def _rechunk_parquet(input_path: str, output_path: str, chunk_rows: int) -> None:
+    """Переписывает parquet row group'ами по chunk_rows строк (единица работы воркера)."""
+    parquet_file = pq.ParquetFile(input_path)
+    with pq.ParquetWriter(output_path, parquet_file.schema_arrow) as writer:
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            writer.write_table(pa.Table.from_batches([batch]))
+
+
+def _merge_parts(part_paths: List[str], output_path: str) -> None:
+    """Склеивает части прогноза в исходном порядке строк, по одной row group за раз."""
+    writer = None
+    try:
+        for part_path in part_paths:
+            table = pq.read_table(part_path)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, writer_schema(table.schema))
+            if table.schema != writer.schema:
+                # Типы словарей category и выведенные типы могут отличаться между частями
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+class ParallelScorer:
+    """
+    Пул spawn-процессов для офлайн-скоринга больших файлов. Каждый процесс держит свой загруженный предиктор
+    и ограничен threads_per_worker потоками BLAS/OpenMP, чтобы процессы не конкурировали за ядра.
+    Входной parquet делится на row group'ы (куски по chunk_rows строк), воркеры пишут части прогноза,
+    которые затем склеиваются в исходном порядке. Пул создаётся при первом использовании и переиспользуется,
+    поэтому повторный прогноз той же сессии не загружает модель заново.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.jobs = 0
+        self.rows = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_scoring_worker,
+                    initargs=(self.threads_per_worker,),
+                )
+                logging.info(f"[ParallelScorer] Запущен пул скоринга: {self.workers} процессов x {self.threads_per_worker} потоков")
+            return self._executor
+
+    def score_file(
+        self,
+        session_id: str,
+        metadata: dict,
+        input_path: str,
+        output_path: str,
+        chunk_rows: int,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> int:
+        """
+        Прогноз input_path в output_path. В работе одновременно не больше 2 x workers кусков,
+        поэтому память родителя не зависит от размера файла. Возвращает число строк прогноза.
+        """
+        work_dir = output_path + ".parts"
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        try:
+            parquet_file = pq.ParquetFile(input_path)
+            rows_total = parquet_file.metadata.num_rows
+            group_rows = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+            if group_rows and max(group_rows) > 2 * chunk_rows:
+                # Крупные row group'ы (например, Excel одним куском) режем, чтобы загрузить все процессы
+                rechunked_path = os.path.join(work_dir, "input.parquet")
+                _rechunk_parquet(input_path, rechunked_path, chunk_rows)
+                input_path = rechunked_path
+                parquet_file = pq.ParquetFile(input_path)
+            n_groups = parquet_file.num_row_groups
+            part_paths = [os.path.join(work_dir, f"part_{i:06d}.parquet") for i in range(n_groups)]
+
+            executor = self._get_executor()
+            pending = set()
+            next_group = 0
+            rows_done = 0
+            while next_group < n_groups or pending:
+                while next_group < n_groups and len(pending) < 2 * self.workers:
+                    pending.add(executor.submit(
+                        _score_row_group, session_id, metadata, input_path, next_group, part_paths[next_group]
+                    ))
+                    next_group += 1
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows_done += future.result()
+                if on_progress is not None:
+                    on_progress(rows_done, rows_total)
+
+            tmp_path = output_path + ".tmp"
+            if n_groups == 0:
+                pd.DataFrame().to_parquet(tmp_path, index=False)
+            else:
+                _merge_parts(part_paths, tmp_path)
+            os.replace(tmp_path, output_path)
+        except ScoringWorkerError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except BrokenProcessPool:
+            # Процесс скоринга упал (например, OOM) — пул пересоздаётся при следующем прогнозе
+            self.shutdown()
+            raise HTTPException(status_code=500, detail="Процесс параллельного скоринга завершился аварийно")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        with self._lock:
+            self.jobs += 1
+            self.rows += rows_done
+        return rows_done
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "threads_per_worker": self.threads_per_worker,
+                "pool_started": self._executor is not None,
+                "jobs": self.jobs,
+                "rows": self.rows,
+            }
+
+
+parallel_scorer = ParallelScorer(PREDICT_WORKERS, PREDICT_THREADS_PER_WORKER)
@@ -1,22 +1,38 @@
 import json
+import time
 from fastapi import APIRouter, HTTPException, Response
 import os
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from io import BytesIO
 import logging
 from AutoML.manager import automl_manager
+from AutoML.predictor_cache import predictor_cache
 import asyncio
-from src.features.feature_engineering import fill_missing_values
+from src.features.feature_engineering import fill_missing_values, MissingValuesImputer
+from src.data.type_optimization import apply_dtype_schema, restore_input_columns
 from sessions.utils import (
     get_session_path,
     load_session_metadata,
+    update_session_metadata,
+    training_sessions,
 )
+from training.ingestion import file_to_parquet, writer_schema
 from zipfile import ZipFile
+from .model import ScoreRequest, ScoreResponse
+from .batcher import ScoreBatcher, SCORE_BATCH_WINDOW_MS, SCORE_MAX_BATCH_ROWS
+from .parallel import parallel_scorer
 
 router = APIRouter()
 
-def predict_tabular(session_id: str):
-    logging.info(f"[predict_tabular] Начало прогноза для session_id={session_id}")
+# Максимальное число строк в одном запросе онлайн-скоринга
+SCORE_MAX_RECORDS = int(os.getenv("SCORE_MAX_RECORDS", "1000"))
+# Размер куска (строк) при потоковом прогнозе
+PREDICT_CHUNK_ROWS = int(os.getenv("PREDICT_CHUNK_ROWS", "100000"))
+
+def _load_prediction_context(session_id: str):
+    """Проверяет сессию и возвращает (session_path, metadata, training_parameters)."""
     session_path = get_session_path(session_id)
     if not os.path.exists(session_path):
         logging.error(f"Папка сессии не найдена: {session_path}")
@@ -30,18 +46,22 @@ def predict_tabular(session_id: str):
     if not params:
         logging.error(f"Параметры обучения не найдены в metadata.json для session_id={session_id}")
         raise HTTPException(status_code=400, detail="Параметры обучения не найдены в metadata.json")
+    return session_path, metadata, params
 
-    # Поиск test файла (csv/xlsx/xls) для прогноза
-    test_file = None
+def _find_test_file(session_id: str, session_path: str) -> str:
+    """Поиск test файла (csv/xlsx/xls) для прогноза."""
     for fname in os.listdir(session_path):
         if fname.startswith('test_') and (fname.endswith('.csv') or fname.endswith('.xlsx') or fname.endswith('.xls')):
             test_file = os.path.join(session_path, fname)
-            break
-    if not test_file:
-        logging.error(f"Файл test не найден для session_id={session_id}")
-        raise HTTPException(status_code=404, detail="Файл test не найден для прогноза")
-    file_to_predict = test_file
-    logging.info(f"Файл test найден и будет использован для прогноза: {test_file}")
+            logging.info(f"Файл test найден и будет использован для прогноза: {test_file}")
+            return test_file
+    logging.error(f"Файл test не найден для session_id={session_id}")
+    raise HTTPException(status_code=404, detail="Файл test не найден для прогноза")
+
+def predict_tabular(session_id: str):
+    logging.info(f"[predict_tabular] Начало прогноза для session_id={session_id}")
+    session_path, metadata, params = _load_prediction_context(session_id)
+    file_to_predict = _find_test_file(session_id, session_path)
     try:
         if file_to_predict.endswith('.csv'):
             df = pd.read_csv(file_to_predict)
@@ -52,20 +72,147 @@ def predict_tabular(session_id: str):
         logging.error(f"Ошибка чтения файла для прогноза: {e}")
         raise HTTPException(status_code=400, detail=f"Ошибка чтения файла для прогноза: {e}")
 
-    # Препроцессинг (если нужно, например, fill_missing_values)
-    fill_method = params.get("fill_missing_method", None)
-    if fill_method:
-        df = fill_missing_values(df, fill_method)
-        logging.info(f"Пропущенные значения обработаны методом: {fill_method}")
-
-    # Предсказание
+    # Предсказание: пропуски заполняются один раз, в model_features (после приведения типов, как при обучении)
     if len(df) != 0:
         best_strategy = automl_manager.get_best_strategy(session_id)
-        preds = best_strategy.predict(df, session_id, params)
+        preds = best_strategy.predict(model_features(df, metadata), session_id, params)
+        preds = restore_input_columns(preds, df)
     else:
         preds = pd.DataFrame()
     return preds
 
+def predict_tabular_streaming(session_id: str, chunk_rows: int = PREDICT_CHUNK_ROWS) -> dict:
+    """
+    Потоковый прогноз: test-файл сессии (prediction.parquet) читается кусками по chunk_rows строк,
+    каждый кусок приводится к схеме признаков, заполняются пропуски, делается прогноз и кусок
+    дописывается в prediction_{session_id}.parquet отдельной row group. Память ограничена размером куска.
+    Прогресс по кускам пишется в metadata.json (prediction_progress).
+    Возвращает {"prediction_file", "rows", "prediction_head"}.
+    """
+    logging.info(f"[predict_tabular_streaming] Начало потокового прогноза для session_id={session_id}")
+    session_path, metadata, params = _load_prediction_context(session_id)
+    input_path = os.path.join(session_path, "prediction.parquet")
+    if not os.path.exists(input_path):
+        # Сессии без готового parquet: конвертируем test-файл потоково (CSV) один раз
+        try:
+            file_to_parquet(_find_test_file(session_id, session_path), input_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Ошибка чтения файла для прогноза: {e}")
+    parquet_file = pq.ParquetFile(input_path)
+    rows_total = parquet_file.metadata.num_rows
+    output_path = os.path.join(session_path, f"prediction_{session_id}.parquet")
+    tmp_path = output_path + ".tmp"
+
+    best_strategy = automl_manager.get_best_strategy(session_id)
+    writer = None
+    head = []
+    rows_done = 0
+    started = time.perf_counter()
+    try:
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            df = batch.to_pandas()
+            preds = best_strategy.predict(model_features(df, metadata), session_id, params)
+            preds = restore_input_columns(preds, df)
+            table = pa.Table.from_pandas(preds, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, writer_schema(table.schema))
+                head = preds.head(10).to_dict(orient="records")
+            if table.schema != writer.schema:
+                # Типы словарей category и выведенные типы могут отличаться между кусками
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            rows_done += len(preds)
+            _save_prediction_progress(session_id, rows_done, rows_total, started)
+        if writer is None:
+            # Пустой test-файл: прогноз тоже пустой
+            pd.DataFrame().to_parquet(tmp_path, index=False)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, output_path)
+    logging.info(f"[predict_tabular_streaming] Прогноз {rows_done} строк сохранён в {output_path} за {time.perf_counter() - started:.1f} с")
+    return {"prediction_file": output_path, "rows": rows_done, "prediction_head": head}
+
+def predict_tabular_parallel(session_id: str, chunk_rows: int = PREDICT_CHUNK_ROWS) -> dict:
+    """
+    Параллельный прогноз большого test-файла пулом процессов (parallel_scorer): куски по chunk_rows строк
+    прогнозируются в разных процессах и склеиваются по порядку в prediction_{session_id}.parquet.
+    Возвращает то же, что predict_tabular_streaming.
+    """
+    logging.info(f"[predict_tabular_parallel] Начало параллельного прогноза для session_id={session_id}")
+    session_path, metadata, params = _load_prediction_context(session_id)
+    input_path = os.path.join(session_path, "prediction.parquet")
+    if not os.path.exists(input_path):
+        try:
+            file_to_parquet(_find_test_file(session_id, session_path), input_path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Ошибка чтения файла для прогноза: {e}")
+    output_path = os.path.join(session_path, f"prediction_{session_id}.parquet")
+    started = time.perf_counter()
+    rows = parallel_scorer.score_file(
+        session_id,
+        metadata,
+        input_path,
+        output_path,
+        chunk_rows,
+        on_progress=lambda rows_done, rows_total: _save_prediction_progress(session_id, rows_done, rows_total, started),
+    )
+    head = next(pq.ParquetFile(output_path).iter_batches(batch_size=10), None) if rows else None
+    head = head.to_pandas().to_dict(orient="records") if head is not None else []
+    logging.info(f"[predict_tabular_parallel] Прогноз {rows} строк сохранён в {output_path} за {time.perf_counter() - started:.1f} с")
+    return {"prediction_file": output_path, "rows": rows, "prediction_head": head}
+
+def _save_prediction_progress(session_id: str, rows_done: int, rows_total: int, started: float) -> None:
+    progress = {
+        "rows_done": rows_done,
+        "rows_total": rows_total,
+        "percent": round(100 * rows_done / rows_total, 1) if rows_total else 100.0,
+        "elapsed_seconds": round(time.perf_counter() - started, 1),
+    }
+    update_session_metadata(session_id, {"prediction_progress": progress}, create=True)
+    if session_id in training_sessions:
+        training_sessions[session_id]["prediction_progress"] = progress
+
+def impute_missing_values(df: pd.DataFrame, metadata: dict) -> pd.DataFrame:
+    """Заполняет пропуски импьютером, обученным на тренировочных данных (для старых сессий — по самому df)."""
+    imputer_state = metadata.get("imputer")
+    if imputer_state is not None:
+        return MissingValuesImputer.from_dict(imputer_state).transform(df)
+    fill_method = (metadata.get("training_parameters") or {}).get("fill_missing_method", None)
+    if fill_method:
+        df = fill_missing_values(df, fill_method)
+        logging.info(f"Пропущенные значения обработаны методом: {fill_method}")
+    return df
+
+def model_features(df: pd.DataFrame, metadata: dict) -> pd.DataFrame:
+    """
+    Кадр для модели: типы колонок как при обучении (feature_schema) и заполненные пропуски.
+    df не меняется — в выдачу прогноза идут исходные колонки (restore_input_columns).
+    """
+    return impute_missing_values(apply_dtype_schema(df.copy(), metadata.get("feature_schema")), metadata)
+
+def score_tabular(session_id: str, records: list) -> dict:
+    """Онлайн-скоринг записей: та же предобработка, что при прогнозе, но без чтения/записи файлов данных."""
+    metadata = load_session_metadata(session_id)
+    if not metadata:
+        raise HTTPException(status_code=404, detail="Сессия не найдена")
+    params = metadata.get("training_parameters")
+    if not params:
+        raise HTTPException(status_code=400, detail="Параметры обучения не найдены в metadata.json")
+
+    df = model_features(pd.DataFrame.from_records(records), metadata)
+
+    best_strategy = automl_manager.get_best_strategy(session_id)
+    preds, proba = best_strategy.score(df, session_id, params)
+    result = {"predictions": preds.tolist(), "probabilities": None}
+    if proba is not None:
+        proba.columns = [str(c) for c in proba.columns]
+        result["probabilities"] = proba.to_dict(orient="records")
+    return result
+
+# Конкурентные запросы /score к одной сессии объединяются в один вызов модели
+score_batcher = ScoreBatcher(score_tabular, SCORE_BATCH_WINDOW_MS, SCORE_MAX_BATCH_ROWS)
+
 def save_prediction(output, session_id):
     session_path = get_session_path(session_id)
     prediction_file_path = os.path.join(session_path, f"prediction_{session_id}.xlsx")
@@ -74,8 +221,14 @@ def save_prediction(output, session_id):
     logging.info(f"[predict_tabular] Прогноз сохранён в файл: {prediction_file_path}")
 
 @router.get("/predict/{session_id}")
-async def predict_tabular_endpoint(session_id: str):
-    """Сделать прогноз по id сессии: сохранить полный прогноз в Parquet, вернуть только 10 строк в JSON."""
+async def predict_tabular_endpoint(session_id: str, streaming: bool = False, parallel: bool = False):
+    """Сделать прогноз по id сессии: сохранить полный прогноз в Parquet, вернуть только 10 строк в JSON.
+    streaming=true — потоковый прогноз кусками (для больших файлов), прогресс в metadata.json.
+    parallel=true — то же, но куски прогнозируются пулом процессов (офлайн-скоринг на многоядерных машинах)."""
+    if parallel or streaming:
+        predict = predict_tabular_parallel if parallel else predict_tabular_streaming
+        result = await asyncio.to_thread(predict, session_id)
+        return {"prediction_head": result["prediction_head"], "rows": result["rows"]}
     preds = await asyncio.to_thread(predict_tabular, session_id)
     session_path = get_session_path(session_id)
     prediction_parquet_path = os.path.join(session_path, f"prediction_{session_id}.parquet")
@@ -84,6 +237,33 @@ async def predict_tabular_endpoint(session_id: str):
     head = preds.head(10).to_dict(orient="records")
     return {"prediction_head": head}
 
+@router.post("/score/{session_id}", response_model=ScoreResponse)
+async def score_endpoint(session_id: str, request: ScoreRequest):
+    """Низколатентный скоринг небольшого батча строк (JSON) моделью сессии из кэша предикторов."""
+    if not request.records:
+        raise HTTPException(status_code=400, detail="records не должен быть пустым")
+    if len(request.records) > SCORE_MAX_RECORDS:
+        raise HTTPException(status_code=400, detail=f"Слишком много строк: максимум {SCORE_MAX_RECORDS}")
+    start = time.perf_counter()
+    result = await score_batcher.submit(session_id, request.records)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return ScoreResponse(session_id=session_id, elapsed_ms=round(elapsed_ms, 2), **result)
+
+@router.get("/predictor_cache/stats")
+def predictor_cache_stats():
+    """Статистика кэша загруженных моделей: попадания, промахи, вытеснения, занятая память."""
+    return predictor_cache.stats()
+
+@router.get("/score_batcher/stats")
+def score_batcher_stats():
+    """Статистика микро-батчинга онлайн-скоринга: число запросов и фактических вызовов модели."""
+    return score_batcher.stats()
+
+@router.get("/parallel_scorer/stats")
+def parallel_scorer_stats():
+    """Параметры и счётчики пула процессов параллельного скоринга."""
+    return parallel_scorer.stats()
+
 @router.get("/download_prediction/{session_id}")
 def download_prediction_file(session_id: str):
     """Скачать ранее сохранённый файл прогноза по id сессии с добавлением leaderboard и параметров обучения."""
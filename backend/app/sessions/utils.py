@@ -1,11 +1,20 @@
 import os
 import json
 import shutil
-from typing import Dict, Any
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
+
 import pandas as pd
 
+from AutoML.predictor_cache import predictor_cache
+
 # Base path for all training sessions - now relative to backend/app directory
 SESSIONS_BASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "training_sessions")
 
@@ -19,12 +28,54 @@ def create_session_directory(session_id: str) -> str:
     os.makedirs(session_path, exist_ok=True)
     return session_path
 
+# Запасная блокировка metadata.json, если fcntl недоступен
+_metadata_thread_lock = threading.Lock()
+
+@contextmanager
+def _metadata_lock(session_id: str):
+    """
+    Блокировка metadata.json сессии на время чтения-изменения-записи: файл пишут процесс API,
+    процессы обучения и расчёта feature importance. Между процессами — flock на metadata.json.lock.
+    """
+    if fcntl is None:
+        with _metadata_thread_lock:
+            yield
+        return
+    with open(os.path.join(get_session_path(session_id), "metadata.json.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _write_session_metadata(session_id: str, metadata: Dict[str, Any]) -> None:
+    """Файл заменяется целиком (tmp + os.replace): читатели не видят недописанный JSON."""
+    metadata_path = os.path.join(get_session_path(session_id), "metadata.json")
+    tmp_path = f"{metadata_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2, default=str)
+    os.replace(tmp_path, metadata_path)
+
 def save_session_metadata(session_id: str, metadata: Dict[str, Any]) -> None:
     """Save session metadata to the session directory."""
-    session_path = get_session_path(session_id)
-    metadata_path = os.path.join(session_path, "metadata.json")
-    with open(metadata_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, indent=2, default=str)
+    with _metadata_lock(session_id):
+        _write_session_metadata(session_id, metadata)
+
+def update_session_metadata(session_id: str, updates: Dict[str, Any], create: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Дописывает ключи updates в metadata.json под блокировкой и возвращает итоговые метаданные.
+    В отличие от load + save, не затирает ключи, записанные за это время другим процессом.
+    Если метаданных нет и create=False, ничего не пишет и возвращает None.
+    """
+    if not create and not os.path.isdir(get_session_path(session_id)):
+        return None
+    with _metadata_lock(session_id):
+        metadata = load_session_metadata(session_id)
+        if not metadata and not create:
+            return None
+        metadata.update(updates)
+        _write_session_metadata(session_id, metadata)
+        return metadata
 
 def load_session_metadata(session_id: str) -> Dict[str, Any]:
     """Load session metadata from the session directory."""
@@ -33,7 +84,7 @@ def load_session_metadata(session_id: str) -> Dict[str, Any]:
     try:
         with open(metadata_path, "r", encoding="utf-8") as f:
             return json.load(f)
-    except FileNotFoundError:
+    except (FileNotFoundError, NotADirectoryError):
         return {}
 
 def cleanup_old_sessions(max_age_days: int = 7) -> None:
@@ -44,6 +95,9 @@ def cleanup_old_sessions(max_age_days: int = 7) -> None:
     now = datetime.now()
     for session_id in os.listdir(SESSIONS_BASE_PATH):
         session_path = get_session_path(session_id)
+        if not os.path.isdir(session_path):
+            # Служебные файлы (например, журнал заданий обучения)
+            continue
         try:
             metadata = load_session_metadata(session_id)
             create_time = datetime.fromisoformat(metadata.get("create_time", ""))
@@ -51,6 +105,7 @@ def cleanup_old_sessions(max_age_days: int = 7) -> None:
             
             if age_days > max_age_days:
                 shutil.rmtree(session_path)
+                predictor_cache.invalidate(session_path)
         except (ValueError, FileNotFoundError):
             # If we can't determine the age, leave it for manual cleanup
             pass
@@ -0,0 +1,147 @@
+import datetime
+import logging
+import re
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Строковая колонка становится категориальной, если уникальных значений не больше порога
+CATEGORY_MAX_UNIQUE = 1000
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+# Распознавание дат: размер выборки, известные форматы и дешёвый предфильтр «похоже на дату».
+# Одна реализация для файлов (optimize_dtypes) и таблиц БД (db_manager.detect_date_formats)
+DATE_SAMPLE_SIZE = 200
+DATE_PREFILTER_SIZE = 20
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%d.%m.%Y",
+    "%d.%m.%Y %H:%M:%S",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%Y/%m/%d",
+)
+# Дата без единого формата — разбирается pandas по каждому значению
+MIXED_DATE_FORMAT = "mixed"
+_DATE_LIKE = re.compile(r"^\s*\d{1,4}[-./]\d{1,2}[-./]\d{1,4}")
+
+
+def detect_date_format(values: pd.Series) -> Optional[str]:
+    """Формат дат колонки по выборке непустых значений ("mixed" — без единого формата) или None, если это не даты."""
+    sample = values.head(DATE_SAMPLE_SIZE * 5).dropna().head(DATE_SAMPLE_SIZE)
+    if sample.empty:
+        sample = values.dropna().head(DATE_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    if all(isinstance(v, (datetime.date, datetime.datetime)) for v in sample):
+        return MIXED_DATE_FORMAT
+    if not all(isinstance(v, str) for v in sample):
+        return None
+    # Дешёвая отсечка явно не-дат (текст, коды, числа) до вызова to_datetime
+    if not all(_DATE_LIKE.match(v) for v in sample.head(DATE_PREFILTER_SIZE)):
+        return None
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all():
+            return fmt
+    if pd.to_datetime(sample, format=MIXED_DATE_FORMAT, errors='coerce').notna().all():
+        return MIXED_DATE_FORMAT
+    return None
+
+
+def _lossless_float32(values: pd.Series) -> bool:
+    as_float32 = values.astype(np.float32)
+    return bool(((as_float32 == values) | values.isna()).all())
+
+
+def optimize_dtypes(df: pd.DataFrame, exclude: Iterable[str] = ()) -> Tuple[pd.DataFrame, Dict[str, Dict[str, Any]]]:
+    """
+    Сужает типы колонок обучающего кадра (на месте, без копии кадра):
+      - целые — до минимального целого типа, вмещающего значения;
+      - float64 — до float32, если значения представимы без потерь;
+      - строки с датами — в datetime64 по распознанному формату (разбираются один раз);
+      - строки с небольшим числом уникальных значений — в category.
+    Колонки из exclude (например, целевая) не трогаются.
+    Возвращает (df, schema), schema сохраняется в метаданных сессии и применяется при прогнозе.
+    """
+    exclude = set(exclude)
+    schema: Dict[str, Dict[str, Any]] = {}
+    memory_before = df.memory_usage(deep=True).sum()
+    n_rows = max(len(df), 1)
+    for col in df.columns:
+        if col in exclude:
+            continue
+        values = df[col]
+        if pd.api.types.is_bool_dtype(values):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            df[col] = pd.to_numeric(values, downcast='integer')
+            schema[col] = {"kind": "integer", "dtype": str(df[col].dtype)}
+        elif pd.api.types.is_float_dtype(values):
+            if values.dtype == np.float64 and _lossless_float32(values):
+                df[col] = values.astype(np.float32)
+            schema[col] = {"kind": "float", "dtype": str(df[col].dtype)}
+        elif pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+            date_format = detect_date_format(values)
+            if date_format is not None:
+                converted = pd.to_datetime(values, format=date_format, errors='coerce')
+                # Конвертируем, только если разобрались все непустые значения
+                if (converted.notna() | values.isna()).all():
+                    df[col] = converted
+                    schema[col] = {"kind": "datetime", "dtype": "datetime64[ns]", "format": date_format}
+                    continue
+            n_unique = values.nunique(dropna=True)
+            if n_unique <= CATEGORY_MAX_UNIQUE and n_unique / n_rows <= CATEGORY_MAX_UNIQUE_RATIO:
+                df[col] = values.astype('category')
+                schema[col] = {"kind": "category", "dtype": "category"}
+            else:
+                schema[col] = {"kind": "string", "dtype": "object"}
+    memory_after = df.memory_usage(deep=True).sum()
+    logging.info(
+        f"[optimize_dtypes] Память кадра: {memory_before / 1024 / 1024:.1f} MB -> {memory_after / 1024 / 1024:.1f} MB"
+    )
+    return df, schema
+
+
+def apply_dtype_schema(df: pd.DataFrame, schema: Optional[Dict[str, Dict[str, Any]]]) -> pd.DataFrame:
+    """
+    Приводит кадр для прогноза к схеме, выбранной при обучении: даты разбираются тем же форматом,
+    категориальные колонки становятся category. Числа только сужаются, если значения помещаются в тип.
+    """
+    if not schema:
+        return df
+    for col, spec in schema.items():
+        if col not in df.columns:
+            continue
+        kind = spec.get("kind")
+        try:
+            if kind == "datetime":
+                if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                    df[col] = pd.to_datetime(df[col], format=spec.get("format"), errors='coerce')
+            elif kind == "category":
+                df[col] = df[col].astype('category')
+            elif kind in ("integer", "float"):
+                numeric = pd.to_numeric(df[col], errors='coerce')
+                target_dtype = np.dtype(spec["dtype"])
+                if kind == "integer" and numeric.notna().all():
+                    info = np.iinfo(target_dtype)
+                    if numeric.min() >= info.min and numeric.max() <= info.max:
+                        numeric = numeric.astype(target_dtype)
+                elif kind == "float":
+                    numeric = numeric.astype(target_dtype)
+                df[col] = numeric
+        except (TypeError, ValueError) as e:
+            logging.warning(f"[apply_dtype_schema] Не удалось привести колонку '{col}' к {spec}: {e}")
+    return df
+
+
+def restore_input_columns(result: pd.DataFrame, original: pd.DataFrame) -> pd.DataFrame:
+    """
+    Возвращает в result колонки исходного кадра с исходными типами и значениями: суженные для модели типы
+    (category, float32) не должны попадать в выдачу прогноза и в БД. Строки result и original — в одном порядке.
+    """
+    for col in original.columns:
+        if col in result.columns:
+            result[col] = original[col].set_axis(result.index)
+    return result
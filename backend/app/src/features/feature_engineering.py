@@ -1,37 +1,93 @@
-import pandas as pd
-import streamlit as st
 import logging
+from typing import Any, Dict, Optional
 
+import numpy as np
+import pandas as pd
 
-def fill_missing_values(df: pd.DataFrame, method: str = "None") -> pd.DataFrame:
+
+def _column_modes(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Мода каждой колонки без сортировки значений: коды pd.factorize (или коды category) + np.bincount.
+    При равенстве частот берётся значение, встретившееся первым.
+    """
+    modes = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        codes = codes[codes >= 0]
+        if len(codes) == 0:
+            continue
+        modes[col] = uniques[int(np.bincount(codes, minlength=len(uniques)).argmax())]
+    return modes
+
+
+def _to_builtin(value: Any) -> Any:
+    """numpy-скаляры -> встроенные типы Python (для сохранения в metadata.json)."""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class MissingValuesImputer:
     """
-    Заполняет пропущенные значения в числовых столбцах выбранным методом,
-    а в нечисловых (категориальных) всегда модой.
-      - "Constant=0": NaN -> 0 (числовые)
-      - "Mean": заполнение средним значением (числовые)
-      - "Median": заполнение медианой (числовые)
-      - "Mode": заполнение модой (числовые)
-      - "None": без изменений (числовые)
+    Заполнение пропусков с раздельными fit/transform: статистики считаются один раз на обучающих данных,
+    сохраняются в метаданных сессии и применяются при прогнозе без пересчёта по тестовым данным.
+    Нечисловые (категориальные) колонки всегда заполняются модой, числовые — выбранным методом:
+      - "Constant=0": NaN -> 0
+      - "Mean": среднее
+      - "Median": медиана
+      - "Mode": мода
+      - "None": без изменений
     """
-    numeric_cols = df.select_dtypes(include=["float", "int"]).columns
-    categorical_cols = df.select_dtypes(include=["object", "category"]).columns
 
-    # Всегда заполняем нечисловые модой
-    for col in categorical_cols:
-        mode = df[col].mode()
-        if not mode.empty:
-            df[col] = df[col].fillna(mode.iloc[0])
+    def __init__(self, method: Optional[str] = "None", fill_values: Optional[Dict[str, Any]] = None):
+        self.method = method or "None"
+        self.fill_values: Dict[str, Any] = dict(fill_values or {})
 
-    if method == "None":
+    def fit(self, df: pd.DataFrame) -> "MissingValuesImputer":
+        numeric_cols = df.select_dtypes(include=["float", "int"]).columns
+        categorical_cols = df.select_dtypes(include=["object", "category"]).columns
+
+        fill_values = _column_modes(df[categorical_cols])
+        if self.method == "Constant=0":
+            fill_values.update({col: 0 for col in numeric_cols})
+        elif self.method == "Mean":
+            fill_values.update(df[numeric_cols].mean().dropna().to_dict())
+        elif self.method == "Median":
+            fill_values.update(df[numeric_cols].median().dropna().to_dict())
+        elif self.method == "Mode":
+            fill_values.update(_column_modes(df[numeric_cols]))
+        self.fill_values = {col: _to_builtin(value) for col, value in fill_values.items()}
+        return self
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Заполняет пропуски сохранёнными значениями одним вызовом fillna."""
+        fill_values = {col: value for col, value in self.fill_values.items() if col in df.columns}
+        for col, value in fill_values.items():
+            # В category можно записать только существующую категорию
+            if isinstance(df[col].dtype, pd.CategoricalDtype) and value not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories([value])
+        if fill_values:
+            df = df.fillna(fill_values)
         return df
-    elif method == "Constant=0":
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-    elif method == "Mean":
-        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
-    elif method == "Median":
-        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
-    elif method == "Mode":
-        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mode().iloc[0])
-    
-    return df
 
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.fit(df).transform(df)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"method": self.method, "fill_values": self.fill_values}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MissingValuesImputer":
+        return cls(data.get("method"), data.get("fill_values"))
+
+
+def fill_missing_values(df: pd.DataFrame, method: str = "None") -> pd.DataFrame:
+    """
+    Заполняет пропуски статистиками, посчитанными по самому df (fit + transform).
+    Для прогноза используйте MissingValuesImputer, обученный на тренировочных данных.
+    """
+    imputer = MissingValuesImputer(method).fit(df)
+    logging.debug(f"[fill_missing_values] Значения заполнения: {imputer.fill_values}")
+    return imputer.transform(df)
@@ -7,25 +7,28 @@ import os
 import json
 import uuid
 import asyncio
-from functools import partial
 from typing import Dict, Optional
 from datetime import datetime
 from io import BytesIO
 
 from db.db_manager import upload_df_to_db
 from db.jwt_logic import get_current_user_db_creds
-from db.db_manager import auto_convert_dates
+from db.db_manager import auto_convert_dates, detect_date_formats
 from prediction.router import save_prediction
 from training.model import TrainingParameters
-from training.router import train_model, get_training_status, prepare_training_data_and_status, optional_oauth2_scheme
+from training.router import get_training_status, prepare_training_data_and_status, optional_oauth2_scheme
+from training.executor import training_executor
+from training.cancellation import TrainingCancelled
 from sessions.utils import (
     create_session_directory,
     save_session_metadata,
+    update_session_metadata,
+    load_session_metadata,
     cleanup_old_sessions,
     get_model_path,
     training_sessions
 )
-from prediction.router import predict_tabular
+from prediction.router import predict_tabular_streaming
 # Global training status tracking
 
 # Run cleanup of old sessions at startup
@@ -35,12 +38,13 @@ router = APIRouter()
 
 async def run_training_prediction_async(
     session_id: str,
-    df_train: pd.DataFrame,
+    train_path: str,
     training_params: TrainingParameters,
     original_filename: str,
     token: str
 ):
-    """Асинхронный запуск процесса обучения и (опционально) прогноза с сохранением в БД для табличных данных."""
+    """Асинхронный запуск процесса обучения и (опционально) прогноза с сохранением в БД для табличных данных.
+    train_path — train.parquet сессии; обучающий кадр читается только в процессе обучения."""
     try:
         logging.info(f"[run_training_prediction_async] Запуск обучения для session_id={session_id}, файл: {original_filename}")
         session_path = create_session_directory(session_id)
@@ -63,47 +67,40 @@ async def run_training_prediction_async(
             'training': 40,
             'metadata': 50
         }
-        train_func = partial(
-            train_model,
-            df_train=df_train,
-            training_params=training_params,
-            model_path=get_model_path(session_id),
-            session_id=session_id,
-            text_to_progress=text_to_progress
-        )
-        logging.info(f"[run_training_prediction_async] Передача задачи обучения в пул потоков...")
-        await asyncio.to_thread(train_func)
+        logging.info(f"[run_training_prediction_async] Передача задачи обучения в исполнитель обучений...")
+        await training_executor.run(session_id, train_path, training_params, text_to_progress)
 
-        status.update({
+        # Процесс обучения дописал в metadata.json (схема признаков и т.п.) — дописываем, не затирая эти данные
+        status = update_session_metadata(session_id, {
             "status": "Обучение окончено. Начинаем прогноз",
             "end_time": datetime.now().isoformat(),
             "progress": 60,
             "model_path": get_model_path(session_id),
             "training_parameters": training_params.model_dump()
-        })
-        save_session_metadata(session_id, status)
+        }, create=True)
         training_sessions[session_id] = status
         logging.info(f"[run_training_prediction_async] Обучение завершено успешно для session_id={session_id}")
 
-        # 2. Прогноз
-        prediction_df = await asyncio.to_thread(predict_tabular, session_id)
-        prediction_parquet_path = os.path.join(session_path, f"prediction_{session_id}.parquet")
-        prediction_df.to_parquet(prediction_parquet_path, index=False)
+        # 2. Прогноз: потоково, кусками, прямо в prediction_{session_id}.parquet
+        prediction_result = await asyncio.to_thread(predict_tabular_streaming, session_id)
+        prediction_parquet_path = prediction_result["prediction_file"]
         # Restore prediction_head logic: save first 10 rows for preview
-        prediction_head = prediction_df.head(10).to_dict(orient="records")
+        prediction_head = prediction_result["prediction_head"]
         # --- АТОМАРНОЕ обновление статуса: только после формирования prediction_head ---
-        status["prediction_file"] = prediction_parquet_path
-        status["prediction_head"] = prediction_head
-        status["progress"] = 100
-        status["status"] = "completed"
-        save_session_metadata(session_id, status)
+        status = update_session_metadata(session_id, {
+            "prediction_file": prediction_parquet_path,
+            "prediction_head": prediction_head,
+            "progress": 100,
+            "status": "completed",
+        }, create=True)
         training_sessions[session_id] = status
         logging.info(f"[run_training_prediction_async] Прогноз завершен и сохранен для session_id={session_id}")
 
         # 3. (опционально) Сохранение в БД, если требуется
         if getattr(training_params, 'upload_table_name', None):
             logging.info(f"[run_training_prediction_async] Начинается сохранение прогноза в БД для session_id={session_id}")
-            preds = prediction_df
+            # Для загрузки в БД прогноз читается с диска целиком
+            preds = pd.read_parquet(prediction_parquet_path)
             table_name = getattr(training_params, 'upload_table_name')
             schema = getattr(training_params, 'upload_table_schema', None)
             db_creds = None
@@ -113,24 +110,29 @@ async def run_training_prediction_async(
                 raise ValueError("Не передан токен для получения учетных данных БД")
             username = db_creds["username"]
             password = db_creds["password"]
-            preds = auto_convert_dates(preds)
+            # Решения о датах сохраняются в сессии: повторная выгрузка не распознаёт даты заново
+            status = update_session_metadata(session_id, {
+                "date_formats": detect_date_formats(preds, status.get("date_formats"))
+            }, create=True)
+            preds = auto_convert_dates(preds, status["date_formats"])
             if schema:
                 await upload_df_to_db(preds, schema, table_name, username, password)
             else:
                 await upload_df_to_db(preds, table_name, username, password)
             logging.info(f"[run_training_prediction_async] Прогноз успешно загружен в таблицу '{table_name}' базы данных (схема: {schema}).")
 
+    except TrainingCancelled:
+        # Статус cancelled и очистку артефактов записал исполнитель обучений
+        logging.info(f"[run_training_prediction_async] Обучение отменено для session_id={session_id}")
+        training_sessions[session_id] = load_session_metadata(session_id) or training_sessions.get(session_id, {})
     except Exception as e:
         error_msg = str(e)
         logging.error(f"[run_training_prediction_async] Ошибка обучения/прогноза в сессии {session_id}: {error_msg}", exc_info=True)
-        status = training_sessions[session_id]
-        status.update({
+        training_sessions[session_id] = update_session_metadata(session_id, {
             "status": "failed",
             "error": error_msg,
             "end_time": datetime.now().isoformat()
-        })
-        save_session_metadata(session_id, status)
-        training_sessions[session_id] = status
+        }, create=True)
 
 
 def save_df_to_parquet(df, path):
@@ -161,21 +163,29 @@ async def train_model_endpoint(
         training_params = TrainingParameters(**params_dict)
         logging.info(f"[train_model_endpoint] Параметры обучения для session_id={session_id}: {params_dict}")
 
+        # Для загрузки датасета из БД нужны учетные данные пользователя из токена
+        db_creds = None
+        if train_file is None and training_params.download_table_name:
+            if token is None:
+                raise HTTPException(status_code=401, detail="Для обучения на таблице из БД требуется авторизация")
+            db_creds = await get_current_user_db_creds(token)
+
         # Используем общую функцию подготовки данных и статуса
-        df_train, training_params, session_path, status = prepare_training_data_and_status(
+        train_path, training_params, session_path, status = await prepare_training_data_and_status(
             params,
             train_file,
             test_file,
-            session_id
+            session_id,
+            db_creds=db_creds
         )
-        original_filename = train_file.filename if train_file else None
+        original_filename = train_file.filename if train_file else status['download_table']
         logging.info(f"[train_model_endpoint] Статус сессии и метаданные сохранены для session_id={session_id}")
 
         # Start async training
         background_tasks.add_task(
             run_training_prediction_async,
             session_id,
-            df_train,
+            train_path,
             training_params,
             original_filename,
             token
@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import json
 from fastapi import APIRouter, HTTPException
@@ -11,6 +12,7 @@ from typing import Optional, List, Dict
 
 from training.model import TrainingParameters
 from train_prediciton_save.router import run_training_prediction_async
+from training.ingestion import excel_to_parquet, parquet_num_rows
 from sessions.utils import (
     create_session_directory,
     get_model_path,
@@ -79,21 +81,27 @@ async def train_predict_base64(request: TrainPredictRequest):
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Ошибка декодирования base64: {str(e)}")
         
-        # Загружаем данные для обучения
+        # Создаем сессию
+        session_path = create_session_directory(session_id)
+
+        # Обучающий файл сразу пишем на диск и конвертируем в train.parquet — в памяти API он не держится
+        train_file_path = os.path.join(session_path, f"train_{session_id}.xlsx")
+        with open(train_file_path, "wb") as f:
+            f.write(train_file_bytes)
+        del train_file_bytes
+        train_path = os.path.join(session_path, "train.parquet")
         try:
-            df_train = pd.read_excel(io.BytesIO(train_file_bytes))
-            df_predict = pd.read_excel(io.BytesIO(predict_file_bytes))
+            # Разбор Excel — в потоке, event loop API не блокируется
+            await asyncio.to_thread(excel_to_parquet, train_file_path, train_path)
+            df_predict = await asyncio.to_thread(pd.read_excel, io.BytesIO(predict_file_bytes))
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Ошибка чтения Excel файлов: {str(e)}")
-        
-        logging.info(f"[train_predict_base64] Файлы загружены. Train shape: {df_train.shape}, Predict shape: {df_predict.shape}")
-        
-        # Создаем сессию
-        session_path = create_session_directory(session_id)
-        
+
+        logging.info(f"[train_predict_base64] Файлы загружены. Train rows: {parquet_num_rows(train_path)}, Predict shape: {df_predict.shape}")
+
         # Сохраняем файл для прогноза в сессии (используем префикс test_ для совместимости)
         predict_file_path = os.path.join(session_path, f"test_{session_id}.xlsx")
-        df_predict.to_excel(predict_file_path, index=False)
+        await asyncio.to_thread(df_predict.to_excel, predict_file_path, index=False)
         
         # Инициализируем статус сессии
         training_sessions[session_id] = {
@@ -106,7 +114,7 @@ async def train_predict_base64(request: TrainPredictRequest):
         # Запускаем обучение и прогноз синхронно (без background task)
         await run_training_prediction_async(
             session_id=session_id,
-            df_train=df_train,
+            train_path=train_path,
             training_params=training_params,
             original_filename="train_file.xlsx",
             token=None  # Для этого эндпоинта не требуется токен
@@ -0,0 +1,17 @@
+
+class TrainingCancelled(Exception):
+    """Обучение отменено пользователем (POST /cancel_training)."""
+
+
+# В процессе обучения: событие «остановиться после текущей модели», выставляется исполнителем обучений
+_stop_event = None
+
+
+def set_stop_event(event) -> None:
+    global _stop_event
+    _stop_event = event
+
+
+def stop_requested() -> bool:
+    """Просили ли остановить обучение, сохранив уже обученные модели (отмена с keep_best)."""
+    return _stop_event is not None and _stop_event.is_set()
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+# Сколько последних событий хранится по сессии (их получает клиент, подключившийся позже) и сколько сессий в памяти
+TRAINING_EVENTS_BUFFER = int(os.getenv("TRAINING_EVENTS_BUFFER", "500"))
+TRAINING_EVENTS_MAX_SESSIONS = int(os.getenv("TRAINING_EVENTS_MAX_SESSIONS", "1000"))
+# Интервал heartbeat SSE-потока (секунды): позиция в очереди и время с начала обучения
+TRAINING_SSE_HEARTBEAT_SECONDS = float(os.getenv("TRAINING_SSE_HEARTBEAT_SECONDS", "5"))
+
+# После этих событий по сессии больше ничего не придёт — поток закрывается
+TERMINAL_EVENTS = (
+    "training_failed",
+    "training_cancelled",
+    "feature_importance_completed",
+    "feature_importance_failed",
+    "feature_importance_cancelled",
+)
+
+
+class TrainingEventBus:
+    """
+    Шина событий обучения в памяти процесса API. События приходят из процессов обучения через pipe исполнителя
+    (потоки TrainingExecutor) и рассылаются подписчикам SSE в их event loop. По каждой сессии хранится
+    кольцевой буфер последних событий, чтобы клиент, подключившийся посреди обучения, получил историю.
+    """
+
+    def __init__(self, buffer_size: int, max_sessions: int):
+        self.buffer_size = buffer_size
+        self.max_sessions = max_sessions
+        self._events: "OrderedDict[str, Deque[Dict[str, Any]]]" = OrderedDict()
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self.published = 0
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        session_id = event["session_id"]
+        with self._lock:
+            self._seq += 1
+            event["seq"] = self._seq
+            events = self._events.get(session_id)
+            if events is None:
+                events = self._events[session_id] = deque(maxlen=self.buffer_size)
+            self._events.move_to_end(session_id)
+            events.append(event)
+            while len(self._events) > self.max_sessions:
+                self._events.popitem(last=False)
+            subscribers = list(self._subscribers.get(session_id, ()))
+            self.published += 1
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # Event loop подписчика уже закрыт
+                pass
+
+    def subscribe(self, session_id: str) -> Tuple[asyncio.Queue, List[Dict[str, Any]]]:
+        """Подписка на события сессии. Возвращает (очередь новых событий, история) без пропусков и повторов."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append((asyncio.get_running_loop(), queue))
+            history = list(self._events.get(session_id, ()))
+        return queue, history
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(session_id, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[session_id] = subscribers
+            else:
+                self._subscribers.pop(session_id, None)
+
+    def knows(self, session_id: str) -> bool:
+        """Есть ли события сессии в этом процессе (в другом воркере uvicorn их нет)."""
+        with self._lock:
+            return session_id in self._events
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._events),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "published": self.published,
+            }
+
+
+training_event_bus = TrainingEventBus(TRAINING_EVENTS_BUFFER, TRAINING_EVENTS_MAX_SESSIONS)
+
+# В процессе обучения события уходят в pipe исполнителя, а не в шину (её подписчики живут в процессе API)
+_event_sink = None
+_event_sink_lock = threading.Lock()
+
+
+def set_event_sink(conn) -> None:
+    """Вызывается в процессе задания: события отправляются родителю через conn."""
+    global _event_sink
+    _event_sink = conn
+
+
+def emit_event(session_id: str, event_type: str, **data: Any) -> None:
+    """Публикует событие обучения: в шину процесса API или, в процессе задания, родителю через pipe."""
+    event = {"session_id": session_id, "type": event_type, "time": time.time(), **data}
+    if _event_sink is None:
+        training_event_bus.publish(event)
+        return
+    with _event_sink_lock:
+        try:
+            _event_sink.send(("event", event))
+        except (OSError, ValueError) as e:
+            logging.debug(f"[emit_event] Событие {event_type} не отправлено: {e}")
+
+
+class AutoGluonLogHandler(logging.Handler):
+    """
+    Превращает строки лога AutoGluon о моделях в события: model_started, model_finished (оценка на валидации
+    и время обучения), model_failed. Каждое событие несёт время с начала fit и лимит training_time_limit.
+    """
+
+    FIT_START = re.compile(r"^Fitting model: (\S+)")
+    VALIDATION_SCORE = re.compile(r"^\s*(-?\d+(?:\.\d+)?(?:e-?\d+)?)\s+= Validation score")
+    TRAINING_RUNTIME = re.compile(r"^\s*(\d+(?:\.\d+)?)s\s+= Training\s+runtime")
+    FIT_FAILED = re.compile(r"Exception caused (\S+) to fail during training")
+
+    def __init__(self, session_id: str, time_limit: Optional[float]):
+        super().__init__()
+        self.session_id = session_id
+        self.time_limit = time_limit
+        self.started = time.monotonic()
+        self.models_finished = 0
+        self._model: Optional[str] = None
+        self._score: Optional[float] = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            for line in record.getMessage().splitlines():
+                self._parse(line)
+        except Exception:
+            self.handleError(record)
+
+    def _parse(self, line: str) -> None:
+        match = self.FIT_START.match(line)
+        if match:
+            self._model, self._score = match.group(1), None
+            self._event("model_started", model=self._model)
+            return
+        match = self.VALIDATION_SCORE.match(line)
+        if match and self._model:
+            self._score = float(match.group(1))
+            return
+        match = self.TRAINING_RUNTIME.match(line)
+        if match and self._model:
+            self.models_finished += 1
+            self._event("model_finished", model=self._model, score_val=self._score, fit_time=float(match.group(1)))
+            self._model = None
+            return
+        match = self.FIT_FAILED.search(line)
+        if match:
+            self._event("model_failed", model=match.group(1))
+            self._model = None
+
+    def _event(self, event_type: str, **data: Any) -> None:
+        elapsed = time.monotonic() - self.started
+        emit_event(
+            self.session_id,
+            event_type,
+            elapsed_seconds=round(elapsed, 1),
+            time_limit=self.time_limit,
+            time_used_percent=round(100 * elapsed / self.time_limit, 1) if self.time_limit else None,
+            models_finished=self.models_finished,
+            **data,
+        )
+
+
+def _format_sse(event: Dict[str, Any]) -> str:
+    lines = f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+    if "seq" in event:
+        lines = f"id: {event['seq']}\n" + lines
+    return lines
+
+
+def _is_finished(snapshot: Dict[str, Any]) -> bool:
+    """Снимок состояния сессии, после которого событий уже не будет."""
+    fi_state = (snapshot.get("feature_importance_status") or {}).get("status")
+    return snapshot.get("queue_position") is None and (
+        snapshot.get("status") in ("failed", "cancelled")
+        or (snapshot.get("status") == "completed" and fi_state in (None, "completed", "failed", "cancelled"))
+    )
+
+
+async def stream_training_events(
+    session_id: str,
+    snapshot: Callable[[], Dict[str, Any]],
+    queue_position: Callable[[], Optional[int]],
+) -> AsyncIterator[str]:
+    """
+    SSE-поток событий обучения: снимок состояния, история событий из буфера, затем новые события по мере
+    поступления. При простое каждые TRAINING_SSE_HEARTBEAT_SECONDS отправляется heartbeat с позицией в очереди
+    и временем с начала обучения. snapshot() — состояние из metadata.json; читается при подключении,
+    а в heartbeat — только если события сессии идут в другом процессе API.
+    """
+    queue, history = training_event_bus.subscribe(session_id)
+    started_at = None
+    try:
+        state = await asyncio.to_thread(snapshot)
+        yield _format_sse({"session_id": session_id, "type": "snapshot", "time": time.time(), **state})
+        for event in history:
+            if event["type"] == "job_started" and event.get("kind") == "train":
+                started_at = event["time"]
+            yield _format_sse(event)
+            if event["type"] in TERMINAL_EVENTS:
+                return
+        if _is_finished(state):
+            return
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=TRAINING_SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if training_event_bus.knows(session_id):
+                    heartbeat = {"queue_position": await asyncio.to_thread(queue_position)}
+                    if started_at is not None:
+                        heartbeat["elapsed_seconds"] = round(time.time() - started_at, 1)
+                else:
+                    heartbeat = await asyncio.to_thread(snapshot)
+                yield _format_sse({"session_id": session_id, "type": "heartbeat", "time": time.time(), **heartbeat})
+                if not training_event_bus.knows(session_id) and _is_finished(heartbeat):
+                    return
+                continue
+            if event["type"] == "job_started" and event.get("kind") == "train":
+                started_at = event["time"]
+            yield _format_sse(event)
+            if event["type"] in TERMINAL_EVENTS:
+                return
+    finally:
+        training_event_bus.unsubscribe(session_id, queue)
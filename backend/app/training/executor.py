@@ -0,0 +1,506 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sessions.utils import get_model_path, get_session_path, load_session_metadata, update_session_metadata
+from .cancellation import TrainingCancelled, set_stop_event
+from .events import emit_event, set_event_sink, training_event_bus
+from .job_queue import JobQueue, job_queue, current_worker_id
+from .result_cache import TRAINING_CACHE_ENABLED, TrainingResultCache, training_fingerprint, training_result_cache
+
+# Сколько обучений AutoGluon может идти одновременно в одном процессе API (каждое — в отдельном процессе)
+TRAINING_MAX_WORKERS = int(os.getenv("TRAINING_MAX_WORKERS", "2"))
+# Бюджет ресурсов одного обучения: ядра CPU и память (ГБ, 0 — на усмотрение AutoGluon)
+TRAINING_CPUS_PER_JOB = int(os.getenv("TRAINING_CPUS_PER_JOB", str(max(1, (os.cpu_count() or 1) // TRAINING_MAX_WORKERS))))
+TRAINING_MEMORY_LIMIT_GB = float(os.getenv("TRAINING_MEMORY_LIMIT_GB", "0"))
+# Heartbeat заданий и восстановление осиротевших заданий
+TRAINING_HEARTBEAT_SECONDS = float(os.getenv("TRAINING_HEARTBEAT_SECONDS", "10"))
+TRAINING_JOB_STALE_SECONDS = float(os.getenv("TRAINING_JOB_STALE_SECONDS", "60"))
+TRAINING_JOB_MAX_ATTEMPTS = int(os.getenv("TRAINING_JOB_MAX_ATTEMPTS", "2"))
+
+# Отложенный расчёт feature importance ставится в ту же очередь с меньшим приоритетом, чем обучения
+FEATURE_IMPORTANCE_PRIORITY = int(os.getenv("FEATURE_IMPORTANCE_PRIORITY", "100"))
+
+# Переменные окружения, ограничивающие число потоков BLAS/OpenMP в процессе обучения
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+LOG_PATH = os.path.join("logs", "app.log")
+
+
+def _setup_worker_process(resources: dict, conn) -> None:
+    """Лимит потоков BLAS/OpenMP, логирование в общий файл и отправка событий родителю для spawn-процесса задания."""
+    set_event_sink(conn)
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(resources["num_cpus"])
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[logging.FileHandler(LOG_PATH, encoding='utf-8')],
+    )
+
+
+def set_feature_importance_status(session_id: str, state: str, error: Optional[str] = None) -> None:
+    """Состояние отложенного расчёта feature importance в metadata.json: queued | running | completed | failed | cancelled."""
+    status = {"status": state, "updated_at": datetime.now().isoformat(), "error": error}
+    if update_session_metadata(session_id, {"feature_importance_status": status}) is None:
+        return
+    emit_event(session_id, f"feature_importance_{state}", error=error)
+
+
+def _training_worker(session_id: str, train_path: str, params_dict: dict, text_to_progress: dict, resources: dict, conn, stop_event) -> None:
+    """Точка входа процесса обучения: читает train.parquet и вызывает train_model."""
+    _setup_worker_process(resources, conn)
+    set_stop_event(stop_event)
+    try:
+        import pandas as pd
+        from training.model import TrainingParameters
+        from training.router import train_model
+        from sessions.utils import get_model_path
+
+        df_train = pd.read_parquet(train_path)
+        train_model(
+            df_train=df_train,
+            training_params=TrainingParameters(**params_dict),
+            model_path=get_model_path(session_id),
+            session_id=session_id,
+            text_to_progress=text_to_progress,
+            resources=resources,
+        )
+        conn.send(("ok", None))
+    except Exception as e:
+        logging.error(f"[_training_worker] Ошибка обучения в процессе для session_id={session_id}: {e}", exc_info=True)
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+def _feature_importance_worker(session_id: str, train_path: str, params_dict: dict, resources: dict, conn) -> None:
+    """
+    Точка входа процесса feature importance: обучающие данные приводятся к виду, в котором на них обучалась
+    модель (схема типов и импьютер из metadata.json), и стратегии считают важность признаков.
+    """
+    _setup_worker_process(resources, conn)
+    try:
+        import pandas as pd
+        from AutoML.manager import automl_manager
+        from src.data.type_optimization import apply_dtype_schema
+        from src.features.feature_engineering import MissingValuesImputer
+        from training.model import TrainingParameters
+
+        set_feature_importance_status(session_id, "running")
+        metadata = load_session_metadata(session_id) or {}
+        df = apply_dtype_schema(pd.read_parquet(train_path), metadata.get("feature_schema"))
+        if metadata.get("imputer") is not None:
+            df = MissingValuesImputer.from_dict(metadata["imputer"]).transform(df)
+        training_params = TrainingParameters(**params_dict)
+        for strategy in automl_manager.get_strategies():
+            strategy.compute_feature_importance(df, training_params, session_id)
+        set_feature_importance_status(session_id, "completed")
+        conn.send(("ok", None))
+    except Exception as e:
+        logging.error(f"[_feature_importance_worker] Ошибка расчёта feature importance для session_id={session_id}: {e}", exc_info=True)
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+
+def _kill_process_tree(pid: int) -> None:
+    """Убивает процесс задания вместе с дочерними (воркеры ray/joblib при бэггинге AutoGluon)."""
+    import psutil
+
+    try:
+        parent = psutil.Process(pid)
+    except psutil.NoSuchProcess:
+        return
+    processes = parent.children(recursive=True) + [parent]
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=10)
+
+
+def _process_create_time(pid: int) -> float:
+    import psutil
+
+    return psutil.Process(pid).create_time()
+
+
+def _stop_orphan_process(job: Dict[str, Any]) -> bool:
+    """
+    Останавливает процесс осиротевшего задания: процессы заданий не daemon и переживают падение воркера API,
+    а повторный запуск писал бы в ту же папку сессии параллельно с ними.
+    Возвращает False, если процесс остановить не удалось и задание пока нельзя перезапускать.
+    """
+    pid = job.get("pid")
+    if not pid or (job.get("worker_id") or "").rsplit(":", 1)[0] != socket.gethostname():
+        # Процесс не запускался или выполнялся на другой машине — проверить его отсюда нельзя
+        return True
+    import psutil
+
+    try:
+        process = psutil.Process(pid)
+        # После перезапуска машины pid мог достаться постороннему процессу
+        if abs(process.create_time() - (job.get("pid_created_at") or 0)) > 1:
+            return True
+    except psutil.NoSuchProcess:
+        return True
+    logging.warning(
+        f"[TrainingExecutor] Процесс осиротевшего задания {job['kind']} session_id={job['session_id']} (pid={pid}) ещё работает — останавливаем"
+    )
+    _kill_process_tree(pid)
+    return not process.is_running()
+
+
+def _discard_model_artifacts(session_id: str) -> None:
+    """Удаляет частично обученные модели отменённой сессии (загруженные данные остаются для повторного обучения)."""
+    from AutoML.manager import automl_manager
+
+    for strategy in automl_manager.get_strategies():
+        try:
+            strategy.discard_artifacts(session_id)
+        except Exception as e:
+            logging.warning(f"[_discard_model_artifacts] Не удалось удалить артефакты {strategy.name} для session_id={session_id}: {e}")
+    leaderboard_path = os.path.join(get_session_path(session_id), "leaderboard.csv")
+    if os.path.exists(leaderboard_path):
+        os.remove(leaderboard_path)
+    shutil.rmtree(get_model_path(session_id), ignore_errors=True)
+
+
+class TrainingExecutor:
+    """
+    Исполнитель обучений поверх персистентной очереди JobQueue.
+    Забирает задания из очереди (по priority, затем FIFO) и держит не более max_workers
+    одновременных spawn-процессов обучения со своим бюджетом CPU/памяти, поэтому event loop API
+    не делит с ними GIL. Задания переживают перезапуск API: осиротевшие задания без heartbeat
+    возвращаются в очередь или помечаются failed.
+    """
+
+    def __init__(self, queue: JobQueue, max_workers: int, cpus_per_job: int, memory_limit_gb: float, result_cache: TrainingResultCache):
+        self.queue = queue
+        self.result_cache = result_cache
+        self.max_workers = max_workers
+        self.worker_id = current_worker_id()
+        self.resources = {"num_cpus": cpus_per_job, "num_gpus": 0}
+        if memory_limit_gb > 0:
+            self.resources["memory_limit"] = memory_limit_gb
+        self._ctx = multiprocessing.get_context("spawn")
+        self._running: Dict[str, Dict[str, Any]] = {}  # job_id -> job
+        self._processes: Dict[str, Any] = {}  # job_id -> (процесс задания, событие остановки)
+        self._killed: set = set()  # job_id заданий, убитых по отмене
+        self._waiters: Dict[str, Future] = {}  # job_id -> Future ожидающего корутина в этом процессе
+        self._cond = threading.Condition()
+        self._started = False
+
+    def start(self) -> None:
+        """Восстанавливает осиротевшие задания и запускает диспетчер и heartbeat (вызывается при старте API)."""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        self._recover_orphans()
+        threading.Thread(target=self._dispatch_loop, name="training-dispatcher", daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name="training-heartbeat", daemon=True).start()
+
+    def submit(
+        self,
+        session_id: str,
+        train_path: str,
+        training_params: Any,
+        text_to_progress: dict,
+        priority: int = 0,
+        fingerprint: Optional[str] = None,
+    ) -> Future:
+        """Ставит обучение в очередь. Меньшее значение priority — раньше в очереди.
+        fingerprint — ключ кэша результатов, под которым сохраняются модели успешного обучения."""
+        payload = {
+            "train_path": train_path,
+            "params": training_params.model_dump(),
+            "text_to_progress": text_to_progress,
+            "fingerprint": fingerprint,
+        }
+        job_id = self.queue.enqueue(session_id, payload, priority=priority)
+        with self._cond:
+            future = self._waiters.get(job_id)
+            if future is None:
+                future = self._waiters[job_id] = Future()
+            self._cond.notify_all()
+        self.start()
+        position = self.queue_position(session_id)
+        emit_event(session_id, "queued", job_id=job_id, queue_position=position)
+        logging.info(f"[TrainingExecutor] session_id={session_id} поставлена в очередь (job_id={job_id}), позиция {position}")
+        return future
+
+    def submit_feature_importance(self, session_id: str, train_path: str, params: dict) -> str:
+        """Ставит расчёт feature importance обученной модели в очередь с низким приоритетом (результата не ждём)."""
+        job_id = self.queue.enqueue(
+            session_id,
+            {"train_path": train_path, "params": params},
+            priority=FEATURE_IMPORTANCE_PRIORITY,
+            kind="feature_importance",
+        )
+        set_feature_importance_status(session_id, "queued")
+        with self._cond:
+            self._cond.notify_all()
+        logging.info(f"[TrainingExecutor] Расчёт feature importance для session_id={session_id} поставлен в очередь (job_id={job_id})")
+        return job_id
+
+    def cancel(self, session_id: str, keep_best: bool = False) -> Dict[str, Any]:
+        """
+        Отмена заданий сессии. Задания в очереди снимаются сразу. Выполняющееся обучение:
+          - keep_best=False — процесс (вместе с дочерними) убивается сразу, слот освобождается,
+            частично обученные модели удаляются;
+          - keep_best=True — AutoGluon останавливается после текущей модели, уже обученные модели
+            сохраняются и сессия становится completed (stopped_early).
+        Если задание выполняется в другом воркере API, отмену применит его heartbeat.
+        """
+        mode = "keep_best" if keep_best else "discard"
+        jobs = self.queue.request_cancel(session_id, mode)
+        for job in jobs:
+            if job["status"] == "cancelled":
+                self._finalize_cancelled(job)
+            else:
+                self._apply_cancel(job["job_id"], mode)
+        logging.info(f"[TrainingExecutor] Отмена заданий session_id={session_id} ({mode}): {[job['job_id'] for job in jobs]}")
+        return {
+            "session_id": session_id,
+            "mode": mode,
+            "jobs": [{"job_id": job["job_id"], "kind": job["kind"], "status": job["status"]} for job in jobs],
+        }
+
+    async def run(self, session_id: str, train_path: str, training_params: Any, text_to_progress: dict, priority: int = 0) -> None:
+        """
+        Ставит обучение в очередь и ждёт его завершения, не блокируя event loop.
+        Если те же данные уже обучались с теми же параметрами, модели берутся из кэша результатов без обучения.
+        """
+        fingerprint = None
+        if TRAINING_CACHE_ENABLED and getattr(training_params, "use_training_cache", True):
+            try:
+                fingerprint = await asyncio.to_thread(training_fingerprint, train_path, training_params.model_dump())
+                if await asyncio.to_thread(self._restore_from_cache, fingerprint, session_id, train_path, training_params):
+                    return
+            except Exception as e:
+                logging.warning(f"[TrainingExecutor] Кэш результатов обучения недоступен для session_id={session_id}: {e}")
+        await asyncio.wrap_future(self.submit(session_id, train_path, training_params, text_to_progress, priority, fingerprint))
+
+    def _restore_from_cache(self, fingerprint: str, session_id: str, train_path: str, training_params: Any) -> bool:
+        """Переносит модели сессии из кэша результатов в session_id. False — в кэше ничего нет."""
+        source_session_id = self.result_cache.lookup(fingerprint)
+        if source_session_id is None or source_session_id == session_id:
+            return False
+        self.result_cache.restore(source_session_id, session_id)
+        logging.info(f"[TrainingExecutor] session_id={session_id}: обучение пропущено, модели взяты из сессии {source_session_id}")
+        emit_event(session_id, "training_cache_hit", source_session_id=source_session_id)
+        emit_event(session_id, "training_completed", error=None)
+        if os.path.exists(os.path.join(get_session_path(session_id), "autogluon", "feature_importance.csv")):
+            set_feature_importance_status(session_id, "completed")
+        else:
+            self.submit_feature_importance(session_id, train_path, training_params.model_dump())
+        return True
+
+    def queue_position(self, session_id: str) -> Optional[int]:
+        """0 — обучение уже идёт, N — N-е в очереди, None — активного задания нет."""
+        return self.queue.queue_position(session_id, kind="train")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.queue.stats()
+        stats["result_cache"] = self.result_cache.stats()
+        with self._cond:
+            stats.update({
+                "worker_id": self.worker_id,
+                "max_workers": self.max_workers,
+                "running_here": [job["session_id"] for job in self._running.values()],
+                "resources_per_job": self.resources,
+            })
+        return stats
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while len(self._running) >= self.max_workers:
+                    self._cond.wait()
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                # Задания могут прийти от других воркеров API — периодически опрашиваем очередь
+                with self._cond:
+                    self._cond.wait(timeout=TRAINING_HEARTBEAT_SECONDS)
+                continue
+            with self._cond:
+                self._running[job["job_id"]] = job
+            threading.Thread(target=self._run_job, args=(job,), name=f"training-{job['session_id']}", daemon=True).start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            try:
+                with self._cond:
+                    running_ids = list(self._running.keys())
+                    waiting_ids = [job_id for job_id in self._waiters if job_id not in self._running]
+                self.queue.heartbeat(running_ids, self.worker_id)
+                # Отмены, запрошенные через другой воркер API
+                for job_id, mode in self.queue.cancel_requests(running_ids).items():
+                    self._apply_cancel(job_id, mode)
+                self._recover_orphans()
+                # Задания, которых ждём здесь, могли выполниться в другом воркере API
+                for job in self.queue.get_many(waiting_ids):
+                    if job["status"] in ("completed", "failed"):
+                        self._resolve(job["job_id"], job.get("error"))
+                    elif job["status"] == "cancelled":
+                        self._resolve(job["job_id"], "Обучение отменено", cancelled=True)
+            except Exception as e:
+                logging.error(f"[TrainingExecutor] Ошибка heartbeat: {e}", exc_info=True)
+            time.sleep(TRAINING_HEARTBEAT_SECONDS)
+
+    def _recover_orphans(self) -> None:
+        stale = self.queue.stale_jobs(TRAINING_JOB_STALE_SECONDS)
+        if not stale:
+            return
+        # Задание возвращается в очередь, только когда его прежний процесс остановлен
+        stopped = [job["job_id"] for job in stale if _stop_orphan_process(job)]
+        for job in self.queue.recover_orphans(TRAINING_JOB_STALE_SECONDS, TRAINING_JOB_MAX_ATTEMPTS, stopped):
+            metadata = load_session_metadata(job["session_id"])
+            if not metadata:
+                continue
+            if job["kind"] == "feature_importance":
+                set_feature_importance_status(job["session_id"], job["status"], job.get("error"))
+                continue
+            if job["status"] == "cancelled":
+                self._finalize_cancelled(job)
+                continue
+            if job["status"] == "failed":
+                update_session_metadata(job["session_id"], {"status": "failed", "error": job["error"], "end_time": datetime.now().isoformat()})
+                self._resolve(job["job_id"], job["error"])
+                emit_event(job["session_id"], "training_failed", error=job["error"])
+            else:
+                update_session_metadata(job["session_id"], {"status": "running", "progress": 0, "restarted": True})
+        with self._cond:
+            self._cond.notify_all()
+
+    def _apply_cancel(self, job_id: str, mode: str) -> None:
+        """Применяет отмену к процессу задания этого воркера (если задание выполняется здесь)."""
+        with self._cond:
+            entry = self._processes.get(job_id)
+            job = self._running.get(job_id)
+            if entry is None or job is None or job_id in self._killed:
+                return
+            process, stop_event = entry
+            if mode == "keep_best" and job["kind"] == "train":
+                stop_event.set()
+                logging.info(f"[TrainingExecutor] Обучение session_id={job['session_id']} остановится после текущей модели")
+                return
+            self._killed.add(job_id)
+        _kill_process_tree(process.pid)
+        logging.info(f"[TrainingExecutor] Процесс задания {job['kind']} session_id={job['session_id']} (pid={process.pid}) остановлен")
+
+    def _finalize_cancelled(self, job: Dict[str, Any]) -> None:
+        """Статус сессии после отмены: частичные артефакты удаляются, ожидающий корутин получает TrainingCancelled."""
+        session_id = job["session_id"]
+        if job["kind"] == "feature_importance":
+            set_feature_importance_status(session_id, "cancelled")
+            return
+        _discard_model_artifacts(session_id)
+        update_session_metadata(session_id, {"status": "cancelled", "end_time": datetime.now().isoformat()})
+        emit_event(session_id, "training_cancelled")
+        self._resolve(job["job_id"], "Обучение отменено", cancelled=True)
+
+    def _resolve(self, job_id: str, error: Optional[str], cancelled: bool = False) -> bool:
+        """Завершает Future ожидающего корутина. Возвращает False, если в этом процессе задание никто не ждёт."""
+        with self._cond:
+            future = self._waiters.pop(job_id, None)
+        if future is None:
+            return False
+        if not future.done():
+            if cancelled:
+                future.set_exception(TrainingCancelled(error))
+            elif error:
+                future.set_exception(RuntimeError(error))
+            else:
+                future.set_result(None)
+        return True
+
+    def _run_job(self, job: Dict[str, Any]) -> None:
+        session_id = job["session_id"]
+        payload = job["payload"]
+        parent_conn, child_conn = self._ctx.Pipe(duplex=False)
+        stop_event = self._ctx.Event()
+        if job["kind"] == "feature_importance":
+            target = _feature_importance_worker
+            args = (session_id, payload["train_path"], payload["params"], self.resources, child_conn)
+        else:
+            target = _training_worker
+            args = (session_id, payload["train_path"], payload["params"], payload["text_to_progress"], self.resources, child_conn, stop_event)
+        process = self._ctx.Process(target=target, args=args, name=f"autogluon-{job['kind']}-{session_id}")
+        error = None
+        try:
+            process.start()
+            child_conn.close()
+            self.queue.set_process(job["job_id"], process.pid, _process_create_time(process.pid))
+            with self._cond:
+                self._processes[job["job_id"]] = (process, stop_event)
+            # Отмена могла прийти, пока процесс запускался
+            mode = self.queue.cancel_requests([job["job_id"]]).get(job["job_id"])
+            if mode:
+                self._apply_cancel(job["job_id"], mode)
+            logging.info(f"[TrainingExecutor] Задание {job['kind']} session_id={session_id} запущено в процессе pid={process.pid}")
+            emit_event(session_id, "job_started", kind=job["kind"], job_id=job["job_id"], time_limit=payload["params"].get("training_time_limit"))
+            result = None
+            while True:
+                # До результата процесс присылает события обучения (этапы, модели AutoGluon)
+                try:
+                    message = parent_conn.recv()
+                except EOFError:
+                    break
+                if message[0] == "event":
+                    training_event_bus.publish(message[1])
+                    continue
+                result = message
+                break
+            process.join()
+            if result is None:
+                error = f"Процесс обучения завершился аварийно (exitcode={process.exitcode})"
+            elif result[0] != "ok":
+                error = result[1]
+        except Exception as e:
+            error = str(e)
+        finally:
+            parent_conn.close()
+            with self._cond:
+                killed = job["job_id"] in self._killed
+                self._killed.discard(job["job_id"])
+                self._processes.pop(job["job_id"], None)
+            self.queue.finish(job["job_id"], None if killed else error, cancelled=killed)
+            with self._cond:
+                self._running.pop(job["job_id"], None)
+                self._cond.notify_all()
+        if killed:
+            self._finalize_cancelled(job)
+            return
+        if job["kind"] == "feature_importance":
+            if error:
+                # Процесс упал, не успев записать статус сам
+                set_feature_importance_status(session_id, "failed", error)
+            return
+        emit_event(session_id, "training_failed" if error else "training_completed", error=error)
+        if not error and payload.get("fingerprint"):
+            # Остановленное досрочно обучение (отмена с keep_best) не считается результатом для этих параметров
+            if not (load_session_metadata(session_id) or {}).get("stopped_early"):
+                self.result_cache.store(payload["fingerprint"], session_id)
+        if not error:
+            # Сессия уже completed и обслуживает прогнозы; важность признаков досчитается в фоне
+            self.submit_feature_importance(session_id, payload["train_path"], payload["params"])
+        if not self._resolve(job["job_id"], error):
+            # Задание восстановлено после перезапуска API — ждущего корутина нет, финализируем статус сами
+            final = {"status": "failed", "error": error} if error else {"status": "completed", "progress": 100}
+            update_session_metadata(session_id, {"end_time": datetime.now().isoformat(), **final})
+
+
+training_executor = TrainingExecutor(job_queue, TRAINING_MAX_WORKERS, TRAINING_CPUS_PER_JOB, TRAINING_MEMORY_LIMIT_GB, training_result_cache)
@@ -0,0 +1,217 @@
+import logging
+import os
+import re
+import shutil
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from pandas._libs.parsers import STR_NA_VALUES
+
+from db.db_manager import stream_table_batches
+
+# Размер куска при копировании загруженного файла на диск
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+# Размер блока CSV, который превращается в одну row group parquet
+CSV_BLOCK_BYTES = int(os.getenv("CSV_BLOCK_MB", "64")) * 1024 * 1024
+# Объём начала CSV, по которому выводится схема
+CSV_SCHEMA_SAMPLE_BYTES = 4 * 1024 * 1024
+
+_CSV_COLUMN_ERROR = re.compile(r"column #(\d+)")
+# Значения CSV, которые читаются как пропуски — те же, что у pd.read_csv по умолчанию
+CSV_NULL_VALUES = sorted(STR_NA_VALUES)
+
+
+def save_upload_to_disk(upload: Any, path: str) -> int:
+    """Копирует загруженный файл (UploadFile или file-like) на диск кусками, не читая его целиком в память."""
+    source = upload.file if hasattr(upload, 'file') else upload
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(source, f, UPLOAD_CHUNK_BYTES)
+    return os.path.getsize(path)
+
+
+def _csv_convert_options(column_types: Optional[Dict[str, pa.DataType]] = None) -> pa_csv.ConvertOptions:
+    """Пустые ячейки и маркеры пропусков — null в колонках любого типа, включая строковые (как в pd.read_csv)."""
+    return pa_csv.ConvertOptions(
+        column_types=column_types,
+        null_values=CSV_NULL_VALUES,
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=True,
+    )
+
+
+def _widen(arrow_type: pa.DataType) -> pa.DataType:
+    """Расширение типа колонки, если в дальнейших блоках встретилось значение вне выведенного типа."""
+    if pa.types.is_integer(arrow_type):
+        return pa.float64()
+    return pa.string()
+
+
+def infer_csv_schema(path: str, sample_bytes: Optional[int] = None) -> pa.Schema:
+    """
+    Выводит схему CSV по первым sample_bytes байтам (по умолчанию CSV_SCHEMA_SAMPLE_BYTES).
+    Даты оставляются строками (как в pd.read_csv), колонки без значений в выборке — строками.
+    """
+    sample_bytes = sample_bytes or CSV_SCHEMA_SAMPLE_BYTES
+    with open(path, "rb") as f:
+        sample = f.read(sample_bytes)
+        truncated = bool(f.read(1))
+    if truncated and b"\n" in sample:
+        # Отрезаем недочитанную последнюю строку
+        sample = sample[:sample.rfind(b"\n") + 1]
+    table = pa_csv.read_csv(pa.BufferReader(sample), convert_options=_csv_convert_options())
+    fields = []
+    for field in table.schema:
+        arrow_type = field.type
+        if pa.types.is_null(arrow_type) or pa.types.is_temporal(arrow_type):
+            arrow_type = pa.string()
+        fields.append(pa.field(field.name, arrow_type))
+    return pa.schema(fields)
+
+
+def csv_to_parquet(path: str, parquet_path: str, block_size: int = CSV_BLOCK_BYTES) -> pa.Schema:
+    """
+    Потоково конвертирует CSV в parquet: каждый блок CSV пишется отдельной row group,
+    в памяти одновременно находится только один блок.
+    Если значение не укладывается в выведенный по выборке тип, все нужные расширения типов собираются
+    одним проходом по файлу (_widen_csv_schema), и конвертация повторяется один раз.
+    """
+    schema = infer_csv_schema(path)
+    scanned = False
+    while True:
+        try:
+            _csv_to_parquet_with_schema(path, parquet_path, schema, block_size)
+            return schema
+        except pa.ArrowInvalid as e:
+            match = _CSV_COLUMN_ERROR.search(str(e))
+            if match is None:
+                raise
+            if not scanned:
+                scanned = True
+                schema = _widen_csv_schema(path, schema, block_size)
+                continue
+            # Проход по файлу не предсказал ошибку разбора (расхождение cast и парсера CSV) — расширяем колонку
+            idx = int(match.group(1))
+            field = schema.field(idx)
+            if pa.types.is_string(field.type):
+                raise
+            widened = _widen(field.type)
+            logging.info(f"[csv_to_parquet] Колонка '{field.name}': тип {field.type} расширен до {widened}")
+            schema = schema.set(idx, pa.field(field.name, widened))
+
+
+def _widen_csv_schema(path: str, schema: pa.Schema, block_size: int) -> pa.Schema:
+    """
+    Один проход по CSV со всеми колонками как строками: для каждой нестроковой колонки тип расширяется,
+    пока в него не приводятся значения всех блоков. Возвращает схему, с которой конвертация пройдёт целиком.
+    """
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=_csv_convert_options({field.name: pa.string() for field in schema}),
+    )
+    types = {field.name: field.type for field in schema}
+    for batch in reader:
+        for name, arrow_type in types.items():
+            values = batch.column(name)
+            while not pa.types.is_string(arrow_type):
+                try:
+                    pc.cast(values, arrow_type)
+                    break
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    arrow_type = _widen(arrow_type)
+            types[name] = arrow_type
+    for field in schema:
+        if types[field.name] != field.type:
+            logging.info(f"[csv_to_parquet] Колонка '{field.name}': тип {field.type} расширен до {types[field.name]}")
+    return pa.schema([pa.field(field.name, types[field.name]) for field in schema])
+
+
+def _csv_to_parquet_with_schema(path: str, parquet_path: str, schema: pa.Schema, block_size: int) -> None:
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=_csv_convert_options({field.name: field.type for field in schema}),
+    )
+    rows = 0
+    with pq.ParquetWriter(parquet_path, schema) as writer:
+        for batch in reader:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema))
+            rows += batch.num_rows
+    logging.info(f"[csv_to_parquet] {path} -> {parquet_path}: {rows} строк")
+
+
+def excel_to_parquet(path: str, parquet_path: str) -> None:
+    """Excel не читается потоково: читаем один раз с диска и сразу пишем parquet."""
+    df = pd.read_excel(path)
+    df.to_parquet(parquet_path, index=False)
+
+
+def file_to_parquet(path: str, parquet_path: str) -> None:
+    """Конвертирует загруженный .csv/.xlsx/.xls в parquet."""
+    if path.endswith('.csv'):
+        csv_to_parquet(path, parquet_path)
+    elif path.endswith('.xlsx') or path.endswith('.xls'):
+        excel_to_parquet(path, parquet_path)
+    else:
+        raise ValueError("Файл должен быть .csv или .xlsx/.xls")
+
+
+def writer_schema(schema: pa.Schema) -> pa.Schema:
+    """
+    Схема parquet-файла по первому куску: колонки, в которых в первом куске нет значений (тип null),
+    пишутся строками — иначе последующие куски со значениями нельзя привести к схеме файла.
+    """
+    return pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field for field in schema])
+
+
+async def table_to_parquet(
+    db_schema: str,
+    table_name: str,
+    username: str,
+    password: str,
+    parquet_path: str,
+    columns: Optional[List[str]] = None,
+    sample_percent: Optional[float] = None,
+    filters: Optional[List[Dict[str, Any]]] = None,
+) -> int:
+    """
+    Потоково выгружает таблицу БД в parquet: каждый кусок серверного курсора пишется отдельной row group.
+    Проекция, выборка и фильтр (filters, см. build_filter_clause) выполняются в SQL. Возвращает число выгруженных строк.
+    """
+    rows = 0
+    writer = None
+    try:
+        async for batch in stream_table_batches(
+            db_schema, table_name, username, password,
+            columns=columns, as_arrow=True, sample_percent=sample_percent, filters=filters,
+        ):
+            table = pa.Table.from_batches([batch])
+            if writer is None:
+                writer = pq.ParquetWriter(parquet_path, writer_schema(table.schema))
+            if table.schema != writer.schema:
+                # Тип колонки, выведенный по значениям, может отличаться между кусками
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"Таблица '{db_schema}.{table_name}' не содержит строк для обучения")
+    logging.info(f"[table_to_parquet] {db_schema}.{table_name} -> {parquet_path}: {rows} строк")
+    return rows
+
+
+def parquet_columns(parquet_path: str) -> List[str]:
+    """Имена колонок parquet без чтения данных."""
+    return pq.read_schema(parquet_path).names
+
+
+def parquet_num_rows(parquet_path: str) -> int:
+    return pq.ParquetFile(parquet_path).metadata.num_rows
@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from sessions.utils import SESSIONS_BASE_PATH
+
+# Файл журнала заданий обучения: общий для всех воркеров uvicorn на одной машине
+TRAINING_JOBS_DB = os.getenv("TRAINING_JOBS_DB", os.path.join(SESSIONS_BASE_PATH, "training_jobs.sqlite3"))
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id TEXT UNIQUE NOT NULL,
+        session_id TEXT NOT NULL,
+        kind TEXT NOT NULL DEFAULT 'train',
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker_id TEXT,
+        enqueued_at REAL NOT NULL,
+        started_at REAL,
+        heartbeat_at REAL,
+        finished_at REAL,
+        error TEXT,
+        cancel_requested TEXT,
+        pid INTEGER,
+        pid_created_at REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, seq);
+    CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session_id);
+"""
+
+
+def current_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Персистентная очередь заданий обучения в SQLite.
+    Фиксирует постановку, старт, heartbeat и завершение; захват задания атомарен,
+    поэтому несколько процессов API могут разбирать одну очередь без двойного запуска.
+    Статусы: queued -> running -> completed | failed | cancelled; queued -> cancelled.
+    Отмена выполняющегося задания помечается в cancel_requested ('discard' | 'keep_best'),
+    её применяет воркер, владеющий процессом задания.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # Журналы, созданные до появления отмены заданий и учёта процессов заданий
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, column_type in (("cancel_requested", "TEXT"), ("pid", "INTEGER"), ("pid_created_at", "REAL")):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, session_id: str, payload: Dict[str, Any], priority: int = 0, kind: str = "train") -> str:
+        """Ставит задание в очередь. Если по сессии уже есть активное задание того же типа — возвращает его."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE session_id = ? AND kind = ? AND status IN ('queued', 'running')",
+                (session_id, kind),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return row["job_id"]
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO jobs (job_id, session_id, kind, priority, status, payload, enqueued_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, session_id, kind, priority, json.dumps(payload, default=str), time.time()),
+            )
+            conn.execute("COMMIT")
+            return job_id
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Атомарно забирает следующее задание из очереди (по priority, затем FIFO)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY priority, seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND status = 'queued'",
+                (worker_id, now, now, row["job_id"]),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._to_dict(job)
+
+    def set_process(self, job_id: str, pid: int, created_at: float) -> None:
+        """Запоминает процесс задания: после падения воркера его нужно остановить до повторного запуска задания."""
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET pid = ?, pid_created_at = ? WHERE job_id = ?", (pid, created_at, job_id))
+
+    def stale_jobs(self, stale_after: float) -> List[Dict[str, Any]]:
+        """Задания в статусе running без heartbeat дольше stale_after секунд."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (time.time() - stale_after,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def heartbeat(self, job_ids: List[str], worker_id: str) -> None:
+        if not job_ids:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND worker_id = ? AND status = 'running'",
+                [(now, job_id, worker_id) for job_id in job_ids],
+            )
+
+    def finish(self, job_id: str, error: Optional[str] = None, cancelled: bool = False) -> None:
+        status = "cancelled" if cancelled else "failed" if error else "completed"
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE job_id = ?",
+                (status, time.time(), error, job_id),
+            )
+
+    def request_cancel(self, session_id: str, mode: str = "discard") -> List[Dict[str, Any]]:
+        """
+        Отмена активных заданий сессии: задания в очереди сразу переходят в cancelled,
+        у выполняющихся выставляется cancel_requested. Возвращает затронутые задания.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT job_id FROM jobs WHERE session_id = ? AND status IN ('queued', 'running')", (session_id,)
+            ).fetchall()
+            job_ids = [row["job_id"] for row in rows]
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, cancel_requested = ? WHERE session_id = ? AND status = 'queued'",
+                (now, mode, session_id),
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = ? WHERE session_id = ? AND status = 'running'", (mode, session_id)
+            )
+            conn.execute("COMMIT")
+        return self.get_many(job_ids)
+
+    def cancel_requests(self, job_ids: List[str]) -> Dict[str, str]:
+        """{job_id: режим отмены} для выполняющихся заданий из job_ids, которые попросили отменить."""
+        if not job_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT job_id, cancel_requested FROM jobs WHERE job_id IN ({placeholders}) "
+                "AND status = 'running' AND cancel_requested IS NOT NULL",
+                job_ids,
+            ).fetchall()
+            return {row["job_id"]: row["cancel_requested"] for row in rows}
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone())
+
+    def get_many(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        if not job_ids:
+            return []
+        placeholders = ", ".join("?" for _ in job_ids)
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM jobs WHERE job_id IN ({placeholders})", job_ids).fetchall()
+            return [self._to_dict(row) for row in rows]
+
+    def queue_position(self, session_id: str, kind: Optional[str] = None) -> Optional[int]:
+        """0 — задание сессии выполняется, N — N-е в очереди, None — активного задания нет (kind — только задания этого типа)."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT status, priority, seq FROM jobs WHERE session_id = ? AND status IN ('queued', 'running') "
+                "AND (? IS NULL OR kind = ?) ORDER BY status = 'running' DESC, priority, seq LIMIT 1",
+                (session_id, kind, kind),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "running":
+                return 0
+            ahead = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority < ? OR (priority = ? AND seq < ?))",
+                (row["priority"], row["priority"], row["seq"]),
+            ).fetchone()[0]
+            return ahead + 1
+
+    def recover_orphans(self, stale_after: float, max_attempts: int, job_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Находит задания в статусе running без heartbeat дольше stale_after секунд
+        (воркер перезапущен или упал). Возвращает их в очередь, пока не исчерпаны попытки, иначе — failed.
+        job_ids ограничивает восстановление заданиями, процессы которых уже проверены (см. stale_jobs).
+        """
+        threshold = time.time() - stale_after
+        recovered = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (threshold,)
+            ).fetchall()
+            if job_ids is not None:
+                rows = [row for row in rows if row["job_id"] in job_ids]
+            for row in rows:
+                job = self._to_dict(row)
+                if job["cancel_requested"]:
+                    # Воркер пропал до применения отмены — повторять задание не нужно
+                    conn.execute(
+                        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ?", (time.time(), job["job_id"])
+                    )
+                    job["status"] = "cancelled"
+                elif job["attempts"] < max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', worker_id = NULL, started_at = NULL, heartbeat_at = NULL, "
+                        "pid = NULL, pid_created_at = NULL WHERE job_id = ?",
+                        (job["job_id"],),
+                    )
+                    job["status"] = "queued"
+                else:
+                    error = f"Задание прервано: воркер {job['worker_id']} перестал отвечать (попыток: {job['attempts']})"
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE job_id = ?",
+                        (time.time(), error, job["job_id"]),
+                    )
+                    job["status"] = "failed"
+                    job["error"] = error
+                recovered.append(job)
+            conn.execute("COMMIT")
+        for job in recovered:
+            logging.warning(f"[JobQueue] Осиротевшее задание {job['job_id']} (session_id={job['session_id']}) -> {job['status']}")
+        return recovered
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            counts = {row["status"]: row["n"] for row in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+            running = [dict(row) for row in conn.execute(
+                "SELECT job_id, session_id, kind, worker_id, started_at, heartbeat_at FROM jobs WHERE status = 'running'"
+            )]
+        return {"counts": counts, "running_jobs": running}
+
+
+job_queue = JobQueue(TRAINING_JOBS_DB)
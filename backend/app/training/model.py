@@ -1,7 +1,14 @@
-from typing import List, Optional, Union
+from typing import Any, List, Literal, Optional, Union
 from pydantic import BaseModel, Field
 
 
+class DownloadFilterCondition(BaseModel):
+    """Условие отбора строк таблицы: колонка, оператор и значение (передаётся в запрос параметром, не текстом SQL)."""
+    column: str = Field(..., description="Колонка таблицы.")
+    op: Literal["=", "!=", "<", "<=", ">", ">=", "in", "not_in", "like", "is_null", "not_null"] = Field("=", description="Оператор сравнения.")
+    value: Optional[Any] = Field(None, description="Значение (для in/not_in — список значений, для is_null/not_null не нужно).")
+
+
 class TrainingParameters(BaseModel):
     target_column: str = Field(..., description="Название целевой колонки для прогнозирования.")
     fill_missing_method: Optional[str] = Field("None", description="Метод заполнения пропущенных значений (например, 'mean', 'median', 'None').")
@@ -11,5 +18,18 @@ class TrainingParameters(BaseModel):
     problem_type: Optional[str] = Field("auto", description="Тип задачи (например, 'auto', 'binary', 'multiclass', 'regression').")
     training_time_limit: Optional[int] = Field(None, description="Ограничение времени на обучение в секундах. Если None, то без ограничений.")
     download_table_name: Optional[str] = Field(None, description="Название таблицы из которой будет загружен датасет")
+    download_table_schema: Optional[str] = Field(None, description="Схема таблицы с датасетом. Если None, используется схема из настроек БД.")
+    download_columns: Optional[List[str]] = Field(None, description="Колонки, загружаемые из таблицы (целевая добавляется автоматически). Если None, загружаются все.")
+    download_sample_percent: Optional[float] = Field(None, description="Процент строк таблицы для случайной выборки (0, 100]. Если None, загружаются все строки.")
+    download_filter: Optional[List[DownloadFilterCondition]] = Field(None, description="Условия отбора строк из таблицы (объединяются через AND). Если None, загружаются все строки.")
     upload_table_name: Optional[str] = Field(None, description="Название таблицы в которую будет загружен датасет")
-    upload_table_schema: Optional[str] = Field(None, description="Схема для сохранения прогноза в БД")
\ No newline at end of file
+    upload_table_schema: Optional[str] = Field(None, description="Схема для сохранения прогноза в БД")
+    optimize_for_deployment: Optional[bool] = Field(False, description="После обучения переобучить лучшую модель на всех данных (refit_full), удалить остальные модели и сохранить облегчённую копию предиктора для прогноза.")
+    inference_time_limit_ms: Optional[float] = Field(None, description="Бюджет времени прогноза одной строки (мс), передаётся в AutoGluon как infer_limit. Если None, не ограничивается.")
+    inference_batch_size: Optional[int] = Field(None, description="Размер батча, для которого считается время прогноза одной строки (infer_limit_batch_size). Если None, 10000.")
+    feature_importance_subsample_size: Optional[int] = Field(5000, description="Число строк обучающих данных для расчёта feature importance. Если None, все строки.")
+    feature_importance_num_shuffle_sets: Optional[int] = Field(3, description="Число перестановок каждого признака при расчёте feature importance.")
+    feature_importance_time_limit: Optional[int] = Field(300, description="Ограничение времени расчёта feature importance в секундах. Если None, без ограничений.")
+    use_training_cache: Optional[bool] = Field(True, description="Переиспользовать модели ранее обученной сессии, если совпадают данные, параметры обучения и версии библиотек.")
+    retrain_from_session: Optional[str] = Field(None, description="Быстрое повторное обучение: обучить на новых данных только лучшие конфигурации моделей указанной сессии (без полного перебора), со схемой признаков и заполнением пропусков этой сессии.")
+    retrain_top_k: Optional[int] = Field(3, description="Сколько лучших конфигураций моделей исходной сессии обучать при retrain_from_session.")
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from importlib import metadata as importlib_metadata
+from typing import Any, Dict, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from sessions.utils import SESSIONS_BASE_PATH, get_session_path, load_session_metadata, update_session_metadata
+
+# Кэш результатов обучения: повторное обучение на тех же данных с теми же параметрами не запускается
+TRAINING_CACHE_ENABLED = os.getenv("TRAINING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TRAINING_CACHE_DB = os.getenv("TRAINING_CACHE_DB", os.path.join(SESSIONS_BASE_PATH, "training_cache.sqlite3"))
+# Строк на кусок при хэшировании train.parquet
+FINGERPRINT_BATCH_ROWS = 100000
+
+# Меняется при изменении подготовки данных или состава артефактов — старые записи кэша перестают совпадать
+CACHE_FORMAT_VERSION = 2
+# Параметры, не влияющие на обученную модель: источник данных (его покрывает хэш данных) и выгрузка прогноза
+_NON_MODEL_PARAMS = (
+    "download_table_name",
+    "download_table_schema",
+    "download_columns",
+    "download_sample_percent",
+    "download_filter",
+    "upload_table_name",
+    "upload_table_schema",
+    "use_training_cache",
+)
+# Ключи metadata.json исходной сессии, нужные для прогноза по её моделям
+_REUSED_METADATA_KEYS = ("feature_schema", "imputer", "date_formats")
+# Метаданные и отчёты (model_metadata.json, fit_summary.json, leaderboard.csv, feature_importance.csv) копируются:
+# они содержат пути исходной сессии и могут перезаписываться. Жёсткими ссылками связываются только бинарные модели.
+_COPIED_SUFFIXES = (".json", ".csv", ".txt", ".log")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS training_cache (
+        fingerprint TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        last_hit_at REAL
+    );
+"""
+
+
+def data_fingerprint(parquet_path: str) -> str:
+    """
+    Хэш содержимого train.parquet, не зависящий от разбиения на row group'ы и порядка колонок:
+    имена и типы колонок + построчные хэши значений (pd.util.hash_pandas_object) в исходном порядке строк.
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    columns = sorted(parquet_file.schema_arrow.names)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([(name, str(parquet_file.schema_arrow.field(name).type)) for name in columns]).encode("utf-8"))
+    for batch in parquet_file.iter_batches(batch_size=FINGERPRINT_BATCH_ROWS, columns=columns):
+        row_hashes = pd.util.hash_pandas_object(batch.to_pandas(), index=False)
+        digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def params_fingerprint(params: Dict[str, Any]) -> str:
+    model_params = {key: value for key, value in params.items() if key not in _NON_MODEL_PARAMS}
+    return hashlib.sha256(json.dumps(model_params, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _library_versions() -> str:
+    versions = [f"cache_format={CACHE_FORMAT_VERSION}"]
+    for package in ("autogluon.tabular", "pandas"):
+        try:
+            versions.append(f"{package}={importlib_metadata.version(package)}")
+        except importlib_metadata.PackageNotFoundError:
+            versions.append(f"{package}=none")
+    return ";".join(versions)
+
+
+def training_fingerprint(train_path: str, params: Dict[str, Any]) -> str:
+    """Ключ кэша: данные + параметры обучения + версии библиотек."""
+    parts = (data_fingerprint(train_path), params_fingerprint(params), _library_versions())
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: str, dst: str) -> str:
+    """Жёсткая ссылка вместо копии (артефакты моделей не изменяются на месте); копия — если ссылки недоступны."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _rewrite_paths(value: Any, source_path: str, session_path: str) -> Any:
+    """Заменяет в строках JSON путь исходной сессии на путь новой."""
+    if isinstance(value, str):
+        if value == source_path or value.startswith(source_path + os.sep):
+            return session_path + value[len(source_path):]
+        return value
+    if isinstance(value, list):
+        return [_rewrite_paths(item, source_path, session_path) for item in value]
+    if isinstance(value, dict):
+        return {key: _rewrite_paths(item, source_path, session_path) for key, item in value.items()}
+    return value
+
+
+def _restore_file(src: str, dst: str, source_path: str, session_path: str) -> str:
+    """Бинарные артефакты — жёсткой ссылкой, метаданные и отчёты — копией с путями новой сессии."""
+    if not src.endswith(_COPIED_SUFFIXES):
+        return _link_or_copy(src, dst)
+    if src.endswith(".json"):
+        with open(src, encoding="utf-8") as f:
+            content = _rewrite_paths(json.load(f), source_path, session_path)
+        with open(dst, "w", encoding="utf-8") as f:
+            json.dump(content, f, ensure_ascii=False, indent=2)
+        shutil.copystat(src, dst)
+        return dst
+    return shutil.copy2(src, dst)
+
+
+class TrainingResultCache:
+    """
+    Кэш результатов обучения в SQLite: отпечаток (данные + параметры + версии) -> сессия с обученными моделями.
+    При попадании модели исходной сессии связываются жёсткими ссылками в новую сессию (метаданные копируются),
+    и обучение не ставится в очередь. Записи с удалёнными артефактами (очистка старых сессий) отбрасываются.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _artifact_names() -> list:
+        from AutoML.autogluon_strategy import SERVING_DIR_NAME
+        from AutoML.manager import automl_manager
+
+        return [strategy.name for strategy in automl_manager.get_strategies()] + [SERVING_DIR_NAME, "leaderboard.csv"]
+
+    @staticmethod
+    def _is_servable(session_id: str) -> bool:
+        metadata = load_session_metadata(session_id)
+        return bool(metadata) and metadata.get("status") not in ("failed", "cancelled") and os.path.exists(
+            os.path.join(get_session_path(session_id), "leaderboard.csv")
+        )
+
+    def lookup(self, fingerprint: str) -> Optional[str]:
+        """session_id сессии с готовыми моделями для этого отпечатка или None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT session_id FROM training_cache WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            if row is None:
+                return None
+            if not self._is_servable(row["session_id"]):
+                conn.execute("DELETE FROM training_cache WHERE fingerprint = ?", (fingerprint,))
+                logging.info(f"[TrainingResultCache] Запись для сессии {row['session_id']} устарела (артефакты удалены)")
+                return None
+            conn.execute(
+                "UPDATE training_cache SET hits = hits + 1, last_hit_at = ? WHERE fingerprint = ?", (time.time(), fingerprint)
+            )
+            return row["session_id"]
+
+    def store(self, fingerprint: str, session_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO training_cache (fingerprint, session_id, created_at) VALUES (?, ?, ?)",
+                (fingerprint, session_id, time.time()),
+            )
+
+    def restore(self, source_session_id: str, session_id: str) -> None:
+        """
+        Переносит обученные модели source_session_id в сессию session_id и дописывает её metadata.json.
+        Сессии не зависят друг от друга: удаление или очистка исходной не затрагивает восстановленную.
+        """
+        source_path = get_session_path(source_session_id)
+        session_path = get_session_path(session_id)
+
+        def restore_file(src: str, dst: str) -> str:
+            return _restore_file(src, dst, source_path, session_path)
+
+        for name in self._artifact_names():
+            src = os.path.join(source_path, name)
+            dst = os.path.join(session_path, name)
+            if os.path.isdir(src):
+                shutil.rmtree(dst, ignore_errors=True)
+                shutil.copytree(src, dst, copy_function=restore_file)
+            elif os.path.isfile(src):
+                if os.path.exists(dst):
+                    os.remove(dst)
+                restore_file(src, dst)
+        source_metadata = load_session_metadata(source_session_id) or {}
+        updates = {key: source_metadata[key] for key in _REUSED_METADATA_KEYS if key in source_metadata}
+        if source_metadata.get("serving_model_path"):
+            updates["serving_model_path"] = _rewrite_paths(source_metadata["serving_model_path"], source_path, session_path)
+        updates.update({"status": "completed", "progress": 100, "cached_from_session": source_session_id})
+        update_session_metadata(session_id, updates, create=True)
+        logging.info(f"[TrainingResultCache] Модели сессии {source_session_id} переиспользованы в сессии {session_id}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits FROM training_cache").fetchone()
+        return {"enabled": TRAINING_CACHE_ENABLED, "entries": row["entries"], "hits": row["hits"]}
+
+
+training_result_cache = TrainingResultCache(TRAINING_CACHE_DB)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Form, BackgroundTasks, Request
+from fastapi.responses import StreamingResponse
 import pandas as pd
-import numpy as np
 import logging
 import gc
 import os
@@ -13,18 +13,25 @@ from datetime import datetime
 from fastapi.security import OAuth2PasswordBearer
 from typing import Optional
 from .model import TrainingParameters
-from src.features.feature_engineering import fill_missing_values
+from src.features.feature_engineering import MissingValuesImputer
+from src.data.type_optimization import apply_dtype_schema, optimize_dtypes
 from sessions.utils import (
     create_session_directory,
     get_session_path,
     save_session_metadata,
+    update_session_metadata,
     load_session_metadata,
     cleanup_old_sessions,
-    save_training_file,
     get_model_path,
     training_sessions
 )
 from AutoML.manager import automl_manager
+from .executor import training_executor
+from .events import emit_event, stream_training_events, training_event_bus
+from .cancellation import TrainingCancelled
+from .ingestion import save_upload_to_disk, file_to_parquet, table_to_parquet, parquet_columns, parquet_num_rows
+from db.jwt_logic import get_current_user_db_creds
+from db.settings import settings
 
 
 
@@ -45,11 +52,11 @@ def get_training_status(session_id: str) -> Optional[Dict]:
 
 async def run_training_async(
     session_id: str,
-    df_train: pd.DataFrame,
+    train_path: str,
     training_params: TrainingParameters,
     original_filename: str,
 ):
-    """Асинхронный запуск процесса обучения."""
+    """Асинхронный запуск процесса обучения. train_path — train.parquet сессии."""
     try:
         logging.info(f"[run_training_async] Запуск обучения для session_id={session_id}, файл: {original_filename}")
         # Create session directory and save initial status
@@ -65,8 +72,7 @@ async def run_training_async(
         training_sessions[session_id] = status
         save_session_metadata(session_id, status)
 
-        status.update({"progress": 10})
-        save_session_metadata(session_id, status)
+        status = update_session_metadata(session_id, {"progress": 10}) or status
         
         # 2. Setup model directory
         model_path = get_model_path(session_id)
@@ -84,73 +90,89 @@ async def run_training_async(
             'metadata': 90
         }
 
-        train_func = partial(
-            train_model,
-            df_train=df_train,
-            training_params=training_params,
-            model_path=model_path,
-            session_id=session_id,
-            text_to_progress=text_to_progress
-        )
-        logging.info(f"[run_training_async] Передача задачи обучения в пул потоков...")
-        await asyncio.to_thread(train_func)
+        logging.info(f"[run_training_async] Передача задачи обучения в исполнитель обучений...")
+        await training_executor.run(session_id, train_path, training_params, text_to_progress)
 
-        # Update final status
-        status.update({
+        # Процесс обучения дописал в metadata.json (схема признаков и т.п.) — дописываем, не затирая эти данные
+        status = update_session_metadata(session_id, {
             "status": "completed",
             "end_time": datetime.now().isoformat(),
             "progress": 100,
             "model_path": model_path,
             "training_parameters": training_params.model_dump()  # сохраняем параметры обучения в финальном статусе
-        })
-        save_session_metadata(session_id, status)
+        }, create=True)
         training_sessions[session_id] = status
         logging.info(f"[run_training_async] Обучение завершено успешно для session_id={session_id}")
 
+    except TrainingCancelled:
+        # Статус cancelled и очистку артефактов записал исполнитель обучений
+        logging.info(f"[run_training_async] Обучение отменено для session_id={session_id}")
+        training_sessions[session_id] = load_session_metadata(session_id) or training_sessions.get(session_id, {})
     except Exception as e:
         error_msg = str(e)
         logging.error(f"[run_training_async] Ошибка обучения в сессии {session_id}: {error_msg}", exc_info=True)
-        status = training_sessions[session_id]
-        status.update({
+        training_sessions[session_id] = update_session_metadata(session_id, {
             "status": "failed",
             "error": error_msg,
             "end_time": datetime.now().isoformat()
-        })
-        save_session_metadata(session_id, status)
-        training_sessions[session_id] = status
+        }, create=True)
 
 def train_model(
     df_train: pd.DataFrame,
     training_params: TrainingParameters,
     model_path: str,
     session_id: str,
-    text_to_progress: dict | None
+    text_to_progress: dict | None,
+    resources: dict | None = None
 ) -> None:
-    """Основная функция обучения (запускается в отдельном потоке)."""
+    """Основная функция обучения (запускается в отдельном процессе исполнителя обучений)."""
     try:
-        status = training_sessions[session_id]
+        # Ключи, которые процесс обучения дописывает в metadata.json (под блокировкой, не затирая остальные)
+        status = {}
         logging.info(f"[train_model] Начало подготовки данных для session_id={session_id}")
         # Data Preparation (только для табличных данных)
-        df2 = df_train.copy()
-        # Обработка пропусков (если нужно)
-        df2 = fill_missing_values(
-            df2,
-            getattr(training_params, 'fill_missing_method', None),
-        )
+        # Кадр принадлежит процессу обучения — обрабатываем на месте, без копии.
+        # Повторное обучение (retrain_from_session): схема признаков и заполнение пропусков — из исходной сессии,
+        # чтобы новые модели видели признаки так же, как модели, чьи конфигурации переобучаются
+        source_metadata = None
+        if getattr(training_params, 'retrain_from_session', None):
+            source_metadata = load_session_metadata(training_params.retrain_from_session) or {}
+        # Сужаем типы и разбираем даты один раз; выбранная схема переиспользуется при прогнозе
+        if source_metadata and source_metadata.get("feature_schema") is not None:
+            feature_schema = source_metadata["feature_schema"]
+            df2 = apply_dtype_schema(df_train, feature_schema)
+            logging.info(f"[train_model] Схема признаков взята из сессии {training_params.retrain_from_session}")
+        else:
+            df2, feature_schema = optimize_dtypes(df_train, exclude=[training_params.target_column])
+        status["feature_schema"] = feature_schema
+        # Решения о датах для выгрузки прогноза в БД (auto_convert_dates): текстовые признаки — не даты
+        status["date_formats"] = {
+            col: spec.get("format") if spec["kind"] == "datetime" else None
+            for col, spec in feature_schema.items()
+            if spec["kind"] in ("datetime", "category", "string")
+        }
+        # Обработка пропусков (если нужно): статистики сохраняются в сессии и переиспользуются при прогнозе
+        if source_metadata and source_metadata.get("imputer") is not None:
+            imputer = MissingValuesImputer.from_dict(source_metadata["imputer"])
+        else:
+            imputer = MissingValuesImputer(getattr(training_params, 'fill_missing_method', None)).fit(df2)
+        df2 = imputer.transform(df2)
+        status["imputer"] = imputer.to_dict()
 
         logging.info(f"[train_model] Пропущенные значения обработаны методом: {getattr(training_params, 'fill_missing_method', None)}")
 
         status.update({"progress": text_to_progress['missings']})
-        
-        save_session_metadata(session_id, status)
+        update_session_metadata(session_id, status, create=True)
+        emit_event(session_id, "progress", stage="missings", progress=text_to_progress['missings'])
 
         if len(df2) != 0:
             for strategy in automl_manager.get_strategies():
-                strategy.train(df2, training_params, session_id)
+                strategy.train(df2, training_params, session_id, resources=resources)
 
         session_path = get_session_path(session_id)
         combined_leaderboard = automl_manager.combine_leaderboards(session_id, [s.name for s in automl_manager.get_strategies()])
         combined_leaderboard.to_csv(os.path.join(session_path, 'leaderboard.csv'), index=False)
+        emit_event(session_id, "progress", stage="metadata", progress=text_to_progress['metadata'])
         gc.collect()
         logging.info(f"[train_model] Очистка памяти завершена.")
     except Exception as e:
@@ -160,13 +182,16 @@ def train_model(
 
 @router.get("/training_status/{session_id}")
 async def get_session_status(session_id: str):
-    """Получить статус сессии обучения. Если завершено — добавить лидерборд."""
+    """Получить статус сессии обучения. Если завершено — добавить лидерборд и feature importance
+    (считается отдельно после обучения, его состояние — в feature_importance_status)."""
     logging.info(f"[get_training_status] Запрос статуса для session_id={session_id}")
     status = get_training_status(session_id)
     if status is None:
         logging.error(f"Сессия не найдена: {session_id}")
         raise HTTPException(status_code=404, detail="Training session not found")
     session_path = get_session_path(session_id)
+    # Позиция в очереди обучений: 0 — обучение идёт, N — ожидает N-й, None — нет в очереди
+    status["queue_position"] = training_executor.queue_position(session_id)
     if status.get("status") == "completed":
         leaderboard_path = os.path.join(session_path, "leaderboard.csv")
         leaderboard = None
@@ -186,6 +211,53 @@ async def get_session_status(session_id: str):
         status["feature_importance"] = feature_importance
     return status
 
+@router.get("/training_status_stream/{session_id}")
+async def training_status_stream(session_id: str):
+    """
+    SSE-поток статуса обучения вместо опроса /training_status: позиция в очереди, этапы подготовки,
+    старт и завершение каждой модели AutoGluon (оценка, время обучения, доля training_time_limit),
+    завершение обучения и расчёта feature importance. Поток закрывается, когда событий больше не будет.
+    """
+    if not training_event_bus.knows(session_id) and load_session_metadata(session_id) is None:
+        raise HTTPException(status_code=404, detail="Training session not found")
+
+    def snapshot() -> dict:
+        metadata = load_session_metadata(session_id) or {}
+        return {
+            "status": metadata.get("status"),
+            "progress": metadata.get("progress"),
+            "error": metadata.get("error"),
+            "feature_importance_status": metadata.get("feature_importance_status"),
+            "queue_position": training_executor.queue_position(session_id),
+        }
+
+    return StreamingResponse(
+        stream_training_events(session_id, snapshot, partial(training_executor.queue_position, session_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/cancel_training/{session_id}")
+async def cancel_training(session_id: str, keep_best: bool = False):
+    """
+    Отменить обучение сессии. keep_best=false — процесс обучения останавливается сразу, слот исполнителя
+    освобождается, частично обученные модели удаляются (сессия cancelled). keep_best=true — AutoGluon
+    завершает текущую модель и останавливается, обученные модели сохраняются и доступны для прогноза.
+    """
+    if load_session_metadata(session_id) is None:
+        raise HTTPException(status_code=404, detail="Training session not found")
+    result = await asyncio.to_thread(training_executor.cancel, session_id, keep_best)
+    if not result["jobs"]:
+        raise HTTPException(status_code=409, detail="У сессии нет обучения в очереди или в работе")
+    return result
+
+@router.get("/training_queue")
+async def get_training_queue():
+    """Состояние исполнителя обучений: активные сессии, длина очереди, бюджет ресурсов на обучение."""
+    stats = training_executor.stats()
+    stats["event_bus"] = training_event_bus.stats()
+    return stats
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 def optional_oauth2_scheme(request: Request) -> Optional[str]:
@@ -204,91 +276,129 @@ async def train_tabular_endpoint(
     train_file: UploadFile = File(None),
     test_file: UploadFile = File(None),
     background_tasks: BackgroundTasks = None,
+    token: Optional[str] = Depends(optional_oauth2_scheme),
 ):
     """
     Эндпоинт для обучения табличных данных (AutoGluon Tabular).
     Принимает параметры обучения одним JSON-стрингом (params), два файла (train_file, test_file), сохраняет их в сессию и запускает обучение.
+    Без train_file датасет берётся из таблицы БД download_table_name (нужен токен авторизации).
     Возвращает session_id для отслеживания статуса.
     """
     try:
+        # Учетные данные БД нужны только для загрузки датасета из таблицы
+        db_creds = await get_current_user_db_creds(token) if token and train_file is None else None
         # Вся подготовка вынесена в функцию ниже
-        df_train, training_params, session_path, status = prepare_training_data_and_status(
-            params, train_file, test_file
+        train_path, training_params, session_path, status = await prepare_training_data_and_status(
+            params, train_file, test_file, db_creds=db_creds
         )
         session_id = status['session_id']
+        original_filename = train_file.filename if train_file else status['download_table']
         # Запускаем обучение через run_training_async в фоне
         if background_tasks is not None:
-            background_tasks.add_task(run_training_async, session_id, df_train, training_params, train_file.filename)
+            background_tasks.add_task(run_training_async, session_id, train_path, training_params, original_filename)
         else:
             import threading
-            threading.Thread(target=lambda: asyncio.run(run_training_async(session_id, df_train, training_params, train_file.filename)), daemon=True).start()
+            threading.Thread(target=lambda: asyncio.run(run_training_async(session_id, train_path, training_params, original_filename)), daemon=True).start()
         return {"session_id": session_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"[train_tabular_endpoint] Ошибка: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def prepare_training_data_and_status(
+def validate_retrain_source(training_params: TrainingParameters) -> None:
+    """Проверяет, что сессия retrain_from_session обучена и предсказывает ту же целевую колонку."""
+    source_id = training_params.retrain_from_session
+    source = load_session_metadata(source_id)
+    if source is None:
+        raise HTTPException(status_code=404, detail=f"Сессия для повторного обучения не найдена: {source_id}")
+    model_metadata_path = os.path.join(get_session_path(source_id), "autogluon", "model_metadata.json")
+    if source.get("status") != "completed" or not os.path.exists(model_metadata_path):
+        raise HTTPException(status_code=400, detail=f"В сессии {source_id} нет обученных моделей для повторного обучения")
+    source_target = (source.get("training_parameters") or {}).get("target_column")
+    if source_target != training_params.target_column:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Целевая колонка '{training_params.target_column}' не совпадает с колонкой '{source_target}' сессии {source_id}",
+        )
+
+async def prepare_training_data_and_status(
     params: str,
     train_file: UploadFile = None,
     test_file: UploadFile = None,
-    session_id: str = None
+    session_id: str = None,
+    db_creds: dict = None
 ):
     """
     Универсальная функция подготовки данных и статуса для обучения (используется в train_prediction_save).
-    Возвращает: df_train, training_params, session_path, status
+    Источник обучающих данных — train_file или, если файла нет, таблица БД из download_table_name
+    (нужны db_creds пользователя). Данные не загружаются в память: обучающий кадр материализуется
+    только в процессе обучения.
+    Возвращает: train_parquet_path, training_params, session_path, status
     """
     if session_id is None:
         session_id = str(uuid.uuid4())
     session_path = create_session_directory(session_id)
     params_dict = json.loads(params)
     training_params = TrainingParameters(**params_dict)
-    # Сохраняем train файл
+    if not training_params.target_column:
+        raise HTTPException(status_code=400, detail="target_column must be specified in params")
+    if training_params.retrain_from_session:
+        validate_retrain_source(training_params)
+    train_parquet_path = os.path.join(session_path, "train.parquet")
+    download_table = None
+    # Сохраняем train файл на диск кусками и потоково конвертируем в train.parquet
     if train_file is not None:
         train_path = os.path.join(session_path, f"train_{train_file.filename}")
-        train_bytes = train_file.file.read() if hasattr(train_file, 'file') else train_file.read()
-        with open(train_path, "wb") as f:
-            f.write(train_bytes)
+        # Копирование и конвертация многогигабайтного файла — в потоке, event loop API не блокируется
+        await asyncio.to_thread(save_upload_to_disk, train_file, train_path)
+        await asyncio.to_thread(file_to_parquet, train_path, train_parquet_path)
+    elif training_params.download_table_name:
+        if db_creds is None:
+            raise HTTPException(status_code=401, detail="Для обучения на таблице из БД требуется авторизация")
+        download_schema = training_params.download_table_schema or settings.SCHEMA
+        download_table = f"{download_schema}.{training_params.download_table_name}"
+        columns = training_params.download_columns
+        if columns and training_params.target_column not in columns:
+            columns = list(columns) + [training_params.target_column]
+        try:
+            await table_to_parquet(
+                download_schema,
+                training_params.download_table_name,
+                db_creds["username"],
+                db_creds["password"],
+                train_parquet_path,
+                columns=columns,
+                sample_percent=training_params.download_sample_percent,
+                filters=[condition.model_dump() for condition in training_params.download_filter or []],
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     else:
         raise HTTPException(status_code=400, detail="train_file is required")
     # Сохраняем test файл (если есть)
     test_path = None
     if test_file is not None:
         test_path = os.path.join(session_path, f"test_{test_file.filename}")
-        test_bytes = test_file.file.read() if hasattr(test_file, 'file') else test_file.read()
-        with open(test_path, "wb") as f:
-            f.write(test_bytes)
-    # Читаем train в DataFrame
-    def read_df(path):
-        if path.endswith('.csv'):
-            return pd.read_csv(path)
-        elif path.endswith('.xlsx') or path.endswith('.xls'):
-            return pd.read_excel(path)
-        else:
-            raise ValueError("Файл должен быть .csv или .xlsx/.xls")
-    df_train = read_df(train_path)
-    # Сохраняем train.parquet
-    train_parquet_path = os.path.join(session_path, "train.parquet")
-    df_train.to_parquet(train_parquet_path, index=False)
-    # Если есть test, читаем и сохраняем prediction.parquet
-    df_test = None
+        await asyncio.to_thread(save_upload_to_disk, test_file, test_path)
+    # Если есть test, сохраняем prediction.parquet
     if test_path is not None:
-        df_test = read_df(test_path)
         prediction_parquet_path = os.path.join(session_path, "prediction.parquet")
-        df_test.to_parquet(prediction_parquet_path, index=False)
-    # Проверяем наличие целевой переменной
-    if not training_params.target_column:
-        raise HTTPException(status_code=400, detail="target_column must be specified in params")
-    if training_params.target_column not in df_train.columns:
+        await asyncio.to_thread(file_to_parquet, test_path, prediction_parquet_path)
+    # Проверяем наличие целевой переменной по схеме parquet, не загружая данные
+    if training_params.target_column not in parquet_columns(train_parquet_path):
         raise HTTPException(status_code=400, detail=f"В train-файле должна быть колонка '{training_params.target_column}'")
+    logging.info(f"[prepare_training_data_and_status] train.parquet готов: {parquet_num_rows(train_parquet_path)} строк")
     # Сохраняем начальный статус
     status = {
         'status': 'running',
         'session_id': session_id,
         'train_file': train_file.filename if train_file else None,
         'test_file': test_file.filename if test_file else None,
+        'download_table': download_table,
         'session_path': session_path,
         'training_parameters': params_dict
     }
     save_session_metadata(session_id, status)
     training_sessions[session_id] = status
-    return df_train, training_params, session_path, status
\ No newline at end of file
+    return train_parquet_path, training_params, session_path, status
\ No newline at end of file
@@ -6,6 +6,8 @@ import tempfile
 from datetime import datetime, timedelta
 import logging
 
+from AutoML.predictor_cache import predictor_cache
+
 def cleanup_old_training_sessions(training_sessions_dir: str):
     now = time.time()
     for folder in os.listdir(training_sessions_dir):
@@ -16,6 +18,7 @@ def cleanup_old_training_sessions(training_sessions_dir: str):
             if now - mtime > 2 * 24 * 60 * 60:
                 try:
                     shutil.rmtree(folder_path)
+                    predictor_cache.invalidate(folder_path)
                     logging.info(f"Deleted old training session folder: {folder_path}")
                 except Exception as e:
                     logging.error(f"Failed to delete {folder_path}: {e}")
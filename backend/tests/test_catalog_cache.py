@@ -0,0 +1,54 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import asyncio
+import pytest
+from db.catalog import CatalogCache
+
+
+def test_catalog_cache_ttl_and_invalidation():
+    cache = CatalogCache(ttl_seconds=60)
+    calls = []
+
+    def loader(value):
+        async def load():
+            calls.append(value)
+            return value
+        return load
+
+    async def scenario():
+        assert await cache.get_or_load("u", "tables_by_schema", (), loader({"public": ["a"]})) == {"public": ["a"]}
+        assert await cache.get_or_load("u", "tables_by_schema", (), loader({"public": ["a", "b"]})) == {"public": ["a"]}
+        await cache.get_or_load("u", "columns", ("public", "a"), loader([("id", "integer")]))
+        await cache.get_or_load("u", "columns", ("public", "other"), loader([("x", "text")]))
+        # Новая таблица: сбрасываются списки таблиц и метаданные только этой таблицы
+        cache.invalidate("public", "a")
+        assert await cache.get_or_load("u", "tables_by_schema", (), loader({"public": ["a", "b"]})) == {"public": ["a", "b"]}
+        assert await cache.get_or_load("u", "columns", ("public", "other"), loader(None)) == [("x", "text")]
+        assert await cache.get_or_load("u", "columns", ("public", "a"), loader([("id", "bigint")])) == [("id", "bigint")]
+        assert await cache.get_or_load("u", "tables_by_schema", (), loader({}), refresh=True) == {}
+
+    asyncio.run(scenario())
+    assert cache.stats()["hits"] == 2
+
+
+def test_failed_pk_lookup_is_not_cached():
+    from db.db_manager import _get_pk_columns
+
+    class FlakyConnection:
+        calls = 0
+
+        async def fetch(self, query, *args):
+            self.calls += 1
+            if self.calls == 1:
+                raise ConnectionResetError("connection lost")
+            return [{"column_name": "id"}]
+
+    async def scenario():
+        conn = FlakyConnection()
+        with pytest.raises(ConnectionResetError):
+            await _get_pk_columns(conn, "public", "pk_flaky", "pk_user")
+        # После временной ошибки upsert не должен превратиться в обычную вставку
+        assert await _get_pk_columns(conn, "public", "pk_flaky", "pk_user") == ["id"]
+
+    asyncio.run(scenario())
@@ -89,6 +89,28 @@ async def test_upload_df_to_db(db_credentials, temp_table, sample_df):
         rows = await conn.fetch(f'SELECT * FROM "{db_credentials["schema"]}"."{temp_table}"')
         assert len(rows) == len(sample_df)
 
+@pytest.mark.asyncio
+async def test_upload_df_to_db_parallel_upsert(db_credentials, temp_table, sample_df, monkeypatch):
+    monkeypatch.setattr(db_manager, "UPLOAD_MIN_PARTITION_ROWS", 1)
+    await db_manager.create_table_from_df(
+        sample_df, db_credentials["schema"], temp_table,
+        db_credentials["username"], db_credentials["password"], primary_keys=["id"]
+    )
+    stats = await db_manager.upload_df_to_db_parallel(
+        sample_df, db_credentials["schema"], temp_table,
+        db_credentials["username"], db_credentials["password"], workers=3
+    )
+    assert stats["rows"] == len(sample_df)
+    assert stats["partitions"] > 1
+    # Повторная загрузка — upsert по PK, дублей нет
+    await db_manager.upload_df_to_db_parallel(
+        sample_df, db_credentials["schema"], temp_table,
+        db_credentials["username"], db_credentials["password"], workers=3
+    )
+    async with db_manager.get_connection(db_credentials["username"], db_credentials["password"]) as conn:
+        rows = await conn.fetch(f'SELECT * FROM "{db_credentials["schema"]}"."{temp_table}"')
+        assert len(rows) == len(sample_df)
+
 @pytest.mark.asyncio
 async def test_upload_dicts_to_db(db_credentials, temp_table, sample_dicts):
     # Создаем таблицу вручную
@@ -127,6 +149,33 @@ async def test_fetch_table_as_dataframe(db_credentials, temp_table, sample_df):
     assert isinstance(df, pd.DataFrame)
     assert len(df) == len(sample_df)
 
+@pytest.mark.asyncio
+async def test_stream_table_batches(db_credentials, temp_table, sample_df):
+    await db_manager.create_table_from_df(
+        sample_df, db_credentials["schema"], temp_table,
+        db_credentials["username"], db_credentials["password"], primary_keys=["id"]
+    )
+    await db_manager.upload_df_to_db(
+        sample_df, db_credentials["schema"], temp_table,
+        db_credentials["username"], db_credentials["password"], update_on_pk=True
+    )
+    batches = [
+        batch async for batch in db_manager.stream_table_batches(
+            db_credentials["schema"], temp_table,
+            db_credentials["username"], db_credentials["password"], batch_size=2
+        )
+    ]
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert list(batches[0].columns) == list(sample_df.columns)
+    arrow_batches = [
+        batch async for batch in db_manager.stream_table_batches(
+            db_credentials["schema"], temp_table,
+            db_credentials["username"], db_credentials["password"], batch_size=2,
+            columns=["id", "str_col"], as_arrow=True
+        )
+    ]
+    assert arrow_batches[0].schema.names == ["id", "str_col"]
+
 @pytest.mark.asyncio
 async def test_check_df_matches_table_schema(db_credentials, temp_table, sample_df):
     await db_manager.create_table_from_df(
@@ -278,3 +327,20 @@ async def fetch_table_as_dataframe_with_schema(schema: str, table_name: str, use
         query = f'SELECT * FROM "{schema}"."{table_name}"'
         rows = await conn.fetch(query)
         return pd.DataFrame([dict(row) for row in rows]) if rows else pd.DataFrame()
+
+def test_auto_convert_dates_reuses_detected_formats():
+    df = pd.DataFrame({
+        "iso": ["2024-01-01", None, "2024-02-01"],
+        "ru": ["01.02.2024", "03.04.2024", None],
+        "text": ["abc", "def", "xyz"],
+        "dates": [datetime.date(2024, 1, 1), None, datetime.date(2024, 1, 2)],
+    })
+    formats = db_manager.detect_date_formats(df)
+    assert formats == {"iso": "%Y-%m-%d", "ru": "%d.%m.%Y", "text": None, "dates": "mixed"}
+    converted = db_manager.auto_convert_dates(df, formats)
+    assert converted["ru"].iloc[1] == pd.Timestamp(2024, 4, 3)
+    assert str(converted["text"].dtype) == "object"
+    # Исходный кадр не изменяется
+    assert df["iso"].dtype == object
+    # Известные решения не пересматриваются
+    assert str(db_manager.auto_convert_dates(df, {"iso": None})["iso"].dtype) == "object"
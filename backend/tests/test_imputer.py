@@ -0,0 +1,36 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import json
+import numpy as np
+import pandas as pd
+from src.features.feature_engineering import MissingValuesImputer, fill_missing_values
+
+
+def test_imputer_uses_training_statistics():
+    train = pd.DataFrame({
+        "x": [1.0, 2.0, 3.0, np.nan],
+        "city": ["a", "b", "b", None],
+        "kind": pd.Series(["u", "v", "v", None], dtype="category"),
+    })
+    imputer = MissingValuesImputer("Mean").fit(train)
+    assert imputer.fill_values == {"x": 2.0, "city": "b", "kind": "v"}
+
+    # Состояние переживает сохранение в metadata.json
+    restored = MissingValuesImputer.from_dict(json.loads(json.dumps(imputer.to_dict())))
+    test = pd.DataFrame({
+        "x": [np.nan, 100.0],
+        "city": [None, "z"],
+        "kind": pd.Series([None, "u"], dtype="category"),
+    })
+    out = restored.transform(test)
+    assert out["x"].tolist() == [2.0, 100.0]
+    assert out["city"].tolist() == ["b", "z"]
+    assert out["kind"].tolist() == ["v", "u"]
+
+
+def test_fill_missing_values_keeps_legacy_behaviour():
+    df = pd.DataFrame({"x": [1.0, np.nan, 5.0], "c": ["a", None, "a"]})
+    out = fill_missing_values(df, "Median")
+    assert out["x"].tolist() == [1.0, 3.0, 5.0]
+    assert out["c"].tolist() == ["a", "a", "a"]
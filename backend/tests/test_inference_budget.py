@@ -0,0 +1,20 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import pandas as pd
+
+from AutoML.automl import select_within_inference_budget
+
+
+def test_select_within_inference_budget():
+    leaderboard = pd.DataFrame({
+        "model": ["WeightedEnsemble_L2", "LightGBM", "KNeighbors"],
+        "score_val": [0.95, 0.93, 0.90],
+        "infer_time_per_row_ms": [0.8, 0.05, 0.02],
+    })
+    assert select_within_inference_budget(leaderboard, None)["model"] == "WeightedEnsemble_L2"
+    assert select_within_inference_budget(leaderboard, 0.1)["model"] == "LightGBM"
+    # Ни одна модель не укладывается в бюджет — берётся самая быстрая
+    assert select_within_inference_budget(leaderboard, 0.001)["model"] == "KNeighbors"
+    # Старые лидерборды без замеров — первая строка
+    assert select_within_inference_budget(leaderboard.drop(columns=["infer_time_per_row_ms"]), 0.1)["model"] == "WeightedEnsemble_L2"
@@ -0,0 +1,100 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import io
+import pytest
+import pandas as pd
+import pyarrow.parquet as pq
+from training import ingestion
+
+
+def test_save_upload_to_disk_copies_in_chunks(tmp_path):
+    data = b"a,b\n" + b"1,2\n" * 1000
+    path = tmp_path / "upload.csv"
+    assert ingestion.save_upload_to_disk(io.BytesIO(data), str(path)) == len(data)
+    assert path.read_bytes() == data
+
+
+def test_csv_to_parquet_widens_types_seen_after_sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "CSV_SCHEMA_SAMPLE_BYTES", 200)
+    lines = ["id,cat,empty,date"] + [f"{i},c{i % 3},,2024-01-0{i % 9 + 1}" for i in range(5000)]
+    lines.append("1.5,c9,late,2024-02-01")
+    csv_path = tmp_path / "train.csv"
+    csv_path.write_text("\n".join(lines) + "\n")
+    parquet_path = str(tmp_path / "train.parquet")
+
+    ingestion.csv_to_parquet(str(csv_path), parquet_path, block_size=16 * 1024)
+
+    assert pq.ParquetFile(parquet_path).num_row_groups > 1
+    df = pd.read_parquet(parquet_path)
+    expected = pd.read_csv(csv_path)
+    assert len(df) == len(expected)
+    assert df["id"].dtype == "float64"
+    assert df["id"].iloc[-1] == 1.5
+    assert df["empty"].iloc[-1] == "late"
+    # Даты остаются строками, как в pd.read_csv
+    assert df["date"].iloc[0] == expected["date"].iloc[0]
+    assert ingestion.parquet_columns(parquet_path) == ["id", "cat", "empty", "date"]
+
+
+def test_csv_to_parquet_reads_missing_values_like_pandas(tmp_path):
+    csv_path = tmp_path / "train.csv"
+    csv_path.write_text('a,b,c\n1,x,2020-01-01\n2,,\n,y,2020-01-03\n3,"",NA\n')
+    parquet_path = str(tmp_path / "train.parquet")
+
+    ingestion.csv_to_parquet(str(csv_path), parquet_path)
+
+    df = pd.read_parquet(parquet_path)
+    expected = pd.read_csv(csv_path)
+    assert df.isna().sum().tolist() == expected.isna().sum().tolist() == [1, 2, 2]
+    assert df["b"].tolist()[0] == "x"
+
+
+def test_csv_to_parquet_collects_all_widenings_in_one_pass(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "CSV_SCHEMA_SAMPLE_BYTES", 200)
+    calls = []
+    convert = ingestion._csv_to_parquet_with_schema
+    monkeypatch.setattr(ingestion, "_csv_to_parquet_with_schema", lambda *args: calls.append(1) or convert(*args))
+    lines = ["a,b,c"] + [f"{i},{i},{i}" for i in range(5000)]
+    lines += ["1.5,2,3", "4,x,6", "7,8,9.25"]
+    csv_path = tmp_path / "train.csv"
+    csv_path.write_text("\n".join(lines) + "\n")
+    parquet_path = str(tmp_path / "train.parquet")
+
+    schema = ingestion.csv_to_parquet(str(csv_path), parquet_path, block_size=16 * 1024)
+
+    # Первая попытка + одна после прохода, собравшего все три расширения
+    assert len(calls) == 2
+    assert [str(field.type) for field in schema] == ["double", "string", "double"]
+    assert len(pd.read_parquet(parquet_path)) == 5003
+
+
+def test_download_filter_is_parameterized():
+    from db.db_manager import build_filter_clause
+
+    column_types = {"region": "text", "amount": "numeric(12,2)", "day": "date"}
+    where, params = build_filter_clause([
+        {"column": "region", "op": "in", "value": ["north", "x'); DROP TABLE t; --"]},
+        {"column": "amount", "op": ">=", "value": 10},
+        {"column": "day", "op": "not_null"},
+    ], column_types)
+    assert where == '"region" = ANY($1::text[]::text[]) AND "amount" >= $2::text::numeric(12,2) AND "day" IS NOT NULL'
+    assert params == [["north", "x'); DROP TABLE t; --"], "10"]
+    with pytest.raises(ValueError):
+        build_filter_clause([{"column": "1=1 OR region", "op": "=", "value": 1}], column_types)
+    with pytest.raises(ValueError):
+        build_filter_clause([{"column": "amount", "op": "; DELETE", "value": 1}], column_types)
+
+
+def test_table_to_parquet_first_batch_all_null(tmp_path, monkeypatch):
+    import asyncio
+    import pyarrow as pa
+
+    async def batches(*args, **kwargs):
+        yield pa.RecordBatch.from_pydict({"id": [1, 2], "note": pa.array([None, None])})
+        yield pa.RecordBatch.from_pydict({"id": [3], "note": ["late"]})
+    monkeypatch.setattr(ingestion, "stream_table_batches", batches)
+    parquet_path = str(tmp_path / "train.parquet")
+
+    assert asyncio.run(ingestion.table_to_parquet("public", "t", "u", "p", parquet_path)) == 3
+    assert pd.read_parquet(parquet_path)["note"].tolist() == [None, None, "late"]
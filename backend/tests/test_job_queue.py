@@ -0,0 +1,139 @@
+import sys, os, tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+os.environ.setdefault("TRAINING_JOBS_DB", os.path.join(tempfile.mkdtemp(), "training_jobs.sqlite3"))
+
+import time
+import pytest
+from training.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_claim_respects_priority_then_fifo(queue):
+    queue.enqueue("s1", {"n": 1})
+    queue.enqueue("s2", {"n": 2})
+    queue.enqueue("s3", {"n": 3}, priority=-1)
+    assert queue.queue_position("s3") == 1
+    assert queue.queue_position("s1") == 2
+    claimed = [queue.claim("w1")["session_id"] for _ in range(3)]
+    assert claimed == ["s3", "s1", "s2"]
+    assert queue.claim("w1") is None
+    assert queue.queue_position("s1") == 0
+
+
+def test_enqueue_is_idempotent_for_active_session(queue):
+    first = queue.enqueue("s1", {"n": 1})
+    assert queue.enqueue("s1", {"n": 2}) == first
+    job = queue.claim("w1")
+    queue.finish(job["job_id"])
+    assert queue.get(first)["status"] == "completed"
+    assert queue.enqueue("s1", {"n": 3}) != first
+
+
+def test_two_workers_never_claim_the_same_job(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    worker_a, worker_b = JobQueue(path), JobQueue(path)
+    worker_a.enqueue("s1", {})
+    first = worker_a.claim("a")
+    second = worker_b.claim("b")
+    assert first["session_id"] == "s1"
+    assert second is None
+
+
+def test_orphans_are_requeued_then_failed(queue):
+    queue.enqueue("s1", {})
+    job = queue.claim("dead-worker")
+    time.sleep(0.05)
+    recovered = queue.recover_orphans(stale_after=0.01, max_attempts=2)
+    assert [j["status"] for j in recovered] == ["queued"]
+    assert queue.claim("w2")["job_id"] == job["job_id"]
+    time.sleep(0.05)
+    recovered = queue.recover_orphans(stale_after=0.01, max_attempts=2)
+    assert [j["status"] for j in recovered] == ["failed"]
+    assert queue.get(job["job_id"])["status"] == "failed"
+
+
+def test_orphan_with_live_process_is_not_requeued(queue):
+    queue.enqueue("s1", {})
+    job = queue.claim("host:1")
+    queue.set_process(job["job_id"], 4242, 1000.0)
+    time.sleep(0.05)
+    stale = queue.stale_jobs(stale_after=0.01)
+    assert [(j["pid"], j["pid_created_at"]) for j in stale] == [(4242, 1000.0)]
+    # Процесс задания не остановлен — задание остаётся running до следующей проверки
+    assert queue.recover_orphans(stale_after=0.01, max_attempts=2, job_ids=[]) == []
+    assert queue.get(job["job_id"])["status"] == "running"
+    recovered = queue.recover_orphans(stale_after=0.01, max_attempts=2, job_ids=[job["job_id"]])
+    assert [j["status"] for j in recovered] == ["queued"]
+    assert queue.get(job["job_id"])["pid"] is None
+
+
+def test_stop_orphan_process_kills_surviving_child():
+    psutil = pytest.importorskip("psutil")
+    import socket
+    import subprocess
+    from training.executor import _stop_orphan_process
+
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    try:
+        job = {"job_id": "j1", "kind": "train", "session_id": "s1", "worker_id": f"{socket.gethostname()}:1", "pid": child.pid}
+        # Другой процесс с тем же pid (не совпадает время создания) не трогаем
+        assert _stop_orphan_process({**job, "pid_created_at": 0.0})
+        assert child.poll() is None
+        assert _stop_orphan_process({**job, "pid_created_at": psutil.Process(child.pid).create_time()})
+        assert child.wait(timeout=10) is not None
+    finally:
+        child.kill()
+
+
+def test_low_priority_kind_runs_after_trainings(queue):
+    queue.enqueue("s1", {}, priority=100, kind="feature_importance")
+    queue.enqueue("s2", {})
+    # Позиция обучения не учитывает задания других типов той же сессии
+    assert queue.queue_position("s1", kind="train") is None
+    assert queue.queue_position("s1") == 2
+    assert [queue.claim("w1")["kind"] for _ in range(2)] == ["train", "feature_importance"]
+
+
+def test_cancel_queued_and_running_jobs(queue):
+    running = queue.enqueue("s1", {})
+    queue.claim("w1")
+    queued = queue.enqueue("s1", {}, kind="feature_importance")
+    jobs = {job["job_id"]: job for job in queue.request_cancel("s1", "keep_best")}
+    # Задание в очереди снимается сразу, выполняющееся — ждёт воркера-владельца
+    assert jobs[queued]["status"] == "cancelled"
+    assert jobs[running]["status"] == "running"
+    assert queue.cancel_requests([running]) == {running: "keep_best"}
+    assert queue.claim("w1") is None
+    time.sleep(0.05)
+    # Воркер пропал, не применив отмену — задание не возвращается в очередь
+    recovered = queue.recover_orphans(stale_after=0.01, max_attempts=2)
+    assert [j["status"] for j in recovered] == ["cancelled"]
+    assert queue.get(running)["status"] == "cancelled"
+
+
+def _bump_metadata(session_id, key, times):
+    from sessions.utils import update_session_metadata
+    for i in range(times):
+        update_session_metadata(session_id, {key: i + 1})
+
+
+def test_concurrent_metadata_updates_are_not_lost(tmp_path, monkeypatch):
+    import multiprocessing
+    from sessions import utils
+
+    monkeypatch.setattr(utils, "SESSIONS_BASE_PATH", str(tmp_path))
+    utils.create_session_directory("s1")
+    utils.save_session_metadata("s1", {"status": "running"})
+    # Процесс обучения и задание feature importance пишут metadata.json одновременно
+    ctx = multiprocessing.get_context("fork")
+    processes = [ctx.Process(target=_bump_metadata, args=("s1", f"key{i}", 50)) for i in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    metadata = utils.load_session_metadata("s1")
+    assert metadata == {"status": "running", "key0": 50, "key1": 50, "key2": 50, "key3": 50}
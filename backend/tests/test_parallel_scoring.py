@@ -0,0 +1,41 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from prediction.parallel import _merge_parts, _rechunk_parquet
+
+
+def test_rechunk_and_merge_keep_row_order(tmp_path):
+    source = tmp_path / "prediction.parquet"
+    pd.DataFrame({"x": range(25), "c": ["a", "b", "c", "d", "e"] * 5}).to_parquet(source, index=False)
+
+    rechunked = tmp_path / "input.parquet"
+    _rechunk_parquet(str(source), str(rechunked), chunk_rows=10)
+    parquet_file = pq.ParquetFile(rechunked)
+    assert [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)] == [10, 10, 5]
+
+    # Части пишутся воркерами независимо, склейка — в порядке row group'ов
+    part_paths = []
+    for i in range(parquet_file.num_row_groups):
+        part = parquet_file.read_row_group(i).to_pandas()
+        part["y"] = part["x"] * 2
+        part_path = tmp_path / f"part_{i:06d}.parquet"
+        part.to_parquet(part_path, index=False)
+        part_paths.append(str(part_path))
+    output = tmp_path / "out.parquet"
+    _merge_parts(part_paths, str(output))
+
+    result = pd.read_parquet(output)
+    assert result["x"].tolist() == list(range(25))
+    assert (result["y"] == result["x"] * 2).all()
+
+
+def test_merge_parts_with_all_null_first_part(tmp_path):
+    first, second = tmp_path / "part_000000.parquet", tmp_path / "part_000001.parquet"
+    pd.DataFrame({"x": [1, 2], "note": [None, None]}).to_parquet(first, index=False)
+    pd.DataFrame({"x": [3], "note": ["late"]}).to_parquet(second, index=False)
+    output = tmp_path / "out.parquet"
+    _merge_parts([str(first), str(second)], str(output))
+    assert pd.read_parquet(output)["note"].tolist() == [None, None, "late"]
@@ -0,0 +1,147 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import asyncio
+import contextlib
+import time
+
+import pandas as pd
+import pytest
+from db import pool_manager as pm
+
+
+class FakePool:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = False
+
+    async def acquire(self):
+        return object()
+
+    async def release(self, conn):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+
+    def get_size(self):
+        return 1
+
+    def get_idle_size(self):
+        return 1
+
+
+@pytest.fixture
+def fake_pools(monkeypatch):
+    created = []
+
+    async def create_pool(**kwargs):
+        pool = FakePool(**kwargs)
+        created.append(pool)
+        return pool
+
+    monkeypatch.setattr(pm.asyncpg, "create_pool", create_pool)
+    monkeypatch.setenv("DB_PORT", "5432")
+    return created
+
+
+def test_pool_reused_per_credentials_and_total_cap(fake_pools):
+    async def scenario():
+        manager = pm.PoolManager(max_size_per_user=3, max_total=5, idle_seconds=300)
+        async with manager.acquire("alice", "pw"):
+            pass
+        async with manager.acquire("alice", "pw"):
+            pass
+        assert len(fake_pools) == 1
+        assert fake_pools[0].kwargs["max_size"] == 3
+
+        # Бюджета осталось на 2 соединения
+        async with manager.acquire("bob", "pw"):
+            assert fake_pools[1].kwargs["max_size"] == 2
+        # Бюджет исчерпан — закрывается давно не использованный простаивающий пул alice
+        async with manager.acquire("carol", "pw"):
+            pass
+        assert fake_pools[0].closed
+        stats = manager.stats()
+        assert sorted(p["username"] for p in stats["pools"]) == ["bob", "carol"]
+        assert stats["total_max_size"] <= 5
+        own = manager.stats(username="bob")
+        assert [p["username"] for p in own["pools"]] == ["bob"]
+        assert own["pools_count"] == 2 and own["total_max_size"] == stats["total_max_size"]
+
+        await manager.close_all()
+        assert manager.stats()["pools"] == []
+
+    asyncio.run(scenario())
+
+
+def test_stale_staging_tables_by_age_in_name():
+    from db.db_manager import _staging_table_name, stale_staging_tables
+
+    fresh = _staging_table_name()
+    old = "_stage_1000_" + "0" * 32
+    names = [fresh, old, "_stage_sales", "sales"]
+    assert stale_staging_tables(names, now=time.time(), max_age_seconds=3600) == [old]
+
+
+class FakeConnection:
+    def __init__(self, pk_columns):
+        self.pk_columns = pk_columns
+        self.executed = []
+        self.copied = {}
+
+    async def fetch(self, query, *args):
+        if "PRIMARY KEY" in query:
+            return [{"column_name": col} for col in self.pk_columns]
+        return []
+
+    async def execute(self, query, *args):
+        self.executed.append(query)
+
+    async def copy_records_to_table(self, table_name, records, columns, schema_name=None):
+        self.copied.setdefault(table_name, []).extend(records)
+
+    def transaction(self):
+        return _FakeTransaction()
+
+
+class _FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.mark.parametrize("pk_columns", [[], ["id"]])
+def test_upload_df_to_db_bulk_and_parallel(monkeypatch, pk_columns):
+    from db import db_manager
+
+    conn = FakeConnection(pk_columns)
+
+    @contextlib.asynccontextmanager
+    async def get_connection(username, password):
+        yield conn
+
+    monkeypatch.setattr(db_manager, "get_connection", get_connection)
+    monkeypatch.setattr(db_manager, "UPLOAD_MIN_PARTITION_ROWS", 1)
+    df = pd.DataFrame({"id": [1, 2, 2], "value": [0.5, None, 1.5]})
+
+    user = f"upload_{len(pk_columns)}"
+    assert asyncio.run(db_manager.upload_df_to_db(df, "public", "target", user, "pw"))
+    if pk_columns:
+        staging = next(name for name in conn.copied if name.startswith("_stage_"))
+        assert conn.copied[staging] == [(1, 0.5), (2, 1.5)]
+        assert 'ON CONFLICT ("id") DO UPDATE SET "value" = EXCLUDED."value"' in conn.executed[-1]
+    else:
+        assert conn.copied["target"] == [(1, 0.5), (2, None), (2, 1.5)]
+
+    conn.copied.clear()
+    stats = asyncio.run(db_manager.upload_df_to_db_parallel(df, "public", "target", user, "pw", workers=2))
+    assert stats["partitions"] == 2
+    staging = next(name for name in conn.copied if name.startswith("_stage_"))
+    assert set(conn.copied[staging]) == ({(1, 0.5), (2, 1.5)} if pk_columns else {(1, 0.5), (2, None), (2, 1.5)})
+    assert conn.executed[-1].startswith('DROP TABLE IF EXISTS "public"."_stage_')
@@ -0,0 +1,71 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import pytest
+from AutoML.predictor_cache import PredictorCache
+
+
+def make_model_dir(tmp_path, name, size):
+    model_dir = tmp_path / name
+    model_dir.mkdir()
+    (model_dir / "predictor.pkl").write_bytes(b"x" * size)
+    return str(model_dir)
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def cache(loads):
+    def loader(path):
+        loads.append(path)
+        return {"path": path}
+    return PredictorCache(max_bytes=250, loader=loader)
+
+
+def test_hit_and_miss_counters(tmp_path, cache, loads):
+    path = make_model_dir(tmp_path, "a", 100)
+    first = cache.get(path)
+    second = cache.get(path)
+    assert first is second
+    assert len(loads) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_lru_eviction_by_size(tmp_path, cache, loads):
+    a = make_model_dir(tmp_path, "a", 100)
+    b = make_model_dir(tmp_path, "b", 100)
+    c = make_model_dir(tmp_path, "c", 100)
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)  # a становится самым свежим
+    cache.get(c)  # превышен бюджет — вытесняется b
+    assert cache.stats()["evictions"] == 1
+    cache.get(a)
+    cache.get(b)
+    assert loads.count(b) == 2
+    assert loads.count(a) == 1
+
+
+def test_invalidate_session_prefix(tmp_path, cache, loads):
+    session = tmp_path / "session"
+    session.mkdir()
+    path = make_model_dir(session, "autogluon", 10)
+    cache.get(path)
+    assert cache.invalidate(str(session)) == 1
+    cache.get(path)
+    assert len(loads) == 2
+
+
+def test_reload_when_model_rewritten(tmp_path, cache, loads):
+    path = make_model_dir(tmp_path, "a", 10)
+    cache.get(path)
+    pkl = os.path.join(path, "predictor.pkl")
+    stat = os.stat(pkl)
+    os.utime(pkl, (stat.st_atime, stat.st_mtime + 10))
+    cache.get(path)
+    assert len(loads) == 2
@@ -0,0 +1,56 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import json
+import shutil
+
+import pandas as pd
+from sessions import utils
+from training import result_cache
+from training.result_cache import data_fingerprint, params_fingerprint
+
+
+def test_fingerprint_ignores_layout_but_not_values(tmp_path):
+    df = pd.DataFrame({"a": range(1000), "b": ["x", "y"] * 500})
+    one, two, three = (str(tmp_path / f"{name}.parquet") for name in ("one", "two", "three"))
+    df.to_parquet(one, index=False)
+    df[["b", "a"]].to_parquet(two, index=False, row_group_size=100)
+    changed = df.copy()
+    changed.loc[500, "a"] = -1
+    changed.to_parquet(three, index=False)
+    assert data_fingerprint(one) == data_fingerprint(two)
+    assert data_fingerprint(one) != data_fingerprint(three)
+
+    params = {"target_column": "a", "presets": "medium_quality"}
+    assert params_fingerprint(params) == params_fingerprint({**params, "upload_table_name": "out", "use_training_cache": False})
+    assert params_fingerprint(params) != params_fingerprint({**params, "presets": "best_quality"})
+
+
+def test_restored_session_survives_source_cleanup(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "SESSIONS_BASE_PATH", str(tmp_path))
+    monkeypatch.setattr(result_cache.TrainingResultCache, "_artifact_names", staticmethod(lambda: ["autogluon", "leaderboard.csv"]))
+    source, restored = tmp_path / "source", tmp_path / "restored"
+    (source / "autogluon" / "models").mkdir(parents=True)
+    restored.mkdir()
+    (source / "autogluon" / "models" / "model.pkl").write_bytes(b"model")
+    (source / "autogluon" / "model_metadata.json").write_text(json.dumps({"serving_artifact": {"path": str(source / "autogluon")}}))
+    (source / "leaderboard.csv").write_text("model,score_val\nGBM,0.9\n")
+    utils.save_session_metadata("source", {"status": "completed", "serving_model_path": str(source / "autogluon")})
+    utils.save_session_metadata("restored", {"status": "training", "training_parameters": {"target_column": "y"}})
+
+    cache = result_cache.TrainingResultCache(str(tmp_path / "cache.sqlite3"))
+    cache.restore("source", "restored")
+
+    model_metadata = json.loads((restored / "autogluon" / "model_metadata.json").read_text())
+    assert model_metadata["serving_artifact"]["path"] == str(restored / "autogluon")
+    metadata = utils.load_session_metadata("restored")
+    assert metadata["serving_model_path"] == str(restored / "autogluon")
+    assert metadata["status"] == "completed" and metadata["training_parameters"] == {"target_column": "y"}
+
+    # Перезапись метаданных в исходной сессии не видна в восстановленной, удаление исходной её не ломает
+    (source / "autogluon" / "model_metadata.json").write_text("{}")
+    (source / "leaderboard.csv").write_text("")
+    assert json.loads((restored / "autogluon" / "model_metadata.json").read_text()) == model_metadata
+    shutil.rmtree(source)
+    assert (restored / "autogluon" / "models" / "model.pkl").read_bytes() == b"model"
+    assert (restored / "leaderboard.csv").read_text().startswith("model,score_val")
@@ -0,0 +1,22 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+from AutoML.automl import retrain_hyperparameters
+
+
+def test_retrain_hyperparameters_prefers_ensemble_members():
+    model_configs = [
+        {"model": "CatBoost_BAG_L1", "ag_key": "CAT", "hyperparameters": {}},
+        {"model": "LightGBMXT_BAG_L1", "ag_key": "GBM", "hyperparameters": {"extra_trees": True}},
+        {"model": "LightGBM_BAG_L1", "ag_key": "GBM", "hyperparameters": {}},
+        {"model": "LightGBM_2_BAG_L1", "ag_key": "GBM", "hyperparameters": {}},
+        {"model": "KNeighborsUnif_BAG_L1", "ag_key": "KNN", "hyperparameters": {"weights": "uniform"}},
+    ]
+    weights = {"LightGBM_BAG_L1": 0.6, "KNeighborsUnif_BAG_L1": 0.4}
+    # Сначала модели ансамбля по весу, затем лучшие по лидерборду; повтор конфигурации LightGBM пропускается
+    assert retrain_hyperparameters(model_configs, weights, 3) == {
+        "GBM": [{}],
+        "KNN": [{"weights": "uniform"}],
+        "CAT": [{}],
+    }
+    assert retrain_hyperparameters(model_configs, None, 2) == {"CAT": [{}], "GBM": [{"extra_trees": True}]}
@@ -0,0 +1,91 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import asyncio
+import pytest
+from prediction.batcher import ScoreBatcher
+
+
+def make_score_fn(calls):
+    def score_fn(session_id, records):
+        calls.append((session_id, len(records)))
+        return {
+            "predictions": [rec["x"] * 10 for rec in records],
+            "probabilities": [{"1": rec["x"] / 10} for rec in records],
+        }
+    return score_fn
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_coalesced():
+    calls = []
+    batcher = ScoreBatcher(make_score_fn(calls), window_ms=50, max_batch_rows=100)
+    results = await asyncio.gather(
+        batcher.submit("s1", [{"x": 1}, {"x": 2}]),
+        batcher.submit("s1", [{"x": 3}]),
+        batcher.submit("s1", [{"x": 4}, {"x": 5}, {"x": 6}]),
+    )
+    assert calls == [("s1", 6)]
+    assert results[0]["predictions"] == [10, 20]
+    assert results[1]["predictions"] == [30]
+    assert results[2]["predictions"] == [40, 50, 60]
+    assert results[2]["probabilities"] == [{"1": 0.4}, {"1": 0.5}, {"1": 0.6}]
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_batched_separately_and_respect_max_rows():
+    calls = []
+    batcher = ScoreBatcher(make_score_fn(calls), window_ms=50, max_batch_rows=3)
+    await asyncio.gather(
+        batcher.submit("s1", [{"x": 1}, {"x": 2}]),
+        batcher.submit("s1", [{"x": 3}, {"x": 4}]),
+        batcher.submit("s2", [{"x": 5}]),
+    )
+    assert sorted(calls) == [("s1", 2), ("s1", 2), ("s2", 1)]
+
+
+@pytest.mark.asyncio
+async def test_failing_request_does_not_fail_its_neighbours():
+    calls = []
+    score_fn = make_score_fn(calls)
+
+    def failing_on_negative(session_id, records):
+        if any(rec["x"] < 0 for rec in records):
+            raise ValueError("boom")
+        return score_fn(session_id, records)
+    batcher = ScoreBatcher(failing_on_negative, window_ms=20, max_batch_rows=100)
+    results = await asyncio.gather(
+        batcher.submit("s1", [{"x": 1}]),
+        batcher.submit("s1", [{"x": -1}]),
+        batcher.submit("s1", [{"x": 2}]),
+        return_exceptions=True,
+    )
+    assert results[0]["predictions"] == [10]
+    assert isinstance(results[1], ValueError)
+    assert results[2]["predictions"] == [20]
+    assert batcher.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_requests_with_different_columns_are_not_merged():
+    calls = []
+    batcher = ScoreBatcher(make_score_fn(calls), window_ms=20, max_batch_rows=100)
+    await asyncio.gather(
+        batcher.submit("s1", [{"x": 1}]),
+        batcher.submit("s1", [{"x": 2, "y": 0}]),
+        batcher.submit("s1", [{"x": 3}]),
+    )
+    assert sorted(calls) == [("s1", 1), ("s1", 2)]
+
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_all_callers():
+    def failing(session_id, records):
+        raise ValueError("boom")
+    batcher = ScoreBatcher(failing, window_ms=20, max_batch_rows=100)
+    results = await asyncio.gather(
+        batcher.submit("s1", [{"x": 1}]),
+        batcher.submit("s1", [{"x": 2}]),
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, ValueError) for r in results)
@@ -0,0 +1,62 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import asyncio
+import json
+import logging
+
+from training.events import AutoGluonLogHandler, stream_training_events, training_event_bus, emit_event
+
+
+def _parse_sse(chunks):
+    return [json.loads(chunk.split("data: ", 1)[1]) for chunk in chunks]
+
+
+def test_autogluon_log_lines_become_model_events():
+    logger = logging.getLogger("autogluon.test_events")
+    logger.setLevel(logging.INFO)
+    handler = AutoGluonLogHandler("events-s1", time_limit=60)
+    logger.addHandler(handler)
+    try:
+        logger.info("Fitting model: LightGBM ... Training model for up to 59.8s of the 59.8s of remaining time.")
+        logger.info("\t0.8731\t = Validation score   (accuracy)")
+        logger.info("\t0.45s\t = Training   runtime")
+        logger.info("Fitting model: NeuralNetTorch ...")
+        logger.info("\tWarning: Exception caused NeuralNetTorch to fail during training... Skipping this model.")
+    finally:
+        logger.removeHandler(handler)
+
+    _, history = asyncio.run(_subscribe("events-s1"))
+    events = [(e["type"], e.get("model")) for e in history]
+    assert events == [
+        ("model_started", "LightGBM"),
+        ("model_finished", "LightGBM"),
+        ("model_started", "NeuralNetTorch"),
+        ("model_failed", "NeuralNetTorch"),
+    ]
+    finished = history[1]
+    assert finished["score_val"] == 0.8731 and finished["fit_time"] == 0.45
+    assert finished["time_limit"] == 60 and finished["models_finished"] == 1
+
+
+async def _subscribe(session_id):
+    queue, history = training_event_bus.subscribe(session_id)
+    training_event_bus.unsubscribe(session_id, queue)
+    return queue, history
+
+
+def test_stream_replays_history_then_follows_until_terminal_event():
+    async def consume():
+        emit_event("events-s2", "job_started", kind="train")
+        snapshot = lambda: {"status": "running", "queue_position": 0}
+        stream = stream_training_events("events-s2", snapshot, lambda: 0)
+        chunks = [await stream.__anext__(), await stream.__anext__()]
+        # Новые события приходят из другого потока (исполнитель обучений)
+        await asyncio.to_thread(emit_event, "events-s2", "training_completed")
+        await asyncio.to_thread(emit_event, "events-s2", "feature_importance_completed")
+        chunks += [chunk async for chunk in stream]
+        return chunks
+
+    events = _parse_sse(asyncio.run(consume()))
+    assert [e["type"] for e in events] == ["snapshot", "job_started", "training_completed", "feature_importance_completed"]
+    assert events[0]["queue_position"] == 0
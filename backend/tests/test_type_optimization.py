@@ -0,0 +1,76 @@
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import asyncio
+import numpy as np
+import pandas as pd
+from src.data.type_optimization import optimize_dtypes, apply_dtype_schema
+
+
+def test_optimize_dtypes_and_apply_schema():
+    df = pd.DataFrame({
+        "id": np.arange(10, dtype=np.int64),
+        "price": [1.5, 2.25, None, 4.0, 5.0, 6.5, 7.0, 8.0, 9.0, 10.0],
+        "noisy": [0.1] * 10,
+        "city": ["a", "b"] * 5,
+        "dt": ["01.02.2024"] * 10,
+        "target": np.arange(10, dtype=np.int64),
+    })
+    df, schema = optimize_dtypes(df, exclude=["target"])
+    assert df["id"].dtype == np.int8
+    assert df["price"].dtype == np.float32
+    # 0.1 не представимо в float32 без потерь
+    assert df["noisy"].dtype == np.float64
+    assert str(df["city"].dtype) == "category"
+    assert pd.api.types.is_datetime64_any_dtype(df["dt"])
+    assert schema["dt"]["format"] == "%d.%m.%Y"
+    assert df["target"].dtype == np.int64
+    assert "target" not in schema
+
+    new = pd.DataFrame({"id": [1], "price": [2.0], "noisy": [0.1], "city": ["a"], "dt": ["05.03.2024"]})
+    new = apply_dtype_schema(new, schema)
+    assert new["dt"].iloc[0] == pd.Timestamp(2024, 3, 5)
+    assert str(new["city"].dtype) == "category"
+    assert new["price"].dtype == np.float32
+
+
+def test_prediction_output_keeps_input_dtypes_and_fits_existing_table(monkeypatch):
+    from db import db_manager
+    from src.data.type_optimization import restore_input_columns
+
+    train = pd.DataFrame({"city": ["a", "b"] * 5, "price": [1.5] * 10})
+    _, schema = optimize_dtypes(train)
+    original = pd.DataFrame({"city": ["a", "b"], "price": [1.1, 123456789.0]})
+    features = apply_dtype_schema(original.copy(), schema)
+    assert features["price"].dtype == np.float32
+    # Модель возвращает признаки в суженных типах и колонку прогноза
+    preds = features.join(pd.Series([0.5, 0.7], name="target"))
+    preds = restore_input_columns(preds, original)
+    assert preds["city"].dtype == object
+    assert preds["price"].tolist() == [1.1, 123456789.0]
+
+    async def table_columns(*args, **kwargs):
+        return [("city", "text"), ("price", "double precision"), ("target", "double precision")]
+    monkeypatch.setattr(db_manager, "get_table_columns", table_columns)
+    # Прогноз сохраняется в существующую таблицу (/save-prediction-to-db)
+    assert asyncio.run(db_manager.check_df_matches_table_schema(preds, "public", "preds", "u", "p"))
+    assert asyncio.run(db_manager.check_df_matches_table_schema(features.join(preds["target"]), "public", "preds", "u", "p"))
+
+
+def test_file_and_db_data_share_date_detection():
+    from db.db_manager import detect_date_formats
+
+    df = pd.DataFrame({
+        "iso": ["2024-01-01", None, "2024-02-01"] * 5,
+        "mixed": ["2024-01-01", "2024-01-02 10:00", "2024/01/03 11:30:15"] * 5,
+        "code": ["12-34-5678", "x", "y"] * 5,
+    })
+    optimized, schema = optimize_dtypes(df.copy())
+    decisions = detect_date_formats(df)
+    for col in ["iso", "mixed"]:
+        assert schema[col]["kind"] == "datetime"
+        assert schema[col]["format"] == decisions[col]
+    assert decisions["mixed"] == "mixed"
+    assert decisions["code"] is None and schema["code"]["kind"] != "datetime"
+    new = apply_dtype_schema(pd.DataFrame({"iso": ["2024-03-05"], "mixed": ["2024-03-05 01:02"], "code": ["x"]}), schema)
+    assert new["mixed"].iloc[0] == pd.Timestamp(2024, 3, 5, 1, 2)